@@ -0,0 +1,82 @@
+"""
+Línea de tiempo del arranque en frío de PetoTech.
+
+Debe ser el primer import de pantallainicialtel: el reloj empieza a contar
+al importar este módulo. No importa Kivy para no sesgar la medición.
+"""
+import importlib
+import sys
+import threading
+import time
+
+PRESUPUESTO_ARRANQUE = 1.5  # s hasta el primer frame en las tablets de jueces
+
+_T0 = time.perf_counter()
+_marcas = []
+_importaciones = {}  # módulo -> (segundos, hilo) de la primera carga
+
+
+def marcar(etapa):
+    """Registra el instante (s desde el arranque) en que termina una etapa."""
+    _marcas.append((etapa, time.perf_counter() - _T0))
+
+
+def linea_de_tiempo():
+    return list(_marcas)
+
+
+def transcurrido():
+    return time.perf_counter() - _T0
+
+
+def reporte():
+    """Líneas legibles con el tiempo acumulado y la duración de cada etapa."""
+    lineas = []
+    anterior = 0.0
+    for etapa, t in _marcas:
+        lineas.append(f"{etapa:<28} {t * 1000:8.1f} ms  (+{(t - anterior) * 1000:.1f} ms)")
+        anterior = t
+    return lineas
+
+
+def importar(nombre):
+    """
+    import_module cronometrado: registra cuánto costó la primera carga del
+    módulo (incluidas sus dependencias aún no cargadas).
+    """
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    t0 = time.perf_counter()
+    modulo = importlib.import_module(nombre)
+    _importaciones.setdefault(
+        nombre, (time.perf_counter() - t0, threading.current_thread().name))
+    return modulo
+
+
+def precargar(nombres):
+    """
+    Importa los módulos en un hilo de fondo mientras la UI ya está visible.
+    Los que no existen en la plataforma (p. ej. jnius fuera de Android) se
+    ignoran.
+    """
+    def _cargar():
+        for nombre in nombres:
+            try:
+                importar(nombre)
+            except ImportError:
+                _importaciones.setdefault(nombre, (None, 'no disponible'))
+
+    hilo = threading.Thread(target=_cargar, name='precarga')
+    hilo.daemon = True
+    hilo.start()
+    return hilo
+
+
+def reporte_importaciones():
+    """Costo de cada módulo cargado con importar()/precargar(), del más caro al más barato."""
+    lineas = []
+    for nombre, (t, hilo) in sorted(
+            _importaciones.items(), key=lambda kv: -(kv[1][0] or 0)):
+        costo = 'no disponible' if t is None else f"{t * 1000:8.1f} ms"
+        lineas.append(f"{nombre:<28} {costo}  [{hilo}]")
+    return lineas
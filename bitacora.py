@@ -0,0 +1,223 @@
+"""
+Bitácora durable de eventos de puntuación, en la carpeta de datos del
+usuario (datos_usuario: PETOTECH_DATOS, App.user_data_dir o ~/.petotech).
+
+Cada PUNTUAR/INCIDENCIA secuenciado se guarda antes de enviarse y se marca
+como confirmado al llegar su ACK. Si la app se cierra o Android la mata a
+mitad de un round, los eventos pendientes se recuperan y se reenvían en la
+siguiente conexión del mismo juez al mismo combate.
+
+Las escrituras corren en un hilo propio con commit agrupado: cada
+transacción incluye todo lo que se acumuló en la cola mientras se
+escribía la anterior, así el tap rápido no paga un fsync por evento.
+"""
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import closing
+
+import datos_usuario
+
+ARCHIVO = 'bitacora.db'
+LOTE_MAX = 256  # operaciones por transacción
+ESPERA_CIERRE = 5.0  # s que cerrar() espera al hilo escritor
+_FIN = None  # centinela de la cola: el escritor termina
+_CARGAR = object()  # marca de una lectura encolada (ver cargar())
+
+log = logging.getLogger('petotech.bitacora')
+
+PENDIENTE = 'pendiente'
+CONFIRMADO = 'confirmado'
+DESCARTADO = 'descartado'
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS eventos_juez (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    combate TEXT NOT NULL,
+    juez INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    mensaje TEXT NOT NULL,
+    ts REAL NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    UNIQUE (combate, juez, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_eventos_juez_estado
+    ON eventos_juez (combate, juez, estado);
+"""
+
+
+def ruta_predeterminada():
+    """Carpeta de datos del usuario, nunca la del repositorio."""
+    return datos_usuario.ruta(ARCHIVO)
+
+
+class Bitacora:
+    def __init__(self, ruta=None):
+        self.ruta = ruta or ruta_predeterminada()
+        self._cola = queue.Queue()
+        self._lista = threading.Event()
+        self._cerrada = False
+        # (combate, juez) con filas en disco: sin fila no hace falta consultar
+        self._claves = set()
+        self._hilo = threading.Thread(target=self._bucle_escritura, name='bitacora')
+        self._hilo.daemon = True
+        self._hilo.start()
+
+    # ── API (cualquier hilo, no bloquea) ─────
+    def registrar(self, combate, juez, seq, mensaje, ts):
+        self._claves.add((str(combate), juez))
+        self._cola.put((
+            "INSERT OR IGNORE INTO eventos_juez (combate, juez, seq, mensaje, ts, estado) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (str(combate), juez, seq, mensaje, ts, PENDIENTE),
+        ))
+
+    def confirmar(self, combate, juez, seq):
+        """ACK acumulativo: confirma todo lo pendiente con secuencia <= seq."""
+        self._cola.put((
+            "UPDATE eventos_juez SET estado = ? "
+            "WHERE combate = ? AND juez = ? AND seq <= ? AND estado = ?",
+            (CONFIRMADO, str(combate), juez, seq, PENDIENTE),
+        ))
+
+    def descartar(self, combate, juez):
+        """El juez finalizó: sus pendientes ya no deben reenviarse."""
+        self._cola.put((
+            "UPDATE eventos_juez SET estado = ? "
+            "WHERE combate = ? AND juez = ? AND estado = ?",
+            (DESCARTADO, str(combate), juez, PENDIENTE),
+        ))
+
+    def cargar(self, combate, juez, al_terminar):
+        """
+        Lee en el hilo escritor los pendientes [(seq, mensaje)] y el último
+        seq del puesto y llama al_terminar(filas, ultimo_seq) desde ese hilo:
+        quien pide (el hilo de la UI) nunca espera al disco.
+        """
+        combate = str(combate)
+        if self._cerrada or (self._lista.is_set() and (combate, juez) not in self._claves):
+            al_terminar([], 0)
+            return
+        self._cola.put((_CARGAR, (combate, juez, al_terminar)))
+
+    def vaciar(self):
+        """Espera a que todo lo encolado esté escrito en disco."""
+        if not self._cerrada:
+            self._cola.join()
+
+    def cerrar(self, espera=ESPERA_CIERRE):
+        """
+        Escribe lo encolado, cierra el archivo y termina el hilo escritor;
+        al volver ya no se crea ni se toca nada en disco (se puede borrar la
+        carpeta). Lo que se registre después se ignora.
+        """
+        if self._cerrada:
+            return
+        self._cerrada = True
+        self._cola.put(_FIN)
+        self._hilo.join(espera)
+
+    # ── lectura ──────────────────────────────
+    def pendientes(self, combate, juez):
+        """Lista [(seq, mensaje)] sin ACK, en orden de secuencia."""
+        if not self._tiene_filas(combate, juez):
+            return []
+        return self._consultar(
+            "SELECT seq, mensaje FROM eventos_juez "
+            "WHERE combate = ? AND juez = ? AND estado = ? ORDER BY seq",
+            (str(combate), juez, PENDIENTE),
+        )
+
+    def ultimo_seq(self, combate, juez):
+        if not self._tiene_filas(combate, juez):
+            return 0
+        filas = self._consultar(
+            "SELECT MAX(seq) FROM eventos_juez WHERE combate = ? AND juez = ?",
+            (str(combate), juez),
+        )
+        return (filas[0][0] or 0) if filas else 0
+
+    def _tiene_filas(self, combate, juez):
+        # evita leer el disco al seleccionar juez en un combate nuevo
+        self._lista.wait(2)
+        return (str(combate), juez) in self._claves
+
+    def _consultar(self, sql, params):
+        # el esquema lo crea el hilo escritor al arrancar
+        if self._cerrada or not self._lista.wait(2):
+            return []
+        try:
+            with closing(self._conectar()) as con:
+                return con.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            log.error("error leyendo la bitácora: %s", e)
+            return []
+
+    # ── hilo escritor ────────────────────────
+    def _leer(self, con, combate, juez, al_terminar):
+        filas, ultimo = [], 0
+        if con is not None:
+            try:
+                filas = con.execute(
+                    "SELECT seq, mensaje FROM eventos_juez "
+                    "WHERE combate = ? AND juez = ? AND estado = ? ORDER BY seq",
+                    (combate, juez, PENDIENTE),
+                ).fetchall()
+                ultimo = con.execute(
+                    "SELECT MAX(seq) FROM eventos_juez WHERE combate = ? AND juez = ?",
+                    (combate, juez),
+                ).fetchone()[0] or 0
+            except sqlite3.Error as e:
+                log.error("error leyendo la bitácora: %s", e)
+        try:
+            al_terminar(filas, ultimo)
+        except Exception as e:
+            log.error("error entregando los pendientes de %s/%s: %s", combate, juez, e)
+
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=5)
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def _bucle_escritura(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            con = self._conectar()
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_ESQUEMA)
+            con.commit()
+            self._claves.update(con.execute("SELECT DISTINCT combate, juez FROM eventos_juez"))
+        except (sqlite3.Error, OSError) as e:
+            log.error("no se pudo abrir %s, bitácora desactivada: %s", self.ruta, e)
+            con = None
+        self._lista.set()
+        fin = False
+        while not fin:
+            lote = [self._cola.get()]
+            # commit agrupado: todo lo que llegó mientras se escribía
+            while len(lote) < LOTE_MAX and lote[-1] is not _FIN:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            fin = lote[-1] is _FIN
+            lecturas = [op[1] for op in lote if op is not _FIN and op[0] is _CARGAR]
+            try:
+                if con is not None:
+                    with con:
+                        for operacion in lote:
+                            if operacion is not _FIN and operacion[0] is not _CARGAR:
+                                con.execute(*operacion)
+            except sqlite3.Error as e:
+                # la bitácora nunca debe tumbar el envío de puntos
+                log.error("error escribiendo lote de %d: %s", len(lote), e)
+            finally:
+                # las lecturas ven lo escrito antes en la cola
+                for combate, juez, al_terminar in lecturas:
+                    self._leer(con, combate, juez, al_terminar)
+                for _ in lote:
+                    self._cola.task_done()
+        if con is not None:
+            con.close()
@@ -0,0 +1,220 @@
+"""
+Caja negra: grabación continua del tráfico del protocolo en petotech1.rec,
+en la carpeta de datos del usuario (datos_usuario).
+
+Un archivo de tamaño fijo mapeado en memoria (mmap) que funciona como
+anillo: cada registro ocupa una ranura de TAMANO_RANURA bytes con número
+de secuencia, instante de time.monotonic(), tipo y hasta CARGA_MAX bytes
+de carga. Grabar es un ``pack_into`` sobre el mapa, sin locks ni
+syscalls; si la app se cae, lo escrito ya está en la page cache y el
+kernel lo lleva a disco.
+
+Se graban los frames entrantes y salientes, los toques de la UI
+(técnicas, anular, incidencia, juez) y las transiciones de estado
+(login, conexión, pantalla, enlace). ``reproducir.py`` lee la grabación
+y la vuelve a ejecutar contra la sesión y las pantallas::
+
+    python caja_negra.py --benchmark
+"""
+import argparse
+import itertools
+import logging
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+import datos_usuario
+
+ARCHIVO = 'petotech1.rec'
+RUTA_GRABACION = None  # None: ARCHIVO en la carpeta de datos del usuario
+TAMANO_GRABACION = 4 * 1024 * 1024  # bytes; ~32k registros
+TAMANO_RANURA = 128
+VERSION = 1
+
+# tipos de registro
+ENTRADA = 1   # frame recibido del servidor
+SALIDA = 2    # frame entregado al motor para enviar
+TOQUE = 3     # acción del juez en la UI
+ESTADO = 4    # transición de estado de la sesión o de la UI
+BINARIO = 0x80  # la carga es un frame binario, no texto
+NOMBRES = {ENTRADA: 'entrada', SALIDA: 'salida', TOQUE: 'toque', ESTADO: 'estado'}
+
+_CABECERA = struct.Struct("!4sHHIdd")   # magia, versión, ranura, ranuras, time.time(), monotonic
+_TAMANO_CABECERA = 64
+_MAGIA = b"PTFR"
+_RANURA = struct.Struct("!QdBH%ds" % (TAMANO_RANURA - 19))  # seq, t, tipo, largo, carga
+CARGA_MAX = TAMANO_RANURA - 19
+_SEQ = struct.Struct("!Q%dx" % (TAMANO_RANURA - 8))  # sólo el seq de cada ranura
+_LARGO_MAX = 0xFFFF
+
+log = logging.getLogger('petotech.caja_negra')
+
+Registro = namedtuple('Registro', 'seq t tipo binario datos largo')
+Registro.truncado = property(lambda r: r.largo > len(r.datos))
+
+
+class CajaNegra:
+    """Anillo de registros sobre un archivo mapeado en memoria."""
+
+    def __init__(self, ruta=None, tamano=TAMANO_GRABACION):
+        self.ruta = ruta = ruta or ruta_grabacion()
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self.ranuras = max(1, (tamano - _TAMANO_CABECERA) // TAMANO_RANURA)
+        tamano = _TAMANO_CABECERA + self.ranuras * TAMANO_RANURA
+        self._fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(self._fd).st_size != tamano or not _cabecera_valida(self._fd, self.ranuras):
+                # archivo nuevo o de otro formato: se empieza de cero
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, tamano)
+            self._mapa = mmap.mmap(self._fd, tamano)
+        except Exception:
+            os.close(self._fd)
+            raise
+        ultimo = max(seq for seq, in _SEQ.iter_unpack(self._mapa[_TAMANO_CABECERA:]))
+        _CABECERA.pack_into(self._mapa, 0, _MAGIA, VERSION, TAMANO_RANURA, self.ranuras,
+                            time.time(), time.monotonic())
+        # la secuencia sigue a la de la ejecución anterior: el anillo queda ordenado
+        self._contador = itertools.count(ultimo + 1)
+        self._empaquetar = _RANURA.pack_into
+        self.grabar(ESTADO, "inicio")
+
+    def grabar(self, tipo, datos):
+        """Añade un registro; ``datos`` str (texto) o bytes (frame binario)."""
+        if datos.__class__ is str:
+            datos = datos.encode()
+        else:
+            tipo |= BINARIO
+        largo = len(datos)
+        if largo > _LARGO_MAX:
+            largo = _LARGO_MAX
+        n = next(self._contador)  # atómico con el GIL: cada hilo tiene su ranura
+        self._empaquetar(self._mapa, _TAMANO_CABECERA + (n % self.ranuras) * TAMANO_RANURA,
+                         n, time.monotonic(), tipo, largo, datos)
+
+    def registros(self):
+        return sorted(_registros(self._mapa, self.ranuras))
+
+    def cerrar(self):
+        self._mapa.flush()
+        self._mapa.close()
+        os.close(self._fd)
+
+
+def _cabecera_valida(fd, ranuras):
+    cabecera = os.pread(fd, _CABECERA.size, 0)
+    if len(cabecera) < _CABECERA.size:
+        return False
+    magia, version, ranura, n, _, _ = _CABECERA.unpack(cabecera)
+    return magia == _MAGIA and version == VERSION and ranura == TAMANO_RANURA and n == ranuras
+
+
+def _registros(mapa, ranuras):
+    for i in range(ranuras):
+        seq, t, tipo, largo, carga = _RANURA.unpack_from(mapa, _TAMANO_CABECERA + i * TAMANO_RANURA)
+        if seq == 0 or (tipo & ~BINARIO) not in NOMBRES:
+            continue  # ranura vacía o a medio escribir
+        yield Registro(seq, t, tipo & ~BINARIO, bool(tipo & BINARIO),
+                       carga[:min(largo, CARGA_MAX)], largo)
+
+
+def ruta_grabacion():
+    return RUTA_GRABACION or datos_usuario.ruta(ARCHIVO)
+
+
+def leer(ruta=None):
+    """Registros de una grabación ordenados por secuencia (la de la app sin ruta)."""
+    ruta = ruta or ruta_grabacion()
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+    if len(datos) < _CABECERA.size:
+        return []
+    magia, version, ranura, ranuras, _, _ = _CABECERA.unpack_from(datos)
+    if magia != _MAGIA or version != VERSION or ranura != TAMANO_RANURA:
+        raise ValueError(f"{ruta} no es una grabación de la caja negra")
+    return sorted(_registros(datos, ranuras))
+
+
+def sesiones(registros):
+    """Parte la grabación en ejecuciones de la app (cada una empieza con 'inicio')."""
+    partes = []
+    for r in registros:
+        if not partes or (r.tipo == ESTADO and r.datos == b"inicio"):
+            partes.append([])
+        partes[-1].append(r)
+    return partes
+
+
+def texto(registro):
+    if registro.binario:
+        return registro.datos.hex()
+    return registro.datos.decode('utf-8', 'replace')
+
+
+# ── grabadora global de la app ───────────────
+_caja = None
+_desactivada = False
+
+
+def abrir(ruta=None, tamano=TAMANO_GRABACION):
+    """Abre la grabadora global; si falla, la app sigue sin grabar."""
+    global _caja
+    if _caja is None and not _desactivada:
+        try:
+            _caja = CajaNegra(ruta, tamano)
+        except (OSError, ValueError) as e:
+            log.warning("Caja negra desactivada: %s", e)
+    return _caja
+
+
+def grabar(tipo, datos):
+    caja = _caja
+    if caja is not None:
+        caja.grabar(tipo, datos)
+
+
+def desactivar():
+    """La reproducción no debe pisar la grabación que está leyendo."""
+    global _caja, _desactivada
+    _desactivada = True
+    if _caja is not None:
+        _caja.cerrar()
+        _caja = None
+
+
+def benchmark(n=1000000, ruta=None):
+    import tempfile
+    with tempfile.TemporaryDirectory() as carpeta:
+        caja = CajaNegra(ruta or os.path.join(carpeta, 'bench.rec'))
+        trama = "PUNTUAR:2,AZUL,1234,1700000000000"
+        binaria = bytes(15)
+        grabar_ = caja.grabar
+        t0 = time.perf_counter()
+        for _ in range(n):
+            grabar_(SALIDA, trama)
+        texto_us = (time.perf_counter() - t0) / n * 1e6
+        t0 = time.perf_counter()
+        for _ in range(n):
+            grabar_(SALIDA, binaria)
+        binario_us = (time.perf_counter() - t0) / n * 1e6
+        caja.cerrar()
+    return {'registros': n, 'us_texto': texto_us, 'us_binario': binario_us}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caja negra de PetoTech")
+    parser.add_argument("--benchmark", action="store_true", help="mide el coste de grabar")
+    parser.add_argument("--registros", type=int, default=1000000)
+    args = parser.parse_args()
+    if args.benchmark:
+        r = benchmark(args.registros)
+        print(f"{r['registros']} registros: {r['us_texto']:.3f} µs/registro (texto), "
+              f"{r['us_binario']:.3f} µs/registro (binario)")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
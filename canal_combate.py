@@ -0,0 +1,150 @@
+"""
+Estado de un combate visto desde una conexión: puesto del juez, ocupación
+de los puestos y puntos validados.
+
+``SesionJuez`` tiene un solo canal, el de su combate; ``SesionMultiplex``
+(sesion_multiplex.py) tiene uno por combate suscrito sobre el mismo
+socket. La ocupación que llega de la red (ESTADO_JUECES, OCUPACION) se
+aplica en el hilo del socket sobre un frozenset nuevo y la UI la recibe
+por la bomba de la sesión: las lecturas no necesitan lock. No depende de
+Kivy.
+"""
+import logging
+
+import protocolo
+
+# aviso interno (no viaja por la red): cambió la ocupación que llegó del servidor
+CAMBIO_OCUPACION = "ocupacion"
+
+log = logging.getLogger('petotech.canal')
+
+
+class CanalCombate:
+    def __init__(self, combate_id=None, enviar=None, avisar=None):
+        self.combate_id = combate_id
+        self.juez_id = None
+        self.jueces_ocupados = frozenset()  # lo publicado a la UI
+        self.totales = None                 # (azul, rojo) validados, si se recibieron
+        self.version_totales = None
+        self.huecos_ocupacion = 0
+        # enviar(mensaje): por la conexión del canal; avisar(canal): a la bomba
+        self._enviar = enviar
+        self._avisar = avisar
+        # ocupación según el servidor: la escribe el hilo del socket
+        self._ocupacion_red = frozenset()
+        self._version_ocupacion = None  # None: sin instantánea versionada todavía
+        self._esperando_ocupacion = False  # instantánea pedida y aún sin llegar
+        self._observadores_ocupacion = []
+        self._observadores_totales = []
+        self._observadores = {}  # tipo de mensaje -> [callback(cuerpo)]
+
+    def __repr__(self):
+        return f"CanalCombate({self.combate_id!r}, juez={self.juez_id})"
+
+    def reiniciar_versiones(self, esperar_instantanea):
+        """Conexión o combate nuevo: la próxima instantánea vale sea cual sea su versión."""
+        self._version_ocupacion = None
+        self._esperando_ocupacion = esperar_instantanea
+        self.version_totales = None
+
+    # ── ocupación según el servidor (hilo del socket) ──
+    def recibir_estado_jueces(self, estado):
+        # servidor sin deltas, o el estado inicial antes de negociar capacidades
+        self._fijar_ocupacion(protocolo.parsear_estado_jueces(estado), None)
+
+    def recibir_ocupacion(self, cuerpo):
+        """
+        Aplica un delta sólo si es la versión siguiente a la que hay; ante un
+        hueco pide la instantánea y descarta deltas hasta que llegue.
+        """
+        ocupacion = protocolo.parsear_ocupacion(cuerpo)
+        if ocupacion is None:
+            log.warning("OCUPACION inválida en %s: %s", self.combate_id, cuerpo)
+            return
+        version, cambio = ocupacion
+        actual = self._version_ocupacion
+        if isinstance(cambio, frozenset):
+            if actual is None or version >= actual:
+                self._esperando_ocupacion = False
+                self._fijar_ocupacion(cambio, version)
+            return
+        if actual is not None and version <= actual:
+            return  # ya incluido
+        if actual is None or version > actual + 1:
+            self._pedir_ocupacion(actual, version)
+            return
+        if cambio > 0:
+            ocupados = self._ocupacion_red | {cambio}
+        else:
+            ocupados = self._ocupacion_red - {-cambio}
+        self._fijar_ocupacion(ocupados, version)
+
+    def _pedir_ocupacion(self, actual, version):
+        if self._esperando_ocupacion:
+            return
+        self.huecos_ocupacion += 1
+        log.info("Hueco en la ocupación de %s (versión %s, llegó %s): se pide la instantánea",
+                 self.combate_id, actual, version)
+        self._esperando_ocupacion = True
+        self._enviar(protocolo.PEDIR_OCUPACION)
+
+    def _fijar_ocupacion(self, ocupados, version):
+        self._ocupacion_red = ocupados
+        self._version_ocupacion = version
+        # un aviso coalescible: muchos cambios en un frame son una sola publicación
+        self._avisar(self)
+
+    # ── hilo de la UI ─────────────────────────
+    def despachar(self, tipo, cuerpo):
+        """Mensaje del combate ya en el hilo de la UI (conexión multiplexada)."""
+        if tipo == CAMBIO_OCUPACION:
+            self.publicar_ocupacion()
+            return
+        if tipo == protocolo.TOTALES:
+            self.aplicar_totales(cuerpo)
+        for callback in list(self._observadores.get(tipo, ())):
+            callback(cuerpo)
+
+    def observar(self, tipo, callback):
+        """callback(cuerpo) en el hilo de la UI por cada mensaje ``tipo`` de este combate."""
+        self._observadores.setdefault(tipo, []).append(callback)
+
+    def observar_ocupacion(self, callback):
+        """callback(ocupados) se llama en el hilo de la UI sólo cuando cambia."""
+        self._observadores_ocupacion.append(callback)
+
+    def publicar_ocupacion(self):
+        self._publicar_ocupacion(self._ocupacion_red)
+
+    def _publicar_ocupacion(self, ocupados):
+        if ocupados == self.jueces_ocupados:
+            return
+        self.jueces_ocupados = ocupados
+        for callback in list(self._observadores_ocupacion):
+            callback(ocupados)
+
+    def ocupar_juez(self, numero):
+        self._publicar_ocupacion(self.jueces_ocupados | {numero})
+
+    def liberar_juez(self, numero):
+        if numero in self.jueces_ocupados:
+            self._publicar_ocupacion(self.jueces_ocupados - {numero})
+
+    def observar_totales(self, callback):
+        """callback(azul, rojo) en el hilo de la UI cuando cambian los puntos validados."""
+        self._observadores_totales.append(callback)
+
+    def aplicar_totales(self, cuerpo):
+        totales = protocolo.parsear_totales(cuerpo)
+        if totales is None:
+            log.warning("TOTALES inválidos en %s: %s", self.combate_id, cuerpo)
+            return
+        version, azul, rojo = totales
+        if self.version_totales is not None and version <= self.version_totales:
+            return
+        self.version_totales = version
+        if (azul, rojo) == self.totales:
+            return
+        self.totales = (azul, rojo)
+        for callback in list(self._observadores_totales):
+            callback(azul, rojo)
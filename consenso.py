@@ -0,0 +1,273 @@
+"""
+Consenso de jueces: decide cuándo una técnica cuenta.
+
+Un punto es válido cuando ``MAYORIA`` jueces distintos marcan el mismo
+(color, puntos) con menos de ``VENTANA_MS`` entre sí. El tercer juez que
+llega tarde se suma al punto ya validado en vez de dejar un voto suelto.
+``PUNTUAR:-1,{color}`` (anular) retira el último voto de ese juez en ese
+color: si el punto se queda sin mayoría se revoca y los votos restantes
+vuelven a quedar pendientes.
+
+Por combate, cada (color, puntos) tiene dos listas ordenadas por tiempo
+(votos pendientes y puntos validados recientes) que se consultan con
+bisect y se podan por ventana, así que cada evento cuesta O(log n) más
+los pocos vecinos dentro de la ventana. No depende de Kivy ni de la red:
+lo usan el servidor local y el benchmark::
+
+    python consenso.py --eventos 200000
+"""
+import argparse
+import bisect
+import itertools
+import random
+import time
+
+import protocolo
+
+VENTANA_MS = 1000        # ms máximos entre votos de una misma técnica
+MAYORIA = 2              # jueces que tienen que coincidir
+TOLERANCIA_MS = 2000     # desorden de llegada admitido antes de podar
+
+VALIDADO = 'validado'
+ANULADO = 'anulado'
+
+_INF = float('inf')
+
+
+class Voto:
+    __slots__ = ('id', 't_ms', 'juez', 'color', 'puntos', 'punto', 'anulado')
+
+    def __init__(self, vid, t_ms, juez, color, puntos):
+        self.id = vid
+        self.t_ms = t_ms
+        self.juez = juez
+        self.color = color
+        self.puntos = puntos
+        self.punto = None   # Punto al que contribuye, si ya se validó
+        self.anulado = False
+
+    def entrada(self):
+        """Clave de la lista de pendientes: ordena por tiempo."""
+        return (self.t_ms, self.juez, self.id, self)
+
+
+class Punto:
+    __slots__ = ('id', 'color', 'puntos', 't_ms', 'votos', 'vigente')
+
+    def __init__(self, pid, color, puntos, votos):
+        self.id = pid
+        self.color = color
+        self.puntos = puntos
+        self.votos = votos  # juez -> Voto
+        self.t_ms = min(v.t_ms for v in votos.values())
+        self.vigente = True
+
+    @property
+    def jueces(self):
+        return frozenset(self.votos)
+
+    def __repr__(self):
+        estado = "" if self.vigente else " anulado"
+        return f"<Punto {self.id} {self.color} +{self.puntos} jueces={sorted(self.votos)}{estado}>"
+
+
+class ConsensoCombate:
+    """Índice de ventana deslizante de un combate."""
+
+    def __init__(self, ventana_ms=VENTANA_MS, mayoria=MAYORIA):
+        self.ventana_ms = ventana_ms
+        self.mayoria = mayoria
+        self.reiniciar()
+
+    def reiniciar(self):
+        """RESET: marcador a cero y sin votos pendientes."""
+        self.totales = dict.fromkeys(protocolo.COLORES, 0)
+        self.puntos = []  # validados, en orden de validación
+        self._pendientes = {}  # (color, puntos) -> [(t, juez, id, Voto)]
+        self._validados = {}   # (color, puntos) -> [(t, id, Punto)]
+        self._historial = {}   # (juez, color) -> [Voto]
+        self._t_max = -_INF
+        self._ids = itertools.count(1)
+
+    def registrar(self, juez, color, puntos, t_ms):
+        """
+        Incorpora un voto y devuelve los cambios como ``[(VALIDADO|ANULADO, Punto)]``.
+        ``puntos`` None o -1 es anular.
+        """
+        color = color.upper()
+        if puntos is None or puntos == -1:
+            return self.anular(juez, color)
+        if t_ms > self._t_max:
+            self._t_max = t_ms
+        clave = (color, puntos)
+        self._podar(clave)
+        voto = Voto(next(self._ids), t_ms, juez, color, puntos)
+        pila = self._historial.setdefault((juez, color), [])
+        pila.append(voto)
+        if len(pila) > protocolo.HISTORIAL_MAX:
+            del pila[0]
+
+        desde, hasta = t_ms - self.ventana_ms, t_ms + self.ventana_ms
+
+        # 1. el tercer juez que llega tarde se suma al punto ya validado
+        validados = self._validados.get(clave)
+        if validados:
+            i = bisect.bisect_left(validados, (desde,))
+            j = bisect.bisect_right(validados, (hasta, _INF))
+            for _, _, punto in validados[i:j]:
+                if punto.vigente and juez not in punto.votos:
+                    punto.votos[juez] = voto
+                    voto.punto = punto
+                    return []
+
+        # 2. votos pendientes de otros jueces dentro de la ventana
+        pendientes = self._pendientes.setdefault(clave, [])
+        i = bisect.bisect_left(pendientes, (desde,))
+        j = bisect.bisect_right(pendientes, (hasta, _INF))
+        votos = {juez: voto}
+        for entrada in pendientes[i:j]:
+            if entrada[1] not in votos:
+                votos[entrada[1]] = entrada[3]
+        if len(votos) < self.mayoria:
+            bisect.insort(pendientes, voto.entrada())
+            return []
+        for otro in votos.values():
+            if otro is not voto:
+                self._quitar_pendiente(otro)
+        return [(VALIDADO, self._validar(clave, votos))]
+
+    def anular(self, juez, color):
+        """Retira el último voto vigente del juez en ese color."""
+        pila = self._historial.get((juez, color.upper()))
+        while pila:
+            voto = pila.pop()
+            if voto.anulado:
+                continue
+            voto.anulado = True
+            punto = voto.punto
+            if punto is None:
+                self._quitar_pendiente(voto)
+                return []
+            del punto.votos[juez]
+            voto.punto = None
+            if not punto.vigente or len(punto.votos) >= self.mayoria:
+                return []
+            self._revocar(punto)
+            return [(ANULADO, punto)]
+        return []
+
+    # ── interno ──────────────────────────────
+    def _validar(self, clave, votos):
+        punto = Punto(next(self._ids), clave[0], clave[1], votos)
+        for voto in votos.values():
+            voto.punto = punto
+        bisect.insort(self._validados.setdefault(clave, []), (punto.t_ms, punto.id, punto))
+        self.totales[punto.color] += punto.puntos
+        self.puntos.append(punto)
+        return punto
+
+    def _revocar(self, punto):
+        punto.vigente = False
+        self.totales[punto.color] -= punto.puntos
+        clave = (punto.color, punto.puntos)
+        validados = self._validados.get(clave, [])
+        i = bisect.bisect_left(validados, (punto.t_ms, punto.id))
+        if i < len(validados) and validados[i][2] is punto:
+            del validados[i]
+        # los votos que quedan pueden volver a formar mayoría con otro juez
+        pendientes = self._pendientes.setdefault(clave, [])
+        for voto in punto.votos.values():
+            voto.punto = None
+            bisect.insort(pendientes, voto.entrada())
+
+    def _quitar_pendiente(self, voto):
+        pendientes = self._pendientes.get((voto.color, voto.puntos))
+        if not pendientes:
+            return
+        i = bisect.bisect_left(pendientes, (voto.t_ms, voto.juez, voto.id))
+        if i < len(pendientes) and pendientes[i][3] is voto:
+            del pendientes[i]
+
+    def _podar(self, clave):
+        """Descarta lo que ya no puede entrar en ninguna ventana."""
+        limite = self._t_max - self.ventana_ms - TOLERANCIA_MS
+        for indice in (self._pendientes, self._validados):
+            lista = indice.get(clave)
+            if lista and lista[0][0] < limite:
+                del lista[:bisect.bisect_left(lista, (limite,))]
+
+
+class Consenso:
+    """Un ConsensoCombate por combate."""
+
+    def __init__(self, ventana_ms=VENTANA_MS, mayoria=MAYORIA):
+        self.ventana_ms = ventana_ms
+        self.mayoria = mayoria
+        self.combates = {}
+
+    def combate(self, combate_id):
+        indice = self.combates.get(combate_id)
+        if indice is None:
+            indice = self.combates[combate_id] = ConsensoCombate(self.ventana_ms, self.mayoria)
+        return indice
+
+    def registrar(self, combate_id, juez, color, puntos, t_ms):
+        return self.combate(combate_id).registrar(juez, color, puntos, t_ms)
+
+    def cerrar(self, combate_id):
+        self.combates.pop(combate_id, None)
+
+
+# ── benchmark ────────────────────────────────
+def _eventos_simulados(n, combates, semilla=1):
+    """Intercambios con 3 jueces: reacción gaussiana, omisiones y anulaciones."""
+    rnd = random.Random(semilla)
+    relojes = [0.0] * combates
+    eventos = []
+    while len(eventos) < n:
+        c = rnd.randrange(combates)
+        relojes[c] += rnd.expovariate(1 / 2000)
+        color = rnd.choice(protocolo.COLORES)
+        puntos = rnd.choice((1, 2, 3, 4, 5))
+        for juez in (1, 2, 3):
+            if rnd.random() < 0.85:
+                t = relojes[c] + max(0.0, rnd.gauss(250, 80))
+                eventos.append((c, juez, color, puntos, int(t)))
+                if rnd.random() < 0.05:
+                    eventos.append((c, juez, color, -1, int(t) + 300))
+    eventos = eventos[:n]
+    # orden de llegada: por tiempo, con algo de desorden por la red
+    eventos.sort(key=lambda e: e[4] + rnd.uniform(0, 30))
+    return eventos
+
+
+def benchmark(n=200000, combates=500):
+    eventos = _eventos_simulados(n, combates)
+    consenso = Consenso()
+    cambios = 0
+    t0 = time.perf_counter()
+    for c, juez, color, puntos, t in eventos:
+        cambios += len(consenso.registrar(c, juez, color, puntos, t))
+    segundos = time.perf_counter() - t0
+    return {
+        'eventos': len(eventos),
+        'combates': combates,
+        'segundos': segundos,
+        'eventos_s': len(eventos) / segundos,
+        'us_evento': segundos / len(eventos) * 1e6,
+        'cambios': cambios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor de consenso")
+    parser.add_argument("--eventos", type=int, default=200000)
+    parser.add_argument("--combates", type=int, default=500)
+    args = parser.parse_args()
+    r = benchmark(args.eventos, args.combates)
+    print(f"{r['eventos']} eventos en {r['combates']} combates: {r['segundos']:.3f}s, "
+          f"{r['eventos_s']:,.0f} eventos/s ({r['us_evento']:.2f} µs/evento), {r['cambios']} cambios")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import time
 from kivy.uix.screenmanager import Screen
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
@@ -7,14 +8,18 @@ from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 from kivy.graphics import (
     Color, RoundedRectangle, Rectangle, Triangle,
-    Line, Ellipse, SmoothLine
+    Line, Ellipse, SmoothLine, Fbo, ClearColor, ClearBuffers, Callback
+)
+from kivy.graphics.opengl import (
+    glBlendFuncSeparate, GL_ONE, GL_ONE_MINUS_SRC_ALPHA, GL_SRC_ALPHA,
 )
 from kivy.metrics import dp, sp
 from kivy.clock import Clock
-from websocket_manager import WebSocketManager
+import caja_negra
+from websocket_manager import EVENTO_DESCARTADO, WebSocketManager
 
 
-def _activar_wake_lock():
+def activar_wake_lock():
     """Mantiene la pantalla encendida en Android."""
     try:
         from android.permissions import request_permissions, Permission
@@ -29,7 +34,7 @@ def _activar_wake_lock():
         pass  
 
 
-def _desactivar_wake_lock():
+def desactivar_wake_lock():
     try:
         from jnius import autoclass
         PythonActivity = autoclass('org.kivy.android.PythonActivity')
@@ -54,6 +59,13 @@ C_BOTON       = (0.05, 0.18, 0.38, 1)   # botón genérico (mismo que finalizar)
 C_ALERTA      = (0.96, 0.76, 0.09, 1)   # amarillo alerta
 C_ALERTA_BRD  = (0.83, 0.63, 0.00, 1)
 C_BLANCO      = (1, 1, 1, 1)
+# badge de calidad del enlace
+C_ENLACE = {
+    'buena':        (0.35, 0.80, 0.45, 1),
+    'regular':      (0.96, 0.76, 0.09, 1),
+    'mala':         (0.95, 0.35, 0.30, 1),
+    'sin conexión': (0.55, 0.55, 0.55, 1),
+}
 
 class RoundedColorWidget(Widget):
     def __init__(self, color, radius=dp(14), **kwargs):
@@ -90,6 +102,13 @@ class RoundedButton(Button):
 
 
 class PanelHeader(Widget):
+    """
+    Nombre a la izquierda y puntaje a la derecha. Las subclases cambian el
+    widget del puntaje con crear_puntaje / mostrar_puntaje y su ancho con
+    ANCHO_PUNTAJE (fracción del panel).
+    """
+    ANCHO_PUNTAJE = 0.4
+
     def __init__(self, color, nombre, **kwargs):
         super().__init__(**kwargs)
         self.size_hint_y = None
@@ -110,7 +129,13 @@ class PanelHeader(Widget):
             halign='left',
             valign='middle',
         )
-        self._lbl_score = Label(
+        self.puntaje = self.crear_puntaje()
+        self.add_widget(self._lbl_nombre)
+        self.add_widget(self.puntaje)
+        self.bind(pos=self._upd, size=self._upd)
+
+    def crear_puntaje(self):
+        lbl = Label(
             text='0',
             font_size=sp(24),
             bold=True,
@@ -118,9 +143,11 @@ class PanelHeader(Widget):
             halign='right',
             valign='middle',
         )
-        self.add_widget(self._lbl_nombre)
-        self.add_widget(self._lbl_score)
-        self.bind(pos=self._upd, size=self._upd)
+        lbl.bind(size=lbl.setter('text_size'))
+        return lbl
+
+    def mostrar_puntaje(self, val):
+        self.puntaje.text = str(val)
 
     def _upd(self, *a):
         self._bg.pos  = self.pos
@@ -130,13 +157,59 @@ class PanelHeader(Widget):
         self._lbl_nombre.pos  = (self.x + pad, self.y)
         self._lbl_nombre.size = (self.width * 0.6, h)
         self._lbl_nombre.text_size = (self.width * 0.6, h)
-        self._lbl_score.pos  = (self.x + self.width * 0.6, self.y)
-        self._lbl_score.size = (self.width * 0.4 - pad, h)
-        self._lbl_score.text_size = (self.width * 0.4 - pad, h)
+        ancho = self.width * self.ANCHO_PUNTAJE
+        self.puntaje.pos  = (self.right - ancho, self.y)
+        self.puntaje.size = (ancho - pad, h)
 
     def set_score(self, val):
         self._score = val
-        self._lbl_score.text = str(val)
+        self.mostrar_puntaje(val)
+
+# ─────────────────────────────────────────────
+#  CACHÉ DE PICTOGRAMAS
+#  Cada figura se tesela una sola vez por (tipo, tamaño) en un Fbo; los
+#  botones de ambos paneles comparten la textura resultante.
+# ─────────────────────────────────────────────
+MAX_PICTOGRAMAS = 32
+_pictogramas = {}
+
+
+def mezcla_fbo(instr):
+    # el alfa se acumula como "over" premultiplicado (a + d·(1 - a)); con
+    # SRC_ALPHA también en el alfa el Fbo guardaría a² y el botón, al volver
+    # a mezclar con SRC_ALPHA, dibujaría el pictograma más tenue
+    glBlendFuncSeparate(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+
+
+def restablecer_mezcla(instr):
+    # con Callback(..., reset_context=True): Kivy vuelve a su mezcla por defecto
+    pass
+
+
+def _textura_pictograma(tipo, ancho, alto):
+    clave = (tipo, ancho, alto)
+    fbo = _pictogramas.get(clave)
+    if fbo is None:
+        if len(_pictogramas) >= MAX_PICTOGRAMAS:
+            _pictogramas.pop(next(iter(_pictogramas)))
+        fbo = Fbo(size=(ancho, alto))
+        with fbo:
+            # fondo blanco transparente: los trazos semitransparentes no se
+            # oscurecen al mezclarse con el fondo del Fbo
+            ClearColor(1, 1, 1, 0)
+            ClearBuffers()
+            Callback(mezcla_fbo)
+            Color(1, 1, 1, 0.95)
+            TecnicaButton.FIGURAS[tipo](
+                ancho / 2, alto / 2 + dp(8), min(ancho, alto) * 0.018)
+            # Kivy vuelve a su mezcla por defecto para el resto de la escena
+            Callback(restablecer_mezcla, reset_context=True)
+        fbo.draw()
+        # se guarda el Fbo (no sólo la textura) para que Kivy la regenere
+        # si Android pierde el contexto GL
+        _pictogramas[clave] = fbo
+    return fbo.texture
+
 
 class TecnicaButton(Button):
     TECNICAS = {
@@ -191,8 +264,20 @@ class TecnicaButton(Button):
         )
         self.add_widget(self._lbl)
 
+        with self.canvas.after:
+            Color(1, 1, 1, 1)
+            self._picto = Rectangle(pos=self.pos, size=(0, 0))
+
+        self._disparar_picto = Clock.create_trigger(self._actualizar_pictograma)
+        self.t_toque = None
         self.bind(pos=self._upd, size=self._upd)
 
+    def on_touch_down(self, touch):
+        # instante real del toque; on_press llega después de despachar el evento
+        if self.collide_point(*touch.pos):
+            self.t_toque = time.monotonic()
+        return super().on_touch_down(touch)
+
     def _upd(self, *a):
         self._bg.pos  = self.pos
         self._bg.size = self.size
@@ -210,28 +295,20 @@ class TecnicaButton(Button):
         self._lbl.size = (self.width, dp(24))
         self._lbl.text_size = (self.width, dp(24))
 
-        # redibujar figura
-        self.canvas.after.clear()
-        self._dibujar_figura()
+        # figura: mover es gratis, el tamaño se resuelve una vez por frame
+        self._picto.pos = self.pos
+        self._disparar_picto()
 
-    def _dibujar_figura(self):
-        cx = self.center_x
-        cy = self.center_y + dp(8)        
-        sc = min(self.width, self.height) * 0.018  # escala
-
-        with self.canvas.after:
-            Color(1, 1, 1, 0.95)
-
-            if self.tipo == 'frontal':
-                self._figura_frontal(cx, cy, sc)
-            elif self.tipo == 'circular':
-                self._figura_circular(cx, cy, sc)
-            elif self.tipo == 'giro_cuerpo':
-                self._figura_giro_cuerpo(cx, cy, sc)
-            elif self.tipo == 'giro_cabeza':
-                self._figura_giro_cabeza(cx, cy, sc)
+    def _actualizar_pictograma(self, *a):
+        ancho, alto = int(self.width), int(self.height)
+        if ancho < 1 or alto < 1:
+            return
+        self._picto.texture = _textura_pictograma(self.tipo, ancho, alto)
+        self._picto.pos  = self.pos
+        self._picto.size = (ancho, alto)
 
-    def _figura_frontal(self, cx, cy, s):
+    @staticmethod
+    def _figura_frontal(cx, cy, s):
         r = s * 5
         # cabeza
         Ellipse(pos=(cx-s*3 - r, cy + s*10 - r), size=(r*2, r*2))
@@ -254,7 +331,8 @@ class TecnicaButton(Button):
         Ellipse(pos=(cx+s*12-ri2, cy+s*3-ri2), size=(ri2*2, ri2*2))
 
     
-    def _figura_circular(self, cx, cy, s):
+    @staticmethod
+    def _figura_circular(cx, cy, s):
         r = s * 5
         # cabeza
         Ellipse(pos=(cx - r, cy + s*10 - r), size=(r*2, r*2))
@@ -283,7 +361,8 @@ class TecnicaButton(Button):
         Ellipse(pos=(cx-s*11-rh4, cy+s*10-rh4), size=(rh4*2, rh4*2))
 
     
-    def _figura_giro_cuerpo(self, cx, cy, s):
+    @staticmethod
+    def _figura_giro_cuerpo(cx, cy, s):
         import math
         r = s * 5
         # cabeza
@@ -337,7 +416,8 @@ class TecnicaButton(Button):
         ], width=s*0.7, cap='round')
 
     
-    def _figura_giro_cabeza(self, cx, cy, s):
+    @staticmethod
+    def _figura_giro_cabeza(cx, cy, s):
         import math
         r = s * 5
         # cabeza
@@ -396,6 +476,14 @@ class TecnicaButton(Button):
         ], width=s*0.7, cap='round')
 
 
+TecnicaButton.FIGURAS = {
+    'frontal':     TecnicaButton._figura_frontal,
+    'circular':    TecnicaButton._figura_circular,
+    'giro_cuerpo': TecnicaButton._figura_giro_cuerpo,
+    'giro_cabeza': TecnicaButton._figura_giro_cabeza,
+}
+
+
 class PanelLateral(BoxLayout):
     def __init__(self, color_panel, color_header, nombre, color_combate, **kwargs):
         super().__init__(orientation='vertical', spacing=0, **kwargs)
@@ -429,7 +517,7 @@ class PanelLateral(BoxLayout):
         self.add_widget(grid)
 
         
-        btn_null = RoundedButton(
+        self.btn_anular = RoundedButton(
             text='ANULAR ÚLTIMO PUNTO',
             font_size=sp(9),
             bold=True,
@@ -439,14 +527,14 @@ class PanelLateral(BoxLayout):
             size_hint_y=None,
             height=dp(28),
         )
-        btn_null.bind(on_press=self._on_anular)
+        self.btn_anular.bind(on_press=self._on_anular)
 
         null_wrap = BoxLayout(
             padding=[dp(8), 0, dp(8), dp(8)],
             size_hint_y=None,
             height=dp(36),
         )
-        null_wrap.add_widget(btn_null)
+        null_wrap.add_widget(self.btn_anular)
         self.add_widget(null_wrap)
 
     def _upd_bg(self, *a):
@@ -454,23 +542,14 @@ class PanelLateral(BoxLayout):
         self._bg.size = self.size
 
     def _on_tecnica(self, btn):
-        WebSocketManager().enviar_punto(self._color_combate, btn.puntos)
-        
-        pantalla = self._get_pantalla()
-        if pantalla:
-            pantalla.sumar_punto(self._color_combate, btn.puntos)
+        caja_negra.grabar(caja_negra.TOQUE, f"tecnica:{self._color_combate}:{btn.puntos}")
+        # el marcador lo actualiza el libro de puntos de la sesión (observar_marcador)
+        WebSocketManager().enviar_punto(self._color_combate, btn.puntos, t_captura=btn.t_toque)
 
     def _on_anular(self, *a):
+        caja_negra.grabar(caja_negra.TOQUE, f"anular:{self._color_combate}")
         WebSocketManager().enviar_punto(self._color_combate, None)
 
-    def _get_pantalla(self):
-        parent = self.parent
-        while parent:
-            if isinstance(parent, PantallaControles):
-                return parent
-            parent = parent.parent
-        return None
-
 
 class TopBar(BoxLayout):
     def __init__(self, **kwargs):
@@ -503,13 +582,16 @@ class TopBar(BoxLayout):
             valign='middle',
         )
         self.add_widget(self.lbl_combate)
-        self.add_widget(Label(
-            text='JUEZ',
+        self.lbl_enlace = Label(
+            text='● SIN CONEXIÓN',
             font_size=sp(10),
-            color=(0.42, 0.56, 0.72, 1),
+            bold=True,
+            color=C_ENLACE['sin conexión'],
             halign='right',
             valign='middle',
-        ))
+        )
+        self.lbl_enlace.bind(size=self.lbl_enlace.setter('text_size'))
+        self.add_widget(self.lbl_enlace)
 
     def _upd(self, *a):
         self._bg.pos  = self.pos
@@ -518,6 +600,19 @@ class TopBar(BoxLayout):
     def set_info(self, combate_id, juez_id):
         self.lbl_combate.text = f'COMBATE #{combate_id}  ·  JUEZ {juez_id}'
 
+    def set_espera(self):
+        self.lbl_combate.text = 'ESPERANDO SIGUIENTE COMBATE'
+
+    def set_enlace(self, calidad, rtt_ms):
+        texto = calidad.upper() if rtt_ms is None else f'{calidad.upper()}  {rtt_ms} ms'
+        self.lbl_enlace.text  = f'● {texto}'
+        self.lbl_enlace.color = C_ENLACE.get(calidad, C_ENLACE['sin conexión'])
+
+    def avisar_descartado(self, _):
+        # hasta el próximo cambio de enlace
+        self.lbl_enlace.text  = '● EVENTO NO ENVIADO'
+        self.lbl_enlace.color = C_ENLACE['mala']
+
 
 class Marcador(BoxLayout):
     def __init__(self, **kwargs):
@@ -696,6 +791,7 @@ class PantallaControles(Screen):
         self._score_azul = 0
         self._score_rojo = 0
         self.build_ui()
+        WebSocketManager().observar_marcador(self.mostrar_marcador)
 
     # ── construcción ──────────────────────────
     def build_ui(self):
@@ -768,44 +864,60 @@ class PantallaControles(Screen):
         root.add_widget(contenido)
 
         self.add_widget(root)
+        WebSocketManager().observar_enlace(self.topbar.set_enlace)
+        WebSocketManager().observar(EVENTO_DESCARTADO, self.topbar.avisar_descartado)
 
     def _upd_bg(self, *a):
         self._bg.pos  = self.pos
         self._bg.size = self.size
 
     # ── marcador ──────────────────────────────
-    def sumar_punto(self, color, pts):
-        if pts is None:
+    def mostrar_marcador(self, azul, rojo):
+        """Sólo se tocan las etiquetas del color que cambió."""
+        if (azul, rojo) == (self._score_azul, self._score_rojo):
             return
-        if color == 'AZUL':
-            self._score_azul += pts
-            self.panel_azul.header.set_score(self._score_azul)
-        else:
-            self._score_rojo += pts
-            self.panel_rojo.header.set_score(self._score_rojo)
-        self.marcador.set_scores(self._score_azul, self._score_rojo)
+        if azul != self._score_azul:
+            self._score_azul = azul
+            self.panel_azul.header.set_score(azul)
+        if rojo != self._score_rojo:
+            self._score_rojo = rojo
+            self.panel_rojo.header.set_score(rojo)
+        self.marcador.set_scores(azul, rojo)
 
     def reset_puntos_visuales(self):
-        self._score_azul = 0
-        self._score_rojo = 0
-        self.marcador.set_scores(0, 0)
-        self.panel_azul.header.set_score(0)
-        self.panel_rojo.header.set_score(0)
+        # el libro de la sesión ya se reseteó al recibir RESET_*
+        self.mostrar_marcador(*WebSocketManager().marcador.marcador())
 
     def reset_ui(self):
+        """Deja la pantalla como recién abierta para el combate actual de la sesión."""
+        ws = WebSocketManager()
         self.reset_puntos_visuales()
+        self.set_espera(ws.esperando_asignacion)
+        if not ws.esperando_asignacion:
+            self.topbar.set_info(ws.combate_id or '—', ws.juez_id or '—')
+
+    def set_espera(self, esperando):
+        """Entre combates: sin técnicas ni incidencias; FINALIZAR pasa a SALIR."""
+        for widget in (self.panel_rojo, self.panel_azul, self.btn_alerta):
+            widget.disabled = esperando
+            widget.opacity = 0.45 if esperando else 1.0
+        self.btn_finalizar.text = 'SALIR' if esperando else 'FINALIZAR'
+        if esperando:
+            self.topbar.set_espera()
 
     # ── on_enter ──────────────────────────────
     def on_enter(self):
-        _activar_wake_lock()          
+        activar_wake_lock()          
         ws = WebSocketManager()
         self.topbar.set_info(
             ws.combate_id or '—',
             ws.juez_id or '—',
         )
+        self.topbar.set_enlace(*ws.enlace_actual())
 
     # ── POPUP INCIDENCIA ──────────────────────
     def alerta_accion(self, instance):
+        caja_negra.grabar(caja_negra.TOQUE, "incidencia")
         WebSocketManager().enviar_incidencia()
         self._popup_info(
             titulo='Incidencia',
@@ -836,8 +948,21 @@ class PantallaControles(Screen):
 
         content.add_widget(Widget(size_hint_y=None, height=dp(8)))
 
+        ws = WebSocketManager()
+        if ws.esperando_asignacion:
+            titulo, detalle = '¿Salir?', 'Esta acción cerrará la sesión del juez.'
+        elif ws.relevo_en_caliente:
+            titulo, detalle = ('¿Finalizar el combate?',
+                               'El dispositivo quedará a la espera del siguiente combate.')
+        else:
+            titulo, detalle = '¿Finalizar el combate?', 'Esta acción cerrará la sesión del juez.'
+        pendientes = ws.pendientes_sin_ack()
+        if pendientes:
+            # sin enlace el servidor no recibió todo: finalizar descarta lo pendiente
+            detalle = f'{pendientes} eventos no llegaron al servidor y se descartarán.'
+
         lbl = Label(
-            text='¿Finalizar el combate?',
+            text=titulo,
             color=(0.10, 0.18, 0.32, 1),
             font_size=sp(17),
             bold=True,
@@ -848,7 +973,7 @@ class PantallaControles(Screen):
         content.add_widget(lbl)
 
         lbl_sub = Label(
-            text='Esta acción cerrará la sesión del juez.',
+            text=detalle,
             color=(0.38, 0.46, 0.58, 1),
             font_size=sp(12),
             halign='center', valign='middle',
@@ -861,7 +986,7 @@ class PantallaControles(Screen):
 
         botones = BoxLayout(spacing=dp(12), size_hint_y=None, height=dp(48))
 
-        btn_si = self._make_btn('FINALIZAR', C_FINALIZAR, C_AZUL)
+        btn_si = self._make_btn(self.btn_finalizar.text, C_FINALIZAR, C_AZUL)
         btn_no = self._make_btn('CANCELAR', C_ROJO, C_ROJO_HDR)
 
         botones.add_widget(btn_si)
@@ -875,12 +1000,24 @@ class PantallaControles(Screen):
 
     def confirmar_finalizar(self, popup):
         popup.dismiss()
-        _desactivar_wake_lock()       
+        self.finalizar()
+
+    def finalizar(self):
+        caja_negra.grabar(caja_negra.TOQUE, "finalizar")
+        ws = WebSocketManager()
+        # con relevo en caliente la conexión y la pantalla siguen: sólo se resetea
+        if not ws.esperando_asignacion and ws.esperar_siguiente_combate():
+            self.reset_ui()
+            return
+        self.cerrar_sesion()
+
+    def cerrar_sesion(self):
+        desactivar_wake_lock()
         ws = WebSocketManager()
         if ws.juez_id:
-            ws.jueces_ocupados.discard(ws.juez_id)
+            ws.liberar_juez(ws.juez_id)
             ws.juez_id = None
-        ws.disconnect()
+        ws.finalizar_combate()
         self.manager.current = 'pantalla_login'
 
   
@@ -0,0 +1,31 @@
+"""
+Carpeta de datos del usuario: bitácora, caja negra y log, nunca junto al
+código (en Android el directorio de la app es de sólo lectura).
+
+``PETOTECH_DATOS`` manda si está definida; con una app de Kivy en marcha es
+su ``App.user_data_dir``; si no (servidor, herramientas), ``~/.petotech``.
+No importa Kivy. Quien escribe crea la carpeta::
+
+    ruta = datos_usuario.ruta('bitacora.db')
+"""
+import os
+import sys
+
+VARIABLE = 'PETOTECH_DATOS'
+CARPETA_SIN_APP = os.path.join(os.path.expanduser('~'), '.petotech')
+
+
+def carpeta():
+    entorno = os.environ.get(VARIABLE)
+    if entorno:
+        return entorno
+    # sólo si Kivy ya está cargado: importarlo aquí lo inicializaría
+    app_kivy = sys.modules.get('kivy.app')
+    app = app_kivy.App.get_running_app() if app_kivy is not None else None
+    if app is not None:
+        return app.user_data_dir
+    return CARPETA_SIN_APP
+
+
+def ruta(archivo):
+    return os.path.join(carpeta(), archivo)
@@ -0,0 +1,279 @@
+"""
+Generador de carga: N combates x 3 jueces simulados contra el servidor.
+
+Cada juez es una SesionJuez sin Kivy (motor asyncio) que hace login,
+selecciona su puesto y puntúa en ráfagas parecidas a un combate real: en
+cada intercambio los tres jueces ven la misma técnica y la marcan con un
+tiempo de reacción distinto; a veces alguno no la marca o anula. Los
+combates se reparten entre procesos (un event loop por proceso) para usar
+todos los núcleos.
+
+Mide la latencia pulsación -> ACK (p50/p95/p99), el throughput, las
+reconexiones y los errores, y deja un reporte JSON. Sin ``--servidor``
+levanta servidor_local en un puerto libre, así que no necesita red::
+
+    python generador_carga.py --combates 200 --duracion 30 --salida carga.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import protocolo
+from sesion_juez import SesionJuez
+
+JUECES = (1, 2, 3)
+PUNTOS_TECNICA = (1, 2, 3, 4, 5)
+REACCION_MEDIA = 0.25    # s, tiempo medio entre ver la técnica y pulsar
+REACCION_DESVIO = 0.08
+PROB_MARCAR = 0.85       # probabilidad de que un juez marque la técnica
+PROB_ANULAR = 0.05       # tras marcar, probabilidad de anular enseguida
+PROB_INCIDENCIA = 0.01   # por intercambio
+ESPERA_CONEXION = 30.0   # s para que todos los jueces estén conectados
+
+log = logging.getLogger('petotech.carga')
+
+
+def percentiles(muestras):
+    """p50/p95/p99/max/media (mismo redondeo que SesionJuez.percentiles_rtt)."""
+    muestras = sorted(muestras)
+    if not muestras:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None, 'media': None, 'muestras': 0}
+    ultimo = len(muestras) - 1
+    return {
+        'p50': muestras[round(ultimo * 0.50)],
+        'p95': muestras[round(ultimo * 0.95)],
+        'p99': muestras[round(ultimo * 0.99)],
+        'max': muestras[-1],
+        'media': sum(muestras) / len(muestras),
+        'muestras': len(muestras),
+    }
+
+
+class JuezSimulado(SesionJuez):
+    """SesionJuez que anota cuándo se pulsó cada evento y cuándo llegó su ACK."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pulsaciones = {}  # seq -> time.monotonic() de la pulsación
+        self.latencias = []    # ms
+        self.enviados = 0
+        self.t_login = None
+        self.login_ms = None
+        self.error = None
+
+    def pulsar(self, color, puntos):
+        self.enviados += 1
+        t = time.monotonic()
+        seq = self.enviar_punto(color, puntos, t_captura=t)
+        if seq is not None:
+            self.pulsaciones[seq] = t
+
+    def incidencia(self):
+        self.enviados += 1
+        t = time.monotonic()
+        seq = self.enviar_incidencia(t_captura=t)
+        if seq is not None:
+            self.pulsaciones[seq] = t
+
+    def _confirmar_hasta(self, seq):
+        ahora = time.monotonic()
+        for s in [s for s in self.pulsaciones if s <= seq]:
+            self.latencias.append((ahora - self.pulsaciones.pop(s)) * 1000)
+        super()._confirmar_hasta(seq)
+
+
+async def _combate(jueces, intervalo, fin):
+    """Intercambios hasta ``fin``: los tres jueces ven la misma técnica."""
+    while time.monotonic() < fin:
+        await asyncio.sleep(random.expovariate(1 / intervalo))
+        color = random.choice(protocolo.COLORES)
+        puntos = random.choice(PUNTOS_TECNICA)
+        for juez in jueces:
+            if juez.is_connected and random.random() < PROB_MARCAR:
+                reaccion = max(0.0, random.gauss(REACCION_MEDIA, REACCION_DESVIO))
+                asyncio.get_running_loop().call_later(reaccion, _pulsacion, juez, color, puntos)
+        if random.random() < PROB_INCIDENCIA:
+            random.choice(jueces).incidencia()
+
+
+def _pulsacion(juez, color, puntos):
+    if not juez.is_connected:
+        return
+    juez.pulsar(color, puntos)
+    if random.random() < PROB_ANULAR:
+        juez.pulsar(color, None)
+
+
+async def _escenario(loop, args, indices, carpeta):
+    from bitacora import Bitacora
+
+    bitacora = Bitacora(os.path.join(carpeta, f"carga-{os.getpid()}.db"))
+    combates = []
+    for n in indices:
+        jueces = []
+        for numero in JUECES:
+            juez = JuezSimulado(servidor=args.host, puerto=args.puerto, backend='asyncio', loop=loop,
+                                bitacora=bitacora, nombre_dispositivo=f"carga-{n}-{numero}")
+            juez.t_login = time.monotonic()
+            juez.login_and_connect(
+                f"{args.prefijo}{n}",
+                on_success=lambda j=juez, numero=numero: _conectado(j, numero),
+                on_error=lambda e, j=juez: setattr(j, 'error', e),
+            )
+            jueces.append(juez)
+        combates.append(jueces)
+
+    todos = [j for jueces in combates for j in jueces]
+    limite = time.monotonic() + ESPERA_CONEXION
+    while time.monotonic() < limite and not all(j.juez_id or j.error for j in todos):
+        await asyncio.sleep(0.05)
+
+    t0 = time.monotonic()
+    fin = t0 + args.duracion
+    await asyncio.gather(*(_combate(jueces, args.intervalo, fin) for jueces in combates))
+    # margen para que lleguen los últimos ACK
+    limite = time.monotonic() + args.gracia
+    while time.monotonic() < limite and any(j.pulsaciones for j in todos):
+        await asyncio.sleep(0.05)
+    transcurrido = time.monotonic() - t0
+
+    resultado = {
+        'jueces': len(todos),
+        'conectados': sum(1 for j in todos if j.juez_id),
+        'errores_login': sum(1 for j in todos if j.error),
+        'enviados': sum(j.enviados for j in todos),
+        'sin_ack': sum(len(j.pulsaciones) for j in todos),
+        'reconexiones': sum(j.reconexiones for j in todos),
+        'reintentos_fallidos': sum(j.reintentos_fallidos for j in todos),
+        'enlaces_caidos': sum(j.enlaces_caidos for j in todos),
+        'latencias': [ms for j in todos for ms in j.latencias],
+        'login_ms': [j.login_ms for j in todos if j.login_ms is not None],
+        'segundos': transcurrido,
+    }
+    for juez in todos:
+        juez.disconnect()
+    bitacora.vaciar()
+    return resultado
+
+
+def _conectado(juez, numero):
+    juez.login_ms = (time.monotonic() - juez.t_login) * 1000
+    juez.juez_id = numero
+    juez.enviar_juez_seleccionado(numero)
+
+
+def _proceso(args, indices, carpeta):
+    """Un proceso del pool: un event loop con sus combates."""
+    from motor_asyncio import loop_en_hilo
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(os.getpid())
+    loop = loop_en_hilo('carga')
+    futuro = asyncio.run_coroutine_threadsafe(_escenario(loop, args, indices, carpeta), loop)
+    return futuro.result()
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _levantar_servidor(puerto):
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'servidor_local.py')
+    proceso = subprocess.Popen(
+        [sys.executable, ruta, '--host', '127.0.0.1', '--puerto', str(puerto), '--combates-abiertos'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    limite = time.monotonic() + 10
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", puerto), timeout=0.2).close()
+            return proceso
+        except OSError:
+            time.sleep(0.05)
+    proceso.kill()
+    raise RuntimeError("el servidor local no arrancó")
+
+
+def reporte(args, parciales):
+    latencias = [ms for p in parciales for ms in p['latencias']]
+    enviados = sum(p['enviados'] for p in parciales)
+    sin_ack = sum(p['sin_ack'] for p in parciales)
+    jueces = sum(p['jueces'] for p in parciales)
+    segundos = max((p['segundos'] for p in parciales), default=0) or 1
+    return {
+        'parametros': {
+            'combates': args.combates,
+            'jueces': jueces,
+            'procesos': len(parciales),
+            'duracion_s': args.duracion,
+            'intervalo_s': args.intervalo,
+            'servidor': f"{args.host}:{args.puerto}",
+        },
+        'conectados': sum(p['conectados'] for p in parciales),
+        'errores_login': sum(p['errores_login'] for p in parciales),
+        'enviados': enviados,
+        'confirmados': len(latencias),
+        'sin_ack': sin_ack,
+        'tasa_error': (sin_ack / enviados) if enviados else 0.0,
+        'throughput_ack_s': len(latencias) / segundos,
+        'latencia_ms': percentiles(latencias),
+        'login_ms': percentiles([ms for p in parciales for ms in p['login_ms']]),
+        'reconexiones': sum(p['reconexiones'] for p in parciales),
+        'reintentos_fallidos': sum(p['reintentos_fallidos'] for p in parciales),
+        'enlaces_caidos': sum(p['enlaces_caidos'] for p in parciales),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga de PetoTech")
+    parser.add_argument("--combates", type=int, default=50)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duracion", type=float, default=20.0, help="s de puntuación")
+    parser.add_argument("--intervalo", type=float, default=2.0,
+                        help="s medios entre intercambios de un combate")
+    parser.add_argument("--gracia", type=float, default=5.0, help="s de espera de los últimos ACK")
+    parser.add_argument("--servidor", help="host:puerto; sin él se levanta servidor_local")
+    parser.add_argument("--prefijo", default="carga-",
+                        help="contraseña de cada combate = prefijo + número")
+    parser.add_argument("--salida", help="archivo JSON del reporte")
+    args = parser.parse_args()
+
+    servidor = None
+    if args.servidor:
+        args.host, _, puerto = args.servidor.rpartition(":")
+        args.puerto = puerto
+    else:
+        args.host, args.puerto = "127.0.0.1", str(_puerto_libre())
+        servidor = _levantar_servidor(int(args.puerto))
+
+    procesos = max(1, min(args.procesos, args.combates))
+    repartos = [list(range(i, args.combates, procesos)) for i in range(procesos)]
+    try:
+        with tempfile.TemporaryDirectory() as carpeta:
+            with multiprocessing.Pool(procesos) as pool:
+                parciales = pool.starmap(_proceso, [(args, r, carpeta) for r in repartos])
+    finally:
+        if servidor is not None:
+            servidor.terminate()
+            servidor.wait()
+
+    resultado = json.dumps(reporte(args, parciales), indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(resultado)
+    print(resultado)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Libro de puntos de un juez: lo que marcó por color, con deshacer O(1).
+
+Cada PUNTUAR del juez apila sus puntos en la pila de su color y
+``PUNTUAR:-1`` (ANULAR ÚLTIMO PUNTO) desapila el último, igual que
+consenso.ConsensoCombate.anular en el servidor. El servidor lleva un libro
+por juez y le envía ``MARCADOR:{version},{ultimo_seq},{azul},{rojo}``
+tras cada evento, al seleccionar juez y al resetear.
+
+En el cliente el marcador es la última instantánea del servidor más los
+deltas de los eventos que ésta todavía no incluye (seq > ultimo_seq): la
+pantalla responde al toque sin esperar a la red y, tras reconexiones o
+resets, converge a lo que el servidor tiene sin pedir el estado completo.
+No depende de Kivy.
+"""
+from collections import deque
+
+from protocolo import COLORES, HISTORIAL_MAX
+
+
+class LibroPuntos:
+    def __init__(self):
+        self.version = None     # de la última instantánea aplicada
+        self.ultimo_seq = 0
+        self.reiniciar()
+
+    def reiniciar(self):
+        """RESET: marcador a cero y nada que anular (la versión se conserva)."""
+        self.base = dict.fromkeys(COLORES, 0)     # lo que confirmó el servidor
+        self.totales = dict.fromkeys(COLORES, 0)  # base + deltas pendientes
+        self._vaciar_pilas()
+        self._pendientes = deque()  # (seq, color, delta) aún fuera de la instantánea
+
+    def _vaciar_pilas(self):
+        self._pilas = {color: deque(maxlen=HISTORIAL_MAX) for color in COLORES}
+
+    def anotar(self, seq, color, puntos):
+        """
+        Aplica un evento del juez y devuelve el delta de su color. ``puntos``
+        None o -1 es anular: resta lo último que el juez marcó en ese color.
+        """
+        color = color.upper()
+        pila = self._pilas[color]
+        if puntos is None or puntos == -1:
+            delta = -pila.pop() if pila else 0
+        else:
+            pila.append(puntos)
+            delta = puntos
+        self.totales[color] += delta
+        if seq is not None and delta:
+            self._pendientes.append((seq, color, delta))
+        return delta
+
+    def retirar(self, seq):
+        """
+        El evento ``seq`` no llegará al servidor (bandeja llena): se quita
+        su delta; si después se anuló algo de ese color, la instantánea del
+        servidor lo corrige. Devuelve True si el marcador cambió.
+        """
+        for i, (pendiente, color, delta) in enumerate(self._pendientes):
+            if pendiente == seq:
+                break
+        else:
+            return False  # ya incluido en una instantánea, o sin puntos
+        del self._pendientes[i]
+        self.totales[color] -= delta
+        pila = self._pilas[color]
+        if delta > 0:
+            if delta in pila:
+                pila.remove(delta)
+        else:
+            pila.append(-delta)  # la anulación no ocurrió
+        return True
+
+    def entregado_hasta(self, seq):
+        """
+        Eventos enviados sin secuencia: el servidor no los confirmará, la
+        próxima instantánea ya los incluye.
+        """
+        pendientes = self._pendientes
+        while pendientes and pendientes[0][0] <= seq:
+            pendientes.popleft()
+
+    # ── servidor ─────────────────────────────
+    def registrar(self, seq, color, puntos):
+        """Evento ya aplicado de forma autoritativa: nueva versión."""
+        self.anotar(seq, color, puntos)
+        self._pendientes.clear()
+        self.base = dict(self.totales)
+        if seq is not None:
+            self.ultimo_seq = seq
+        self.version = (self.version or 0) + 1
+
+    def resetear(self):
+        self.reiniciar()
+        self.version = (self.version or 0) + 1
+
+    def instantanea(self):
+        return (self.version or 0, self.ultimo_seq) + tuple(self.totales[c] for c in COLORES)
+
+    # ── cliente ──────────────────────────────
+    def aplicar_instantanea(self, version, ultimo_seq, *totales):
+        """
+        Reconcilia con el servidor. Se ignoran instantáneas viejas o
+        repetidas; devuelve True si el marcador cambió.
+        """
+        if self.version is not None and version <= self.version:
+            return False
+        self.version = version
+        self.ultimo_seq = ultimo_seq
+        pendientes = self._pendientes
+        while pendientes and pendientes[0][0] <= ultimo_seq:
+            pendientes.popleft()
+        self.base = dict(zip(COLORES, totales))
+        nuevos = dict(self.base)
+        for _, color, delta in pendientes:
+            nuevos[color] += delta
+        if nuevos == self.totales:
+            return False
+        self.totales = nuevos
+        # lo apilado ya no cuadra con el servidor (reset, otro dispositivo en
+        # el puesto): sólo se puede anular lo que la instantánea aún no incluye
+        self._vaciar_pilas()
+        for _, color, delta in pendientes:
+            pila = self._pilas[color]
+            if delta > 0:
+                pila.append(delta)
+            elif pila:
+                pila.pop()
+        return True
+
+    def marcador(self):
+        """(azul, rojo) para mostrar."""
+        return tuple(self.totales[c] for c in COLORES)
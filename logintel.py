@@ -1,6 +1,6 @@
-import requests
+import logging
+
 from kivy.uix.screenmanager import Screen
-from kivy.logger import Logger
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 from kivy.uix.boxlayout import BoxLayout
@@ -25,6 +25,8 @@ from websocket_manager import WebSocketManager, SERVER_IP, SERVER_PORT, LOGIN_AP
 
 BASE_SERVER_URL = f"http://{SERVER_IP}:{SERVER_PORT}"
 
+log = logging.getLogger('petotech.login')
+
 
 class RoundedTextInput(TextInput):
     def __init__(self, **kwargs):
@@ -151,6 +153,8 @@ class PantallaLogin(Screen):
         self.status_label.color     = C_SUBTITULO
         self.btn_aceptar.disabled   = False
         Clock.schedule_once(self._foco, 0.1)
+        # abrir la conexión al servidor mientras se escribe la contraseña
+        WebSocketManager().precalentar()
 
     def _foco(self, dt):
         self.contrasena_input.focus = True
@@ -163,7 +167,7 @@ class PantallaLogin(Screen):
         self.btn_aceptar.disabled = True
         self.status_label.text    = 'Conectando...'
         self.status_label.color   = C_SUBTITULO
-        Logger.info(f'Kivy: Intentando login: {contrasena}')
+        log.info("Intentando login")
         WebSocketManager().login_and_connect(
             contrasena,
             on_success=self.on_login_success,
@@ -171,14 +175,14 @@ class PantallaLogin(Screen):
         )
 
     def on_login_success(self):
-        Logger.info('Kivy: Login exitoso')
+        log.info("Login exitoso")
         ws = WebSocketManager()
         self.status_label.text  = f'Conectado al combate {ws.combate_id}'
         self.status_label.color = C_EXITO
         Clock.schedule_once(lambda dt: self._navigate_to_selecjuez(), 0.5)
 
     def on_login_error(self, error_msg):
-        Logger.error(f'Kivy: Error en login: {error_msg}')
+        log.error("Error en login: %s", error_msg)
         self.status_label.text    = ''
         self.btn_aceptar.disabled = False
         if 'Contraseña incorrecta' in error_msg or 'Contraseña de Juez incorrecta' in error_msg:
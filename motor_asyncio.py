@@ -0,0 +1,221 @@
+"""
+Motor de conexión asyncio: un único hilo con un event loop que es dueño del
+login HTTP, el WebSocket, el latido, los reintentos y la cola de salida.
+
+A diferencia del motor de hilos, reintentar el login o reconectar no crea
+hilos nuevos: todo son tareas del mismo loop. Varios motores pueden
+compartir un loop (p. ej. cientos de jueces simulados en un proceso)
+pasando ``loop=``.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import ws_asyncio
+
+log = logging.getLogger('petotech.motor')
+
+
+def loop_en_hilo(nombre='ws-asyncio'):
+    """Crea un event loop corriendo en un hilo daemon propio."""
+    loop = asyncio.new_event_loop()
+    hilo = threading.Thread(target=loop.run_forever, name=nombre)
+    hilo.daemon = True
+    hilo.start()
+    return loop
+
+
+class MotorAsyncio:
+    nombre = 'asyncio'
+
+    def __init__(self, sesion, intervalo_latido, ping=None, loop=None):
+        self.sesion = sesion
+        self.intervalo_latido = intervalo_latido
+        # (intervalo, timeout) del ping/pong del WebSocket; None sin ping
+        self.ping = ping
+        self.loop = loop or loop_en_hilo()
+        self.conexion = None  # ws_asyncio.ConexionWS abierta
+        self._supervisor = None
+        self._login = None
+        # mensajes encolados y aún sin escribir; enviar() corre en cualquier hilo
+        self._profundidad = 0
+        self._lock_profundidad = threading.Lock()
+        # los objetos asyncio se crean dentro del loop
+        self._llamar(self._iniciar)
+
+    def _llamar(self, funcion, *args):
+        """Ejecuta funcion(*args) en el loop desde cualquier hilo."""
+        self.loop.call_soon_threadsafe(funcion, *args)
+
+    def _iniciar(self):
+        self._cola = asyncio.Queue()
+        self._despertar = asyncio.Event()
+        self._http = ws_asyncio.ClienteHTTP()
+        self.loop.create_task(self._bucle_escritor())
+        self.loop.create_task(self._bucle_latido())
+
+    # ── HTTP ─────────────────────────────────
+    def precalentar(self, url):
+        async def calentar():
+            try:
+                await self._http.abrir(url)
+                log.info("Conexión HTTP precalentada")
+            except Exception as e:
+                log.info("No se pudo precalentar la conexión: %s", e)
+
+        self._llamar(self.loop.create_task, calentar())
+
+    def login(self, url, datos, timeout, al_terminar):
+        """Mismo contrato que MotorHilos.login; al_terminar corre en el loop."""
+        async def hacer_login():
+            try:
+                status, cuerpo = await self._http.post_json(url, datos, timeout)
+            except asyncio.TimeoutError as e:
+                al_terminar(None, None, TimeoutError(str(e)))
+            except OSError as e:
+                al_terminar(None, None, ConnectionError(str(e)))
+            except Exception as e:
+                al_terminar(None, None, e)
+            else:
+                al_terminar(status, cuerpo, None)
+
+        def lanzar():
+            # reintentar el login reemplaza al intento anterior
+            if self._login is not None:
+                self._login.cancel()
+            self._login = self.loop.create_task(hacer_login())
+
+        self._llamar(lanzar)
+
+    # ── WebSocket ────────────────────────────
+    def conectar(self):
+        def lanzar():
+            # cada conexión nueva reemplaza al supervisor anterior
+            if self._supervisor is not None:
+                self._supervisor.cancel()
+            self._supervisor = self.loop.create_task(self._supervisar())
+
+        self._llamar(lanzar)
+
+    async def _supervisar(self):
+        """Conecta, lee hasta que se cae y, mientras la sesión quiera, reintenta."""
+        sesion = self.sesion
+        while True:
+            url, cabeceras = sesion._destino_ws()
+            log.info("Conectando a WebSocket: %s", url)
+            conexion = None
+            vigilante = None
+            try:
+                conexion = await ws_asyncio.conectar(url, cabeceras)
+                self.conexion = conexion
+                if self.ping:
+                    vigilante = self.loop.create_task(self._vigilar_ping(conexion))
+                sesion._on_open()
+                while True:
+                    sesion._on_message(await conexion.recibir())
+            except ws_asyncio.ConexionCerrada:
+                pass
+            except asyncio.CancelledError:
+                if vigilante is not None:
+                    vigilante.cancel()
+                if conexion is not None:
+                    await conexion.cerrar()
+                self._cerrada(conexion)
+                raise
+            except Exception as e:
+                sesion._on_error(e)
+            if vigilante is not None:
+                vigilante.cancel()
+            if conexion is not None:
+                conexion.abortar()
+            self._cerrada(conexion)
+            if not sesion._debe_reconectar():
+                break
+            await asyncio.sleep(sesion._espera_reconexion())
+
+    async def _vigilar_ping(self, conexion):
+        """
+        Ping del WebSocket: el pong da una muestra de RTT; si no llega ningún
+        frame antes del timeout, aborta.
+        """
+        intervalo, timeout = self.ping
+        while not conexion.cerrada:
+            await asyncio.sleep(intervalo)
+            t_ping = time.monotonic()
+            conexion.ping()
+            await asyncio.sleep(timeout)
+            if conexion.t_ultimo_pong >= t_ping:
+                self.sesion._on_pong((conexion.t_ultimo_pong - t_ping) * 1000)
+            elif conexion.t_ultimo_frame < t_ping and not conexion.cerrada:
+                log.warning("Sin pong del servidor en %.1fs, se corta el enlace", timeout)
+                conexion.abortar()
+                return
+
+    def _cerrada(self, conexion):
+        # como websocket-client: on_close también tras un intento fallido
+        if conexion is None:
+            self.sesion._on_close(None, None)
+            return
+        if self.conexion is conexion:
+            self.conexion = None
+        self.sesion._on_close(conexion.code, conexion.reason)
+
+    def detener(self):
+        def parar():
+            if self._supervisor is not None:
+                self._supervisor.cancel()
+                self._supervisor = None
+
+        self._llamar(parar)
+
+    def cortar(self):
+        def abortar():
+            if self.conexion is not None:
+                self.conexion.abortar()
+
+        self._llamar(abortar)
+
+    # ── salida ───────────────────────────────
+    def enviar(self, conexion, message):
+        with self._lock_profundidad:
+            self._profundidad += 1
+        self._llamar(self._cola.put_nowait, (time.monotonic(), conexion, message))
+
+    def profundidad_cola(self):
+        return self._profundidad
+
+    async def _bucle_escritor(self):
+        sesion = self.sesion
+        while True:
+            t_encolado, conexion, message = await self._cola.get()
+            with self._lock_profundidad:
+                self._profundidad -= 1
+            sesion.esperas_cola.append(time.monotonic() - t_encolado)
+            ws = self.conexion
+            if ws is None or not sesion._conexion_vigente(conexion):
+                # los eventos secuenciados siguen en la bandeja y se reenvían
+                log.warning("Descartado (conexión cerrada): %s", message)
+                continue
+            try:
+                await ws.enviar(message)
+            except Exception as e:
+                log.error("Error enviando '%s': %s", message, e)
+                continue
+            log.debug("Enviado: %s", message)
+
+    # ── latido ───────────────────────────────
+    def despertar_latido(self):
+        self._llamar(self._despertar.set)
+
+    async def _bucle_latido(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), self.intervalo_latido)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            try:
+                self.sesion._latido()
+            except Exception as e:
+                log.error("Error en el latido: %s", e)
@@ -0,0 +1,211 @@
+"""
+Motor de conexión con hilos: websocket-client + requests.
+
+Un hilo supervisor por conexión (run_forever con reintentos), un hilo
+escritor que vacía la cola de salida y un hilo de latido. La lógica de
+sesión (qué enviar, cuánto esperar entre reintentos) vive en la sesión;
+el motor sólo mueve bytes y avisa con sus callbacks.
+"""
+import logging
+import queue
+import socket
+import threading
+import time
+
+import protocolo
+
+log = logging.getLogger('petotech.motor')
+
+
+class MotorHilos:
+    nombre = 'hilos'
+
+    def __init__(self, sesion, intervalo_latido, ping=None):
+        self.sesion = sesion
+        self.intervalo_latido = intervalo_latido
+        # (intervalo, timeout) del ping/pong del WebSocket; None sin ping
+        self.ping = ping
+        self.ws = None
+        self._generacion = 0
+        self._detener = threading.Event()
+        self._http = None
+        self._hilo_precalentar = None
+        self._cola = queue.Queue()
+        self._despertar = threading.Event()
+        for destino, nombre in ((self._bucle_escritor, 'ws-escritor'),
+                                (self._bucle_latido, 'ws-latido')):
+            hilo = threading.Thread(target=destino, name=nombre)
+            hilo.daemon = True
+            hilo.start()
+
+    # ── HTTP ─────────────────────────────────
+    def _sesion_http(self):
+        """requests.Session compartida: reutiliza la conexión keep-alive."""
+        # requests (urllib3, charset_normalizer...) se carga sólo al necesitarlo
+        import requests
+        if self._http is None:
+            self._http = requests.Session()
+            self._http.headers.update({'Content-Type': 'application/json'})
+        return self._http
+
+    def precalentar(self, url):
+        if self._hilo_precalentar and self._hilo_precalentar.is_alive():
+            return
+
+        def calentar():
+            try:
+                self._sesion_http().head(url, timeout=2)
+                log.info("Conexión HTTP precalentada")
+            except Exception as e:
+                log.info("No se pudo precalentar la conexión: %s", e)
+
+        self._hilo_precalentar = threading.Thread(target=calentar)
+        self._hilo_precalentar.daemon = True
+        self._hilo_precalentar.start()
+
+    def login(self, url, datos, timeout, al_terminar):
+        """
+        POST en un hilo aparte; al_terminar(status, json, error) con error
+        TimeoutError / ConnectionError / Exception o None.
+        """
+        def hacer_login():
+            import requests
+            try:
+                response = self._sesion_http().post(url, json=datos, timeout=timeout)
+                try:
+                    cuerpo = response.json()
+                except ValueError:
+                    cuerpo = None
+                al_terminar(response.status_code, cuerpo, None)
+            except requests.exceptions.Timeout as e:
+                al_terminar(None, None, TimeoutError(str(e)))
+            except requests.exceptions.ConnectionError as e:
+                al_terminar(None, None, ConnectionError(str(e)))
+            except Exception as e:
+                al_terminar(None, None, e)
+
+        hilo = threading.Thread(target=hacer_login)
+        hilo.daemon = True
+        hilo.start()
+
+    # ── WebSocket ────────────────────────────
+    def conectar(self):
+        # Cada conexión nueva invalida el bucle de reconexión anterior
+        self._generacion += 1
+        self._detener.clear()
+        hilo = threading.Thread(target=self._bucle_conexion, args=(self._generacion,))
+        hilo.daemon = True
+        hilo.start()
+
+    def _bucle_conexion(self, generacion):
+        """Supervisor: run_forever y, mientras la sesión quiera, reintenta."""
+        import websocket
+
+        sesion = self.sesion
+        while generacion == self._generacion:
+            url, cabeceras = sesion._destino_ws()
+            log.info("Conectando a WebSocket: %s", url)
+            ws = self.ws = websocket.WebSocketApp(
+                url,
+                header=cabeceras,
+                on_open=lambda ws: sesion._on_open(),
+                on_message=lambda ws, message: sesion._on_message(message),
+                on_error=lambda ws, error: self._error(error),
+                on_close=lambda ws, code, msg: sesion._on_close(code, msg),
+                on_pong=lambda ws, datos: self._pong(ws),
+            )
+            if self.ping:
+                # sin pong en ping_timeout, run_forever cierra y se reintenta
+                ws.run_forever(ping_interval=self.ping[0], ping_timeout=self.ping[1])
+            else:
+                ws.run_forever()
+            # un conectar() posterior pudo poner ya su propio WebSocketApp
+            if self.ws is ws:
+                self.ws = None
+            if generacion != self._generacion or not sesion._debe_reconectar():
+                break
+            if self._detener.wait(sesion._espera_reconexion()):
+                break
+
+    def _pong(self, ws):
+        # websocket-client anota (time.time()) el último ping y el último pong
+        rtt = ws.last_pong_tm - ws.last_ping_tm
+        if ws.last_ping_tm and rtt >= 0:
+            self.sesion._on_pong(rtt * 1000)
+
+    def _error(self, error):
+        import websocket
+        if isinstance(error, websocket.WebSocketTimeoutException):
+            # sin pong: el cierre no esperaría el eco de un peer que no responde
+            self.cortar()
+        self.sesion._on_error(error)
+
+    def detener(self):
+        self._detener.set()
+        ws = self.ws
+        if ws is None:
+            return
+        # ws.close() cierra el fd mientras run_forever sigue en select() sobre
+        # él y el hilo no despierta nunca: primero CLOSE y shutdown del socket
+        sock = ws.sock
+        try:
+            if sock is not None and sock.sock is not None:
+                sock.send_close()
+                sock.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        ws.close()
+
+    def cortar(self):
+        """Cierra el socket sin esperar el close handshake (el peer no responde)."""
+        ws = self.ws
+        sock = getattr(ws, 'sock', None)
+        try:
+            if sock is not None and sock.sock is not None:
+                # shutdown (no close) despierta al select() de run_forever
+                sock.sock.shutdown(socket.SHUT_RDWR)
+            elif ws is not None:
+                ws.close()
+        except Exception as e:
+            log.error("Error cortando el socket: %s", e)
+
+    # ── salida ───────────────────────────────
+    def enviar(self, conexion, message):
+        self._cola.put((time.monotonic(), conexion, message))
+
+    def profundidad_cola(self):
+        return self._cola.qsize()
+
+    def _bucle_escritor(self):
+        """Hilo escritor: vacía la cola de salida sobre el socket actual."""
+        sesion = self.sesion
+        while True:
+            t_encolado, conexion, message = self._cola.get()
+            sesion.esperas_cola.append(time.monotonic() - t_encolado)
+            ws = self.ws
+            if ws is None or not sesion._conexion_vigente(conexion):
+                # los eventos secuenciados siguen en la bandeja y se reenvían
+                log.warning("Descartado (conexión cerrada): %s", message)
+                continue
+            try:
+                if isinstance(message, bytes):
+                    ws.send(message, opcode=protocolo.OPCODE_BINARIO)
+                else:
+                    ws.send(message)
+            except Exception as e:
+                log.error("Error enviando '%s': %s", message, e)
+                continue
+            log.debug("Enviado: %s", message)
+
+    # ── latido ───────────────────────────────
+    def despertar_latido(self):
+        self._despertar.set()
+
+    def _bucle_latido(self):
+        while True:
+            self._despertar.wait(self.intervalo_latido)
+            self._despertar.clear()
+            try:
+                self.sesion._latido()
+            except Exception as e:
+                log.error("Error en el latido: %s", e)
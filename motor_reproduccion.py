@@ -0,0 +1,47 @@
+"""
+Motor de conexión sin red que usa reproducir.py: la sesión se alimenta
+desde una grabación de la caja negra.
+"""
+
+
+class MotorReproduccion:
+    """Motor sin red: la grabación decide qué llega y cuándo; lo enviado se guarda."""
+    nombre = 'reproduccion'
+
+    def __init__(self, sesion):
+        self.sesion = sesion
+        self.enviados = []
+        self._al_terminar_login = None
+
+    def precalentar(self, url):
+        pass
+
+    def login(self, url, datos, timeout, al_terminar):
+        # responde el estado 'login:{id}' de la grabación
+        self._al_terminar_login = al_terminar
+
+    def responder_login(self, combate_id):
+        al_terminar, self._al_terminar_login = self._al_terminar_login, None
+        if al_terminar is None:
+            return False
+        al_terminar(200, {'combateId': combate_id}, None)
+        return True
+
+    def conectar(self):
+        # el estado 'conectado' de la grabación abre la conexión
+        pass
+
+    def detener(self):
+        pass
+
+    def cortar(self):
+        pass
+
+    def enviar(self, conexion, message):
+        self.enviados.append(message)
+
+    def profundidad_cola(self):
+        return 0
+
+    def despertar_latido(self):
+        pass
@@ -1,4 +1,11 @@
+import logging
+import time
+import arranque
+import caja_negra
+import trazas
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.core.window import Window
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
@@ -14,10 +21,14 @@ from estilos import (
     separador_decorativo,
     H_LOGO_LG, PAD_H, PAD_SEP_CENTRO,
 )
-from logintel import PantallaLogin
-from controles import PantallaControles
-from selecjuez import SeleccJuez
-from websocket_manager import WebSocketManager
+
+arranque.marcar('imports')
+
+# Módulos de red y del puente Android: se cargan en segundo plano mientras
+# se muestra la bienvenida; las pantallas importan su módulo al construirse.
+PRECARGA_FONDO = ('websocket_manager', 'requests', 'websocket', 'uuid', 'jnius')
+
+log = logging.getLogger('petotech.pantallas')
 
 
 class FiguraTKD(Widget):
@@ -105,17 +116,89 @@ class PantallaBienvenida(Screen):
         self.manager.current = 'pantalla_login'
 
 
+class GestorPantallas(ScreenManager):
+    """
+    ScreenManager que construye cada pantalla registrada la primera vez que
+    se navega a ella (o se pide con get_screen), o antes, en frames ociosos.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._fabricas = {}
+        self.bind(current=self._al_cambiar_pantalla)
+
+    def _al_cambiar_pantalla(self, instancia, nombre):
+        caja_negra.grabar(caja_negra.ESTADO, f"pantalla:{nombre}")
+
+    def registrar(self, nombre, fabrica):
+        self._fabricas[nombre] = fabrica
+
+    def _construir(self, nombre):
+        fabrica = self._fabricas.pop(nombre)
+        t0 = time.perf_counter()
+        self.add_widget(fabrica())
+        log.info("%s construida en %.1f ms", nombre, (time.perf_counter() - t0) * 1000)
+
+    def get_screen(self, name):
+        if name in self._fabricas:
+            self._construir(name)
+        return super().get_screen(name)
+
+    def has_screen(self, name):
+        return name in self._fabricas or super().has_screen(name)
+
+    def precargar_en_reposo(self, *a):
+        """Construye una pantalla pendiente por frame hasta agotarlas."""
+        if self._fabricas:
+            self._construir(next(iter(self._fabricas)))
+            Clock.schedule_once(self.precargar_en_reposo, 0)
+
+
 class PetoTechApp(App):
     def build(self):
-        sm = ScreenManager()
+        # el log de petotech.* pasa al anillo asíncrono (el archivo se abre en su hilo)
+        trazas.configurar()
+        sm = GestorPantallas()
         sm.add_widget(PantallaBienvenida(name='pantalla_bienvenida'))
-        sm.add_widget(PantallaLogin(name='pantalla_login'))
-        sm.add_widget(SeleccJuez(name='selecjuez'))
-        sm.add_widget(PantallaControles(name='controles'))
+        sm.registrar('pantalla_login',
+                      lambda: arranque.importar('logintel').PantallaLogin(name='pantalla_login'))
+        sm.registrar('selecjuez',
+                      lambda: arranque.importar('selecjuez').SeleccJuez(name='selecjuez'))
+        sm.registrar('controles',
+                      lambda: arranque.importar('controles').PantallaControles(name='controles'))
+        arranque.marcar('build')
         return sm
 
+    def on_start(self):
+        Window.bind(on_flip=self._primer_frame)
+
+    def _primer_frame(self, *a):
+        Window.unbind(on_flip=self._primer_frame)
+        arranque.marcar('primer frame')
+        # la caja negra se abre después de pintar: no cuenta para el arranque
+        caja_negra.abrir()
+        for linea in arranque.reporte():
+            log.info("Arranque: %s", linea)
+        total = arranque.transcurrido()
+        if total > arranque.PRESUPUESTO_ARRANQUE:
+            log.warning("Arranque: %.2fs supera el presupuesto de %.2fs",
+                        total, arranque.PRESUPUESTO_ARRANQUE)
+        # el resto de pantallas se arma después de pintar la bienvenida
+        hilo = arranque.precargar(PRECARGA_FONDO)
+        Clock.schedule_once(self.root.precargar_en_reposo, 0)
+        Clock.schedule_interval(lambda dt: self._reporte_importaciones(hilo), 0.5)
+
+    def _reporte_importaciones(self, hilo):
+        if hilo.is_alive() or self.root._fabricas:
+            return True
+        for linea in arranque.reporte_importaciones():
+            log.info("Importaciones: %s", linea)
+        return False
+
     def on_stop(self):
-        WebSocketManager().disconnect()
+        from websocket_manager import WebSocketManager
+        # cerrar la app no finaliza el combate: lo pendiente queda en la bitácora
+        WebSocketManager().cerrar()
+        trazas.cerrar()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,274 @@
+"""
+Códec del protocolo de jueces.
+
+El protocolo de texto (``TIPO:campo,campo``) sigue siendo el predeterminado.
+Los eventos (PUNTUAR, INCIDENCIA) llevan ``seq`` y ``t_ms`` sólo si el
+servidor acepta ``SEQ1`` en la respuesta al ``CAPACIDADES`` que el cliente
+envía al conectar; si además acepta ``BIN1``, viajan como frames binarios
+de cabecera fija::
+
+    opcode (B) | seq (I) | t_ms (q) | payload
+
+No depende de Kivy: lo usan tanto el cliente como el servidor local.
+"""
+import struct
+
+# ── tipos de mensaje ─────────────────────────
+PUNTUAR = "PUNTUAR"
+INCIDENCIA = "INCIDENCIA"
+SELECCIONAR_JUEZ = "SELECCIONAR_JUEZ"
+ESTADO_JUECES = "ESTADO_JUECES"
+JUEZ_OCUPADO = "JUEZ_OCUPADO"
+POSICION_INVALIDA = "POSICION_INVALIDA"
+RESET_COMPLETO = "RESET_COMPLETO"
+RESET_PUNTOS = "RESET_PUNTOS"
+INCIDENCIA_REGISTRADA = "INCIDENCIA_REGISTRADA"
+ACK = "ACK"
+RELOJ = "RELOJ"
+RELOJ_OK = "RELOJ_OK"
+COMBATE = "COMBATE"
+CAPACIDADES = "CAPACIDADES"
+MARCADOR = "MARCADOR"  # MARCADOR:{version},{ultimo_seq},{azul},{rojo}
+OCUPACION = "OCUPACION"  # OCUPACION:{version}:+{juez} | -{juez} | [1, 3]
+PEDIR_OCUPACION = "PEDIR_OCUPACION"  # el cliente detectó un hueco de versión
+SIGUIENTE_COMBATE = "SIGUIENTE_COMBATE"  # el juez terminó: espera otro combate sin desconectar
+ASIGNACION = "ASIGNACION"  # ASIGNACION:{combateId},{juez}
+TOTALES = "TOTALES"  # TOTALES:{version},{azul},{rojo}: puntos validados del combate
+# conexión multiplexada (/ws/canales): SUSCRIBIR:{combateId} y, del servidor,
+# los mensajes de cada combate etiquetados como "@{combateId}|TIPO:cuerpo"
+SUSCRIBIR = "SUSCRIBIR"
+DESUSCRIBIR = "DESUSCRIBIR"
+
+CAPACIDAD_BINARIA = "BIN1"
+CAPACIDAD_OCUPACION = "OCUP1"  # deltas de ocupación versionados
+CAPACIDAD_SIGUIENTE = "SIG1"     # relevo al siguiente combate por la misma conexión
+CAPACIDAD_SECUENCIA = "SEQ1"     # eventos con seq y t_ms, ACK:{seq} y reenvío de los no confirmados
+OPCODE_BINARIO = 0x2  # opcode de WebSocket para frames binarios
+
+COLORES = ("AZUL", "ROJO")
+PUNTOS_VALIDOS = (-1, 1, 2, 3, 4, 5)  # -1 = anular último punto
+# puntos por (juez, color) que se pueden anular; servidor y cliente usan el mismo
+HISTORIAL_MAX = 32
+
+# ── salida: tramas precodificadas ────────────
+# (puntos, color) -> "PUNTUAR:{pts},{COLOR}" armado una sola vez
+TRAMAS_PUNTO = {
+    (pts, color): f"{PUNTUAR}:{pts},{color}"
+    for pts in PUNTOS_VALIDOS
+    for color in COLORES
+}
+TRAMA_INCIDENCIA = INCIDENCIA
+_COLOR_NORMALIZADO = {c: c for c in COLORES}
+_COLOR_NORMALIZADO.update({c.lower(): c for c in COLORES})
+
+
+def trama_punto(puntos, color):
+    """Prefijo de texto del evento; None en puntos significa anular (-1)."""
+    if puntos is None:
+        puntos = -1
+    color = _COLOR_NORMALIZADO.get(color) or color.upper()
+    trama = TRAMAS_PUNTO.get((puntos, color))
+    return trama if trama is not None else f"{PUNTUAR}:{puntos},{color}"
+
+
+def con_secuencia(trama, seq, t_ms):
+    """Agrega ``seq`` y ``t_ms`` como últimos campos de la trama."""
+    sep = "," if ":" in trama else ":"
+    return f"{trama}{sep}{seq},{t_ms}"
+
+
+def sin_secuencia(trama):
+    """Inversa de con_secuencia: la trama sin ``seq`` ni ``t_ms``."""
+    tipo, _, cuerpo = trama.partition(":")
+    campos = cuerpo.split(",")[:-2]
+    return f"{tipo}:{','.join(campos)}" if campos else tipo
+
+
+# ── entrada: parsers con pocas asignaciones ──
+def dividir(mensaje):
+    """``"TIPO:cuerpo"`` -> ``("TIPO", "cuerpo")``; sin ':' el cuerpo es ''."""
+    tipo, _, cuerpo = mensaje.partition(":")
+    return tipo, cuerpo
+
+
+_estados_jueces = {}
+
+
+def parsear_estado_jueces(cuerpo):
+    """
+    ``"[1, 3]"`` -> ``frozenset({1, 3})``. Sólo hay un puñado de cuerpos
+    distintos, así que cada uno se parsea una vez y luego se reutiliza.
+    """
+    resultado = _estados_jueces.get(cuerpo)
+    if resultado is None:
+        resultado = frozenset(
+            int(j) for j in cuerpo.strip().strip("[]").split(",") if j.strip().isdigit()
+        )
+        if len(_estados_jueces) < 64:
+            _estados_jueces[cuerpo] = resultado
+    return resultado
+
+
+def parsear_entero(cuerpo):
+    """Entero del cuerpo o None, sin lanzar excepción."""
+    cuerpo = cuerpo.strip()
+    if cuerpo.isdigit():
+        return int(cuerpo)
+    return None
+
+
+def formatear_estado_jueces(ocupados):
+    """Mismo formato que List.toString() del backend: ``"[1, 3]"``."""
+    return f"[{', '.join(str(j) for j in sorted(ocupados))}]"
+
+
+def trama_ocupacion(version, cambio):
+    """
+    ``cambio``: juez que ocupa (+n), juez que libera (-n) o el conjunto
+    completo de ocupados (instantánea).
+    """
+    if isinstance(cambio, int):
+        return f"{OCUPACION}:{version}:{cambio:+d}"
+    return f"{OCUPACION}:{version}:{formatear_estado_jueces(cambio)}"
+
+
+def parsear_ocupacion(cuerpo):
+    """
+    ``"7:+2"`` -> ``(7, 2)``, ``"8:-2"`` -> ``(8, -2)``,
+    ``"9:[1, 3]"`` -> ``(9, frozenset({1, 3}))``; None si no es válido.
+    """
+    version, _, cambio = cuerpo.partition(":")
+    version = parsear_entero(version)
+    cambio = cambio.strip()
+    if version is None or not cambio:
+        return None
+    if cambio[0] == "[":
+        return version, parsear_estado_jueces(cambio)
+    try:
+        return version, int(cambio)
+    except ValueError:
+        return None
+
+
+def parsear_asignacion(cuerpo):
+    """``"15,2"`` -> ``("15", 2)``; None si no es válida."""
+    combate_id, _, juez = cuerpo.rpartition(",")
+    juez = parsear_entero(juez)
+    combate_id = combate_id.strip()
+    if not combate_id or juez is None:
+        return None
+    return combate_id, juez
+
+
+def trama_marcador(version, ultimo_seq, azul, rojo):
+    return f"{MARCADOR}:{version},{ultimo_seq},{azul},{rojo}"
+
+
+def parsear_marcador(cuerpo):
+    """``"7,42,5,3"`` -> ``(version, ultimo_seq, azul, rojo)`` o None si no es válido."""
+    try:
+        version, ultimo_seq, azul, rojo = (int(c) for c in cuerpo.split(","))
+    except ValueError:
+        return None
+    return version, ultimo_seq, azul, rojo
+
+
+def trama_totales(version, azul, rojo):
+    return f"{TOTALES}:{version},{azul},{rojo}"
+
+
+def parsear_totales(cuerpo):
+    """``"4,7,3"`` -> ``(version, azul, rojo)`` o None si no es válido."""
+    try:
+        version, azul, rojo = (int(c) for c in cuerpo.split(","))
+    except ValueError:
+        return None
+    return version, azul, rojo
+
+
+def etiquetar(combate_id, mensaje):
+    """Mensaje de un combate en la conexión multiplexada."""
+    return f"@{combate_id}|{mensaje}"
+
+
+def separar_canal(mensaje):
+    """``"@15|TOTALES:1,2,0"`` -> ``("15", "TOTALES:1,2,0")``; sin etiqueta, ``(None, mensaje)``."""
+    if mensaje.startswith("@"):
+        combate_id, separador, resto = mensaje[1:].partition("|")
+        if separador:
+            return combate_id, resto
+    return None, mensaje
+
+
+def _entero_opcional(campos, i):
+    if len(campos) > i and campos[i]:
+        return int(campos[i])
+    return None
+
+
+def parsear_evento(tipo, cuerpo):
+    """
+    Campos de un PUNTUAR/INCIDENCIA de texto: ``(puntos, color, seq, t_ms)``.
+    Los ausentes son None (clientes anteriores a la secuencia o al sello de
+    tiempo, o INCIDENCIA, que no lleva puntos ni color). Un color fuera de
+    COLORES es ValueError, como un número mal formado.
+    """
+    campos = cuerpo.split(",") if cuerpo else []
+    if tipo == PUNTUAR:
+        color = campos[1].strip().upper()
+        if color not in COLORES:
+            raise ValueError(f"color desconocido: {color!r}")
+        return (int(campos[0]), color,
+                _entero_opcional(campos, 2), _entero_opcional(campos, 3))
+    return None, None, _entero_opcional(campos, 0), _entero_opcional(campos, 1)
+
+
+# ── framing binario opcional ─────────────────
+OP_PUNTUAR = 1
+OP_INCIDENCIA = 2
+
+_CABECERA = struct.Struct("!BIq")
+_PAYLOAD_PUNTO = struct.Struct("!bB")
+_COLOR_A_BYTE = {color: i for i, color in enumerate(COLORES)}
+# payloads fijos precodificados: (puntos, color) -> b"..."
+PAYLOADS_PUNTO = {
+    (pts, color): _PAYLOAD_PUNTO.pack(pts, _COLOR_A_BYTE[color])
+    for pts, color in TRAMAS_PUNTO
+}
+
+
+def codificar_binario(opcode, seq, t_ms, payload=b""):
+    return _CABECERA.pack(opcode, seq, t_ms) + payload
+
+
+def punto_binario(puntos, color, seq, t_ms):
+    if puntos is None:
+        puntos = -1
+    color = _COLOR_NORMALIZADO.get(color) or color.upper()
+    return codificar_binario(OP_PUNTUAR, seq, t_ms, PAYLOADS_PUNTO[(puntos, color)])
+
+
+def incidencia_binaria(seq, t_ms):
+    return codificar_binario(OP_INCIDENCIA, seq, t_ms)
+
+
+def decodificar_binario(datos):
+    """bytes -> ``(tipo, puntos, color, seq, t_ms)`` con la misma forma que el texto."""
+    opcode, seq, t_ms = _CABECERA.unpack_from(datos)
+    if opcode == OP_PUNTUAR:
+        puntos, color = _PAYLOAD_PUNTO.unpack_from(datos, _CABECERA.size)
+        return PUNTUAR, puntos, COLORES[color], seq, t_ms
+    if opcode == OP_INCIDENCIA:
+        return INCIDENCIA, None, None, seq, t_ms
+    raise ValueError(f"opcode binario desconocido: {opcode}")
+
+
+def texto_a_binario(trama):
+    """Convierte una trama secuenciada de texto a binario (reenvíos)."""
+    tipo, cuerpo = dividir(trama)
+    puntos, color, seq, t_ms = parsear_evento(tipo, cuerpo)
+    if tipo == PUNTUAR:
+        return punto_binario(puntos, color, seq, t_ms)
+    if tipo == INCIDENCIA:
+        return incidencia_binaria(seq, t_ms)
+    return trama
@@ -0,0 +1,414 @@
+"""
+Reproducción de una grabación de la caja negra (petotech1.rec).
+
+Vuelve a ejecutar una ejecución de la app contra la sesión: los frames
+entrantes se entregan a ``_on_message``, las transiciones de conexión a
+``_on_open``/``_on_close`` y los toques del juez a los mismos métodos que
+usan las pantallas. Lo que la sesión envía se compara con lo grabado
+(sin RELOJ y sin el sello de tiempo de cada evento, que depende del
+reloj) y se listan las diferencias. Sin ``--velocidad`` corre todo de
+una vez en el mismo hilo, así que es determinista::
+
+    python reproducir.py --volcar              # línea de tiempo
+    python reproducir.py                       # última ejecución, sin UI
+    python reproducir.py --ui --velocidad 1    # la app Kivy, pantallas incluidas
+
+Con ``--ui`` la app arranca con el motor de reproducción y los toques se
+hacen sobre los botones reales (técnicas, anular, alerta, jueces), así se
+puede perfilar la UI sin servidor ni tablet.
+"""
+import argparse
+import difflib
+import logging
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import caja_negra
+import protocolo
+from caja_negra import ENTRADA, SALIDA, TOQUE, ESTADO
+
+log = logging.getLogger('petotech.reproducir')
+
+
+def normalizar(frame):
+    """
+    Forma comparable de un frame saliente: None para RELOJ y, en los
+    eventos secuenciados, (tipo, puntos, color, seq) sin el sello de tiempo.
+    """
+    if isinstance(frame, bytes):
+        try:
+            tipo, puntos, color, seq, _ = protocolo.decodificar_binario(frame)
+        except (ValueError, struct.error):
+            return frame
+        return (tipo, puntos, color, seq)
+    tipo, cuerpo = protocolo.dividir(frame)
+    if tipo == protocolo.RELOJ:
+        return None
+    if tipo in (protocolo.PUNTUAR, protocolo.INCIDENCIA):
+        try:
+            puntos, color, seq, _ = protocolo.parsear_evento(tipo, cuerpo)
+        except (ValueError, IndexError):
+            return frame
+        return (tipo, puntos, color, seq)
+    return frame
+
+
+def _frame(registro):
+    return registro.datos if registro.binario else caja_negra.texto(registro)
+
+
+def _grabado(registro):
+    """Frame saliente grabado; si se truncó sólo se compara el prefijo."""
+    if registro.truncado:
+        return ('truncado', registro.datos)
+    return normalizar(_frame(registro))
+
+
+def _obtenido(frame, grabado):
+    if isinstance(grabado, tuple) and grabado[0] == 'truncado':
+        datos = frame if isinstance(frame, bytes) else frame.encode()
+        return ('truncado', datos[:caja_negra.CARGA_MAX])
+    return normalizar(frame)
+
+
+class Reproductor:
+    """Conduce una SesionJuez con los registros de una ejecución."""
+
+    def __init__(self, sesion, registros):
+        self.sesion = sesion
+        self.motor = sesion._motor
+        self.registros = registros
+        self.aplicados = 0
+        self._toques = {
+            'tecnica': self.tecnica,
+            'anular': self.anular,
+            'incidencia': self.incidencia,
+            'juez': self.juez,
+            'finalizar': self.finalizar,
+        }
+        sesion.observar(protocolo.JUEZ_OCUPADO, self._perder_juez)
+        sesion.observar(protocolo.POSICION_INVALIDA, self._perder_juez)
+
+    def preparar(self):
+        """
+        Ajusta la sesión a la grabación. El anillo puede haber pisado el
+        principio de la ejecución: si hay tráfico saliente antes de
+        'conectado', se abre la conexión y se retoma la secuencia donde la
+        dejó la grabación.
+        """
+        # la configuración no se graba, se deduce del tráfico
+        prefijo = f"{protocolo.CAPACIDADES}:".encode()
+        ofrecidas = set()
+        for r in self.registros:
+            if r.tipo == SALIDA and r.datos.startswith(prefijo):
+                ofrecidas.update(caja_negra.texto(r)[len(prefijo):].split(","))
+        self.sesion.ofrecer_binario = protocolo.CAPACIDAD_BINARIA in ofrecidas
+        self.sesion.ofrecer_deltas_ocupacion = protocolo.CAPACIDAD_OCUPACION in ofrecidas
+        self.sesion.ofrecer_siguiente_combate = protocolo.CAPACIDAD_SIGUIENTE in ofrecidas
+        self.sesion.ofrecer_secuencia = protocolo.CAPACIDAD_SECUENCIA in ofrecidas
+        for r in self.registros:
+            if r.tipo == ESTADO and caja_negra.texto(r).startswith('conectado:'):
+                return
+            if r.tipo == SALIDA:
+                break
+        else:
+            return
+        log.warning("La grabación empieza a mitad de la sesión (seq %d)", self.registros[0].seq)
+        seq = None
+        for r in self.registros:
+            if r.tipo == SALIDA:
+                grabado = _grabado(r)
+                if isinstance(grabado, tuple) and isinstance(grabado[3], int):
+                    seq = grabado[3]
+                    self.sesion._seq = seq - 1
+                    break
+        self.sesion._on_open()
+        # la respuesta a CAPACIDADES quedó antes del principio del anillo
+        self.sesion._negociado = True
+        if seq is not None:
+            self.sesion.secuencia = True
+
+    def aplicar(self, registro):
+        self.aplicados += 1
+        if registro.tipo == ENTRADA:
+            self.sesion._on_message(_frame(registro))
+        elif registro.tipo == TOQUE:
+            accion, _, argumentos = caja_negra.texto(registro).partition(':')
+            toque = self._toques.get(accion)
+            if toque is None:
+                log.warning("Toque desconocido: %s", accion)
+                return
+            if argumentos:
+                toque(*argumentos.split(':'))
+            else:
+                toque()
+        elif registro.tipo == ESTADO:
+            estado, _, valor = caja_negra.texto(registro).partition(':')
+            self.estado(estado, valor)
+        # la bitácora lee los pendientes en su hilo; en la ejecución grabada
+        # la lectura acabó antes del siguiente registro, aquí se espera
+        self.sesion._bitacora.vaciar()
+
+    def estado(self, estado, valor):
+        # sólo se aplican las transiciones que vienen de la red; el resto
+        # (enlace, finalizado...) es consecuencia de lo ya reproducido
+        sesion = self.sesion
+        if estado == 'login':
+            if not self.motor.responder_login(valor):
+                sesion.combate_id = valor
+        elif estado == 'conectado':
+            if not sesion.is_connected:
+                sesion.combate_id = None if valor == 'None' else valor
+                sesion._on_open()
+        elif estado == 'desconectado':
+            if sesion.is_connected:
+                sesion._on_close(None, None)
+        elif estado == 'sin_capacidades':
+            sesion._sin_capacidades(sesion._conexion)
+
+    # ── toques: lo mismo que hacen las pantallas ──
+    def tecnica(self, color, puntos):
+        self.sesion.enviar_punto(color, int(puntos))
+
+    def anular(self, color):
+        self.sesion.enviar_punto(color, None)
+
+    def incidencia(self):
+        self.sesion.enviar_incidencia()
+
+    def juez(self, numero):
+        numero = int(numero)
+        sesion = self.sesion
+        if numero in sesion.jueces_ocupados:
+            return
+        sesion.enviar_juez_seleccionado(numero)
+        sesion.juez_id = numero
+        sesion.ocupar_juez(numero)
+
+    def finalizar(self):
+        sesion = self.sesion
+        if not sesion.esperando_asignacion and sesion.esperar_siguiente_combate():
+            return
+        if sesion.juez_id:
+            sesion.liberar_juez(sesion.juez_id)
+            sesion.juez_id = None
+        sesion.finalizar_combate()
+
+    def _perder_juez(self, cuerpo):
+        self.sesion.liberar_juez(self.sesion.juez_id)
+        self.sesion.juez_id = None
+
+    # ── resultado ─────────────────────────────
+    def diferencias(self):
+        """[(op, esperados, obtenidos)] entre lo grabado y lo enviado ahora."""
+        grabados = [g for g in (_grabado(r) for r in self.registros if r.tipo == SALIDA) if g is not None]
+        obtenidos = []
+        for frame in self.motor.enviados:
+            # el formato del grabado correspondiente decide cómo se compara
+            referencia = grabados[len(obtenidos)] if len(obtenidos) < len(grabados) else None
+            o = _obtenido(frame, referencia)
+            if o is not None:
+                obtenidos.append(o)
+        comparador = difflib.SequenceMatcher(None, grabados, obtenidos, autojunk=False)
+        return [(op, grabados[i1:i2], obtenidos[j1:j2])
+                for op, i1, i2, j1, j2 in comparador.get_opcodes() if op != 'equal']
+
+    def reporte(self):
+        diferencias = self.diferencias()
+        lineas = [f"{self.aplicados} registros reproducidos, "
+                  f"{len(self.motor.enviados)} frames enviados"]
+        if not diferencias:
+            lineas.append("Sin diferencias con lo grabado")
+        for op, esperados, obtenidos in diferencias:
+            lineas.append(f"  {op}: grabado {esperados} / reproducido {obtenidos}")
+        return diferencias, lineas
+
+
+def reproducir(registros, velocidad=0.0):
+    """Reproduce sin UI; devuelve el Reproductor con la sesión y lo enviado."""
+    from bitacora import Bitacora
+    from sesion_juez import SesionJuez
+
+    carpeta = tempfile.mkdtemp(prefix='petotech-reproduccion-')
+    # bitácora aparte: ni lee ni pisa los pendientes reales del usuario
+    bitacora = Bitacora(os.path.join(carpeta, 'bitacora.db'))
+    try:
+        sesion = SesionJuez(backend='reproduccion', bitacora=bitacora,
+                            nombre_dispositivo='reproduccion')
+        reproductor = Reproductor(sesion, registros)
+        reproductor.preparar()
+        t0 = time.monotonic()
+        for r in registros:
+            if velocidad > 0:
+                espera = (r.t - registros[0].t) / velocidad - (time.monotonic() - t0)
+                if espera > 0:
+                    time.sleep(espera)
+            reproductor.aplicar(r)
+    finally:
+        # el escritor termina antes del borrado: si no, puede volver a crear la carpeta
+        bitacora.cerrar()
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return reproductor
+
+
+def _reproducir_ui(registros, velocidad, salir):
+    """La app Kivy completa con el motor de reproducción."""
+    from kivy.clock import Clock
+
+    import sesion_juez
+    import websocket_manager
+    sesion_juez.BACKEND = 'reproduccion'
+    carpeta = tempfile.mkdtemp(prefix='petotech-reproduccion-')
+    websocket_manager.RUTA_BITACORA = os.path.join(carpeta, 'bitacora.db')
+    from pantallainicialtel import PetoTechApp
+    from websocket_manager import WebSocketManager
+
+    ws = WebSocketManager()
+    app = PetoTechApp()
+    reproductor = ReproductorUI(ws, registros, app)
+    pendientes = list(registros)
+    inicio = {}
+
+    def paso(dt):
+        if not pendientes:
+            _, lineas = reproductor.reporte()
+            for linea in lineas:
+                print(linea)
+            if salir:
+                app.stop()
+            return
+        if not inicio:
+            reproductor.preparar()
+            inicio['t'] = time.monotonic()
+        if velocidad > 0:
+            transcurrido = (time.monotonic() - inicio['t']) * velocidad
+            while pendientes and pendientes[0].t - registros[0].t <= transcurrido:
+                reproductor.aplicar(pendientes.pop(0))
+        else:
+            reproductor.aplicar(pendientes.pop(0))  # un registro por frame
+        Clock.schedule_once(paso, 0)
+
+    # se empieza con la bienvenida ya pintada
+    Clock.schedule_once(paso, 1.0)
+    try:
+        app.run()
+    finally:
+        ws._bitacora.cerrar()
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return reproductor
+
+
+class ReproductorUI(Reproductor):
+    """Los toques se hacen sobre los botones de las pantallas."""
+
+    def __init__(self, sesion, registros, app):
+        self.app = app
+        super().__init__(sesion, registros)
+
+    def _perder_juez(self, cuerpo):
+        # con UI lo resuelve la pantalla de selección (WebSocketManager)
+        pass
+
+    def _pantalla(self, nombre):
+        return self.app.root.get_screen(nombre)
+
+    def _panel(self, color):
+        controles = self._pantalla('controles')
+        return controles.panel_azul if color.upper() == 'AZUL' else controles.panel_rojo
+
+    def estado(self, estado, valor):
+        if estado == 'pantalla':
+            self.app.root.current = valor
+            return
+        super().estado(estado, valor)
+
+    def tecnica(self, color, puntos):
+        puntos = int(puntos)
+        for boton in self._panel(color).botones:
+            if boton.puntos == puntos:
+                boton.t_toque = time.monotonic()
+                boton.trigger_action(0)
+                return
+        log.warning("Sin botón de %s puntos", puntos)
+
+    def anular(self, color):
+        self._panel(color).btn_anular.trigger_action(0)
+
+    def incidencia(self):
+        self._pantalla('controles').btn_alerta.trigger_action(0)
+
+    def juez(self, numero):
+        self._pantalla('selecjuez').botones[int(numero)].trigger_action(0)
+
+    def finalizar(self):
+        self._pantalla('controles').finalizar()
+
+
+def volcar(partes, salida=sys.stdout):
+    for n, registros in partes:
+        if not registros:
+            continue
+        t0 = registros[0].t
+        print(f"── ejecución {n} ({len(registros)} registros) ──", file=salida)
+        for r in registros:
+            datos = caja_negra.texto(r)
+            if r.binario:
+                try:
+                    datos = f"{protocolo.decodificar_binario(r.datos)} [{datos}]"
+                except (ValueError, struct.error):
+                    pass
+            if r.truncado:
+                datos += f"… ({r.largo} bytes)"
+            print(f"{r.seq:>8} {r.t - t0:>10.3f}s {caja_negra.NOMBRES[r.tipo]:<8} {datos}", file=salida)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce una grabación de la caja negra")
+    parser.add_argument("archivo", nargs="?", help="por defecto, la grabación de la app")
+    parser.add_argument("--sesion", type=int,
+                        help="ejecución de la app a usar (índice, negativo desde el final); "
+                             "por defecto la última, o todas con --volcar")
+    parser.add_argument("--volcar", action="store_true", help="imprime la línea de tiempo y termina")
+    parser.add_argument("--velocidad", type=float,
+                        help="1 = tiempo real, 0 = sin esperas (por defecto 0, o 1 con --ui)")
+    parser.add_argument("--ui", action="store_true", help="reproduce sobre la app Kivy")
+    parser.add_argument("--salir", action="store_true", help="con --ui, cierra la app al terminar")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    caja_negra.desactivar()
+    args.archivo = args.archivo or caja_negra.ruta_grabacion()
+    partes = list(enumerate(caja_negra.sesiones(caja_negra.leer(args.archivo))))
+    if not partes:
+        print(f"{args.archivo}: grabación vacía")
+        return 1
+    if args.sesion is not None:
+        try:
+            partes = [partes[args.sesion]]
+        except IndexError:
+            print(f"No existe la ejecución {args.sesion} (hay {len(partes)})")
+            return 1
+    if args.volcar:
+        volcar(partes)
+        return 0
+
+    registros = partes[-1][1]
+    if args.ui:
+        velocidad = 1.0 if args.velocidad is None else args.velocidad
+        reproductor = _reproducir_ui(registros, velocidad, args.salir)
+        diferencias, _ = reproductor.reporte()
+    else:
+        reproductor = reproducir(registros, args.velocidad or 0.0)
+        diferencias, lineas = reproductor.reporte()
+        for linea in lineas:
+            print(linea)
+    return 1 if diferencias else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
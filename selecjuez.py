@@ -16,6 +16,7 @@ from estilos import (
     TituloLabel, CopyrightLabel,
     separador_decorativo,
 )
+import caja_negra
 from websocket_manager import WebSocketManager
 
 
@@ -28,11 +29,12 @@ class BotonJuez(Button):
         self.text              = ''
         self.size_hint_y       = None
         self.height            = dp(72)
+        self._ocupado          = False
 
         with self.canvas.before:
-            Color(*C_AZUL)
+            self._color_bg = Color(*C_AZUL)
             self._bg = RoundedRectangle(pos=self.pos, size=self.size, radius=[dp(14)])
-            Color(*C_AZUL_HDR)
+            self._color_brd = Color(*C_AZUL_HDR)
             self._brd = Line(
                 rounded_rectangle=(self.x, self.y, self.width, self.height, dp(14)),
                 width=1.2,
@@ -66,14 +68,14 @@ class BotonJuez(Button):
         self._lbl_estado.text_size = self._lbl_estado.size
 
     def set_ocupado(self, ocupado):
+        # sólo se toca el canvas si el estado cambia; los Color ya existen
+        if ocupado == self._ocupado:
+            return
+        self._ocupado = ocupado
         self.disabled = ocupado
         self.opacity  = 0.45 if ocupado else 1.0
-        with self.canvas.before:
-            Color(*(C_GRIS if ocupado else C_AZUL))
-            self._bg.pos  = self.pos
-            self._bg.size = self.size
-            Color(*(C_GRIS_BRD if ocupado else C_AZUL_HDR))
-            self._brd.rounded_rectangle = (self.x, self.y, self.width, self.height, dp(14))
+        self._color_bg.rgba  = C_GRIS if ocupado else C_AZUL
+        self._color_brd.rgba = C_GRIS_BRD if ocupado else C_AZUL_HDR
         self._lbl_estado.text = 'Ocupado' if ocupado else 'Disponible'
 
 
@@ -133,45 +135,43 @@ class SeleccJuez(Screen):
 
         root.add_widget(main)
         self.add_widget(root)
-        Clock.schedule_interval(self.actualizar_estado, 0.3)
+        WebSocketManager().observar_ocupacion(self._on_ocupacion)
 
     def _upd_bg(self, *a):
         self._bg.pos  = self.pos
         self._bg.size = self.size
 
-    def actualizar_estado(self, *args):
-        ws = WebSocketManager()
+    def _on_ocupacion(self, ocupados):
         for i, btn in self.botones.items():
-            btn.set_ocupado(i in ws.jueces_ocupados)
+            btn.set_ocupado(i in ocupados)
+
+    def actualizar_estado(self, *args):
+        self._on_ocupacion(WebSocketManager().jueces_ocupados)
 
     def seleccionar_juez(self, numero):
+        caja_negra.grabar(caja_negra.TOQUE, f"juez:{numero}")
         ws = WebSocketManager()
         if numero in ws.jueces_ocupados:
             self._mostrar_error('[b]Este juez ya está ocupado[/b]')
             return
         ws.enviar_juez_seleccionado(numero)
         ws.juez_id = numero
-        ws.jueces_ocupados.add(numero)
-        self.actualizar_estado()
+        ws.ocupar_juez(numero)
         Clock.schedule_once(lambda dt: setattr(self.manager, 'current', 'controles'), 0.2)
 
     def mostrar_error_ocupado(self):
         ws = WebSocketManager()
-        if ws.juez_id in ws.jueces_ocupados:
-            ws.jueces_ocupados.discard(ws.juez_id)
+        ws.liberar_juez(ws.juez_id)
         ws.juez_id = None
         self._mostrar_error('[b]Este juez fue seleccionado por otro dispositivo[/b]')
-        self.actualizar_estado()
         if self.manager.current == 'controles':
             self.manager.current = 'selecjuez'
 
     def mostrar_error_posicion_invalida(self):
         ws = WebSocketManager()
-        if ws.juez_id in ws.jueces_ocupados:
-            ws.jueces_ocupados.discard(ws.juez_id)
+        ws.liberar_juez(ws.juez_id)
         ws.juez_id = None
         self._mostrar_error('[b]Posición inválida[/b]')
-        self.actualizar_estado()
 
     def _mostrar_error(self, texto):
         self.mensaje_error.text = texto
@@ -0,0 +1,634 @@
+"""
+Servidor local de referencia para PetoTech (asyncio, sin Kivy).
+
+Habla el mismo protocolo que el backend de producción, para probar y medir
+el cliente sin él:
+
+- ``POST /api/auth/juez/login`` con ``{"password"}`` contra la tabla
+  ``usuarios`` de petotech1.db; responde ``{"combateId"}``.
+- ``/ws/juez/{combateId}`` (o ``/ws/juez`` con ``X-Juez-Password``, que
+  responde ``COMBATE:{id}``): SELECCIONAR_JUEZ, PUNTUAR, INCIDENCIA (texto
+  o binario BIN1) con ACK y descarte de duplicados por (juez, dispositivo, seq),
+  RELOJ/RELOJ_OK y CAPACIDADES (BIN1, OCUP1, SIG1, SEQ1). Los puntos cuentan cuando hay mayoría
+  de jueces (consenso.py); cada juez recibe además su propio marcador
+  (``MARCADOR:{version},{ultimo_seq},{azul},{rojo}``, libro_puntos.py)
+  tras cada evento, al seleccionar juez y al resetear. La ocupación de
+  puestos viaja como ESTADO_JUECES completo o, a quien negoció OCUP1, como
+  deltas versionados ``OCUPACION:{version}:+{juez}|-{juez}`` con la
+  instantánea ``OCUPACION:{version}:[...]`` al negociar y ante
+  PEDIR_OCUPACION.
+- ``POST /api/combates/{id}/reset_puntos`` y ``.../reset_completo`` emiten
+  RESET_PUNTOS / RESET_COMPLETO; ``GET /api/combates/{id}`` da el estado.
+- ``POST /api/combates/{id}/asignar`` con ``{"dispositivo", "juez"}``
+  programa el siguiente combate de un dispositivo. Cuando éste envía
+  SIGUIENTE_COMBATE (negoció SIG1) se le mueve por la misma conexión:
+  ocupa el puesto y recibe ``ASIGNACION:{combateId},{juez}``.
+- ``/ws/canales``: conexión multiplexada de sólo lectura. Con
+  ``SUSCRIBIR:{combateId}`` recibe la ocupación, los puntos validados
+  (``TOTALES:{version},{azul},{rojo}``) y las difusiones de ese combate,
+  cada mensaje etiquetado como ``@{combateId}|...``.
+
+Cada difusión (OCUPACION, RESET_*, ...) se serializa a un frame una sola
+vez y el mismo bytes se escribe en todos los sockets del combate. Un cliente
+que no lee (buffer de salida lleno) se desconecta en vez de frenar al resto.
+
+Uso::
+
+    python servidor_local.py --host 0.0.0.0 --puerto 8080
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import struct
+import time
+
+import protocolo
+import ws_asyncio
+from consenso import ConsensoCombate
+from libro_puntos import LibroPuntos
+
+RUTA_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'petotech1.db')  # sólo lectura
+JUECES = (1, 2, 3)
+INACTIVIDAD_MAX = 10.0     # s sin recibir nada (el cliente late cada 0.5 s)
+BUFFER_SALIDA_MAX = 256 * 1024  # bytes pendientes antes de cortar a un cliente lento
+RECARGA_USUARIOS = 1.0     # s mínimos entre relecturas de usuarios
+CAPACIDADES_SERVIDOR = (protocolo.CAPACIDAD_BINARIA, protocolo.CAPACIDAD_OCUPACION,
+                        protocolo.CAPACIDAD_SIGUIENTE, protocolo.CAPACIDAD_SECUENCIA)
+
+log = logging.getLogger('petotech.servidor')
+
+
+class Cliente:
+    __slots__ = ('ws', 'dispositivo', 'combate', 'juez', 'binario', 'deltas', 'canales')
+
+    def __init__(self, ws, dispositivo, combate):
+        self.ws = ws
+        self.dispositivo = dispositivo
+        self.combate = combate
+        self.juez = None
+        self.binario = False
+        self.deltas = False  # recibe OCUPACION en lugar de ESTADO_JUECES
+        self.canales = set()  # combates suscritos (conexión multiplexada)
+
+    def escribir(self, frame):
+        transporte = self.ws.writer.transport
+        if transporte.get_write_buffer_size() > BUFFER_SALIDA_MAX:
+            log.warning("Cliente %s no lee, se desconecta", self.dispositivo)
+            self.ws.abortar()
+            return
+        self.ws.escribir(frame)
+
+    def enviar(self, mensaje):
+        self.escribir(ws_asyncio.frame_de(mensaje))
+
+
+class Combate:
+    __slots__ = ('id', 'clientes', 'suscriptores', 'jueces', 'version_ocupacion', 'ultimo_seq',
+                 'consenso', 'version_totales', 'marcadores', 'incidencias')
+
+    def __init__(self, combate_id):
+        self.id = combate_id
+        self.clientes = set()
+        self.suscriptores = set()  # conexiones multiplexadas que siguen el combate
+        self.jueces = {}        # juez -> Cliente que ocupa el puesto
+        self.version_ocupacion = 0  # +1 por cada puesto que se ocupa o libera
+        self.ultimo_seq = {}    # juez -> (dispositivo, última secuencia aplicada)
+        self.consenso = ConsensoCombate()  # puntos validados por mayoría
+        self.version_totales = 0
+        self.marcadores = {}    # juez -> LibroPuntos con lo que marcó ese juez
+        self.incidencias = 0
+
+    def marcador(self, juez):
+        libro = self.marcadores.get(juez)
+        if libro is None:
+            libro = self.marcadores[juez] = LibroPuntos()
+        return libro
+
+    def reclamar_secuencia(self, juez, dispositivo):
+        """
+        Otro dispositivo (u otra sesión, que se presenta con otro nombre)
+        ocupa el puesto: su secuencia empieza de nuevo en 1.
+        """
+        actual = self.ultimo_seq.get(juez)
+        if actual is not None and actual[0] != dispositivo:
+            self.ultimo_seq[juez] = (dispositivo, 0)
+            self.marcador(juez).ultimo_seq = 0
+
+    def trama_marcador(self, juez):
+        return protocolo.trama_marcador(*self.marcador(juez).instantanea())
+
+    def estado_jueces(self):
+        return f"{protocolo.ESTADO_JUECES}:{protocolo.formatear_estado_jueces(self.jueces)}"
+
+    def instantanea_ocupacion(self):
+        return protocolo.trama_ocupacion(self.version_ocupacion, frozenset(self.jueces))
+
+    def ocupacion_para(self, cliente):
+        return self.instantanea_ocupacion() if cliente.deltas else self.estado_jueces()
+
+    def trama_totales(self):
+        totales = self.consenso.totales
+        return protocolo.trama_totales(self.version_totales, *(totales[c] for c in protocolo.COLORES))
+
+    def resumen(self):
+        return {
+            'combateId': self.id,
+            'clientes': len(self.clientes),
+            'suscriptores': len(self.suscriptores),
+            'jueces': sorted(self.jueces),
+            'totales': dict(self.consenso.totales),
+            'puntos_validados': sum(1 for p in self.consenso.puntos if p.vigente),
+            'marcadores': {juez: libro.marcador() for juez, libro in sorted(self.marcadores.items())},
+            'incidencias': self.incidencias,
+        }
+
+
+class ServidorLocal:
+    def __init__(self, ruta_db=RUTA_DB, combates_abiertos=False):
+        self.ruta_db = ruta_db
+        # True (pruebas de carga): una contraseña desconocida abre su propio
+        # combate (combateId = contraseña) y /ws/juez/{id} acepta cualquier id
+        self.combates_abiertos = combates_abiertos
+        self.combates = {}
+        self.asignaciones = {}  # dispositivo -> (combateId, juez) de su siguiente combate
+        self.en_espera = {}     # dispositivo -> Cliente que terminó y espera asignación
+        self._usuarios = {}
+        self._t_carga = 0.0
+        self._cargar_usuarios()
+        self._respuestas = {
+            protocolo.SELECCIONAR_JUEZ: self._seleccionar_juez,
+            protocolo.PUNTUAR: self._evento,
+            protocolo.INCIDENCIA: self._evento,
+            protocolo.RELOJ: self._reloj,
+            protocolo.CAPACIDADES: self._capacidades,
+            protocolo.PEDIR_OCUPACION: self._pedir_ocupacion,
+            protocolo.SIGUIENTE_COMBATE: self._siguiente_combate,
+        }
+
+    # ── usuarios ─────────────────────────────
+    def _cargar_usuarios(self):
+        self._t_carga = time.monotonic()
+        try:
+            con = sqlite3.connect(f"file:{self.ruta_db}?mode=ro", uri=True)
+            try:
+                self._usuarios = dict(con.execute("SELECT contrasena, id FROM usuarios"))
+            finally:
+                con.close()
+        except sqlite3.Error as e:
+            log.error("No se pudo leer usuarios de %s: %s", self.ruta_db, e)
+
+    def autenticar(self, password):
+        """combateId de la contraseña o None."""
+        if password not in self._usuarios and time.monotonic() - self._t_carga > RECARGA_USUARIOS:
+            # usuarios dados de alta en caliente; sin releer en cada intento fallido
+            self._cargar_usuarios()
+        combate_id = self._usuarios.get(password)
+        if combate_id is None and self.combates_abiertos and password:
+            combate_id = password
+        if combate_id is not None:
+            self.combate(str(combate_id))
+        return combate_id
+
+    def combate(self, combate_id, crear=True):
+        combate = self.combates.get(combate_id)
+        if combate is None and crear:
+            combate = self.combates[combate_id] = Combate(combate_id)
+        return combate
+
+    # ── difusión ─────────────────────────────
+    def difundir(self, combate, mensaje):
+        """Serializa una vez y escribe el mismo frame en todos los clientes."""
+        frame = ws_asyncio.frame_de(mensaje)
+        for cliente in list(combate.clientes):
+            cliente.escribir(frame)
+        self.difundir_suscriptores(combate, mensaje)
+
+    def difundir_suscriptores(self, combate, mensaje):
+        if not combate.suscriptores:
+            return
+        frame = ws_asyncio.frame_de(protocolo.etiquetar(combate.id, mensaje))
+        for cliente in list(combate.suscriptores):
+            cliente.escribir(frame)
+
+    def difundir_totales(self, combate):
+        combate.version_totales += 1
+        self.difundir_suscriptores(combate, combate.trama_totales())
+
+    def difundir_ocupacion(self, combate, cambios):
+        """
+        ``cambios``: +juez / -juez ya aplicados a ``combate.jueces``. Cada uno
+        es una versión; los clientes sin OCUP1 reciben el ESTADO_JUECES final.
+        """
+        if not cambios:
+            return
+        deltas = []
+        for cambio in cambios:
+            combate.version_ocupacion += 1
+            deltas.append(protocolo.trama_ocupacion(combate.version_ocupacion, cambio))
+        completo = combate.estado_jueces()
+        self._escribir_ocupacion(combate.clientes, deltas, completo)
+        if combate.suscriptores:
+            self._escribir_ocupacion(combate.suscriptores,
+                                     [protocolo.etiquetar(combate.id, d) for d in deltas],
+                                     protocolo.etiquetar(combate.id, completo))
+
+    @staticmethod
+    def _escribir_ocupacion(destinos, deltas, completo):
+        """Cada forma se serializa una sola vez, y sólo si alguien la recibe."""
+        frames = frame_completo = None
+        for cliente in list(destinos):
+            if cliente.deltas:
+                if frames is None:
+                    frames = [ws_asyncio.frame_de(d) for d in deltas]
+                for frame in frames:
+                    cliente.escribir(frame)
+            else:
+                if frame_completo is None:
+                    frame_completo = ws_asyncio.frame_de(completo)
+                cliente.escribir(frame_completo)
+
+    def resetear(self, combate_id, completo=False):
+        combate = self.combate(combate_id, crear=False)
+        if combate is None:
+            return False
+        combate.consenso.reiniciar()
+        for libro in combate.marcadores.values():
+            libro.resetear()
+        if completo:
+            combate.incidencias = 0
+        self.difundir(combate, protocolo.RESET_COMPLETO if completo else protocolo.RESET_PUNTOS)
+        for juez, cliente in combate.jueces.items():
+            cliente.enviar(combate.trama_marcador(juez))
+        self.difundir_totales(combate)
+        return True
+
+    # ── relevo al siguiente combate ──────────
+    def asignar(self, combate_id, dispositivo, juez):
+        """
+        Programa el siguiente combate del dispositivo; si ya está esperando
+        se le mueve en el acto. Devuelve False si el puesto está ocupado.
+        """
+        combate = self.combate(combate_id)
+        actual = combate.jueces.get(juez)
+        if actual is not None and actual.dispositivo != dispositivo:
+            return False
+        for otro, asignacion in self.asignaciones.items():
+            if asignacion == (combate_id, juez) and otro != dispositivo:
+                return False  # puesto reservado para otro dispositivo
+        self.asignaciones[dispositivo] = (combate_id, juez)
+        cliente = self.en_espera.get(dispositivo)
+        if cliente is not None:
+            self._mover(cliente)
+        return True
+
+    def _siguiente_combate(self, cliente, tipo, cuerpo):
+        combate = cliente.combate
+        if cliente.juez is not None:
+            if combate.jueces.get(cliente.juez) is cliente:
+                del combate.jueces[cliente.juez]
+                self.difundir_ocupacion(combate, [-cliente.juez])
+            cliente.juez = None
+        self.en_espera[cliente.dispositivo] = cliente
+        if cliente.dispositivo in self.asignaciones:
+            self._mover(cliente)
+
+    def _mover(self, cliente):
+        combate_id, juez = self.asignaciones[cliente.dispositivo]
+        destino = self.combate(combate_id)
+        actual = destino.jueces.get(juez)
+        if actual is not None and actual.dispositivo != cliente.dispositivo:
+            log.warning("Puesto %s de %s ocupado: %s sigue esperando",
+                        juez, combate_id, cliente.dispositivo)
+            return
+        del self.asignaciones[cliente.dispositivo]
+        del self.en_espera[cliente.dispositivo]
+        cliente.combate.clientes.discard(cliente)
+        if actual is not None:
+            # socket viejo del mismo dispositivo
+            actual.juez = None
+            actual.ws.abortar()
+        cliente.combate = destino
+        cliente.juez = juez
+        destino.jueces[juez] = cliente
+        destino.reclamar_secuencia(juez, cliente.dispositivo)
+        self.difundir_ocupacion(destino, [] if actual is not None else [juez])
+        destino.clientes.add(cliente)
+        log.info("%s pasa al combate %s como juez %s", cliente.dispositivo, combate_id, juez)
+        cliente.enviar(f"{protocolo.ASIGNACION}:{combate_id},{juez}")
+        cliente.enviar(destino.ocupacion_para(cliente))
+        cliente.enviar(destino.trama_marcador(juez))
+
+    # ── HTTP ─────────────────────────────────
+    async def atender(self, reader, writer):
+        try:
+            while True:
+                try:
+                    linea, cabeceras = await ws_asyncio.leer_cabeceras(reader)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        ConnectionError, ValueError):
+                    return
+                metodo, _, resto = linea.partition(" ")
+                ruta = resto.split(" ", 1)[0].split("?", 1)[0].rstrip("/") or "/"
+                if ws_asyncio.es_upgrade(cabeceras):
+                    await self._websocket(reader, writer, ruta, cabeceras)
+                    return
+                cuerpo = await ws_asyncio.leer_cuerpo(reader, cabeceras)
+                writer.write(self._http(metodo, ruta, cuerpo))
+                await writer.drain()
+        except Exception as e:
+            log.error("Error atendiendo conexión: %s", e)
+        finally:
+            # close() vacía lo pendiente (p. ej. un 401 al upgrade) antes de cerrar
+            writer.close()
+
+    def _http(self, metodo, ruta, cuerpo):
+        partes = ruta.strip("/").split("/")
+        if metodo == "HEAD" or (metodo == "GET" and ruta == "/"):
+            return ws_asyncio.respuesta_http(200)
+        if metodo == "POST" and "/" + "/".join(partes) == "/api/auth/juez/login":
+            try:
+                password = str(json.loads(cuerpo or b"{}").get("password", ""))
+            except (ValueError, AttributeError):
+                return ws_asyncio.respuesta_http(400, {'message': "Petición inválida"})
+            combate_id = self.autenticar(password)
+            if combate_id is None:
+                return ws_asyncio.respuesta_http(401, {'message': "Contraseña incorrecta"})
+            return ws_asyncio.respuesta_http(200, {'combateId': combate_id})
+        if len(partes) >= 3 and partes[:2] == ["api", "combates"]:
+            if metodo == "POST" and len(partes) == 4 and partes[3] == "asignar":
+                return self._http_asignar(partes[2], cuerpo)
+            combate = self.combate(partes[2], crear=False)
+            if combate is None:
+                return ws_asyncio.respuesta_http(404, {'message': "Combate inexistente"})
+            if metodo == "GET" and len(partes) == 3:
+                return ws_asyncio.respuesta_http(200, combate.resumen())
+            if metodo == "POST" and len(partes) == 4 and partes[3] in ("reset_puntos", "reset_completo"):
+                self.resetear(combate.id, completo=partes[3] == "reset_completo")
+                return ws_asyncio.respuesta_http(200, combate.resumen())
+        return ws_asyncio.respuesta_http(404, {'message': "No encontrado"})
+
+    def _http_asignar(self, combate_id, cuerpo):
+        try:
+            datos = json.loads(cuerpo or b"{}")
+            dispositivo = str(datos["dispositivo"])
+            juez = int(datos["juez"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return ws_asyncio.respuesta_http(400, {'message': "Petición inválida"})
+        if juez not in JUECES:
+            return ws_asyncio.respuesta_http(400, {'message': "Juez inválido"})
+        if not self._combate_conocido(combate_id):
+            return ws_asyncio.respuesta_http(404, {'message': "Combate inexistente"})
+        if not self.asignar(combate_id, dispositivo, juez):
+            return ws_asyncio.respuesta_http(409, {'message': "Puesto ocupado"})
+        return ws_asyncio.respuesta_http(200, {'combateId': combate_id, 'juez': juez,
+                                               'pendiente': dispositivo in self.asignaciones})
+
+    def _combate_conocido(self, combate_id):
+        return (self.combates_abiertos or combate_id in self.combates
+                or combate_id in {str(c) for c in self._usuarios.values()})
+
+    # ── WebSocket ────────────────────────────
+    async def _websocket(self, reader, writer, ruta, cabeceras):
+        partes = ruta.strip("/").split("/")
+        if partes == ["ws", "canales"]:
+            await self._websocket_canales(reader, writer, cabeceras)
+            return
+        if partes[:2] != ["ws", "juez"] or len(partes) > 3:
+            writer.write(ws_asyncio.respuesta_http(404, cerrar=True))
+            return
+        anunciar = False
+        if len(partes) == 3:
+            combate_id = partes[2]
+            if self.combate(combate_id, crear=self.combates_abiertos) is None:
+                writer.write(ws_asyncio.respuesta_http(404, {'message': "Combate inexistente"}, cerrar=True))
+                return
+        else:
+            # autenticación en el handshake
+            combate_id = self.autenticar(cabeceras.get("x-juez-password", ""))
+            if combate_id is None:
+                writer.write(ws_asyncio.respuesta_http(401, {'message': "Contraseña incorrecta"}, cerrar=True))
+                return
+            combate_id = str(combate_id)
+            anunciar = True
+
+        combate = self.combate(combate_id)
+        ws = ws_asyncio.aceptar(reader, writer, cabeceras)
+        cliente = Cliente(ws, cabeceras.get("x-dispositivo", "?"), combate)
+        combate.clientes.add(cliente)
+        if anunciar:
+            cliente.enviar(f"{protocolo.COMBATE}:{combate_id}")
+        cliente.enviar(combate.estado_jueces())
+        try:
+            while True:
+                mensaje = await asyncio.wait_for(ws.recibir(), INACTIVIDAD_MAX)
+                self._recibido(cliente, mensaje)
+        except (ws_asyncio.ConexionCerrada, asyncio.TimeoutError):
+            pass
+        finally:
+            # el cliente pudo pasar a otro combate por la misma conexión
+            combate = cliente.combate
+            combate.clientes.discard(cliente)
+            if self.en_espera.get(cliente.dispositivo) is cliente:
+                del self.en_espera[cliente.dispositivo]
+            if cliente.juez is not None and combate.jueces.get(cliente.juez) is cliente:
+                del combate.jueces[cliente.juez]
+                self.difundir_ocupacion(combate, [-cliente.juez])
+
+    async def _websocket_canales(self, reader, writer, cabeceras):
+        ws = ws_asyncio.aceptar(reader, writer, cabeceras)
+        cliente = Cliente(ws, cabeceras.get("x-dispositivo", "?"), None)
+        try:
+            while True:
+                mensaje = await asyncio.wait_for(ws.recibir(), INACTIVIDAD_MAX)
+                if isinstance(mensaje, str):
+                    self._recibido_canales(cliente, mensaje)
+        except (ws_asyncio.ConexionCerrada, asyncio.TimeoutError):
+            pass
+        finally:
+            for combate in cliente.canales:
+                combate.suscriptores.discard(cliente)
+
+    def _recibido_canales(self, cliente, mensaje):
+        combate_id, mensaje = protocolo.separar_canal(mensaje.strip())
+        tipo, cuerpo = protocolo.dividir(mensaje)
+        if combate_id is not None:
+            combate = self.combates.get(combate_id)
+            if tipo == protocolo.PEDIR_OCUPACION and combate in cliente.canales:
+                cliente.enviar(protocolo.etiquetar(combate_id, combate.ocupacion_para(cliente)))
+            else:
+                log.warning("Mensaje de canal inválido de %s: %r", cliente.dispositivo, mensaje)
+        elif tipo == protocolo.SUSCRIBIR:
+            self._suscribir(cliente, cuerpo.strip())
+        elif tipo == protocolo.DESUSCRIBIR:
+            combate = self.combates.get(cuerpo.strip())
+            if combate is not None:
+                combate.suscriptores.discard(cliente)
+                cliente.canales.discard(combate)
+        elif tipo == protocolo.RELOJ:
+            self._reloj(cliente, tipo, cuerpo)
+        elif tipo == protocolo.CAPACIDADES:
+            self._capacidades(cliente, tipo, cuerpo)
+        else:
+            log.warning("Mensaje desconocido de %s: %s", cliente.dispositivo, tipo)
+
+    def _suscribir(self, cliente, combate_id):
+        if not combate_id or not self._combate_conocido(combate_id):
+            cliente.enviar(f"{protocolo.DESUSCRIBIR}:{combate_id}")
+            return
+        combate = self.combate(combate_id)
+        combate.suscriptores.add(cliente)
+        cliente.canales.add(combate)
+        cliente.enviar(protocolo.etiquetar(combate_id, combate.ocupacion_para(cliente)))
+        cliente.enviar(protocolo.etiquetar(combate_id, combate.trama_totales()))
+
+    def _recibido(self, cliente, mensaje):
+        if isinstance(mensaje, bytes):
+            try:
+                tipo, puntos, color, seq, t_ms = protocolo.decodificar_binario(mensaje)
+            except (ValueError, IndexError, struct.error) as e:
+                log.warning("Frame binario inválido de %s: %s", cliente.dispositivo, e)
+                cliente.enviar(protocolo.POSICION_INVALIDA)
+                return
+            self._aplicar(cliente, tipo, puntos, color, seq, t_ms)
+            return
+        tipo, cuerpo = protocolo.dividir(mensaje.strip())
+        respuesta = self._respuestas.get(tipo)
+        if respuesta is None:
+            log.warning("Mensaje desconocido de %s: %s", cliente.dispositivo, tipo)
+            return
+        try:
+            respuesta(cliente, tipo, cuerpo)
+        except (ValueError, IndexError) as e:
+            # se responde en lugar de dejar caer la conexión
+            log.warning("Mensaje inválido de %s: %r (%s)", cliente.dispositivo, mensaje, e)
+            cliente.enviar(protocolo.POSICION_INVALIDA)
+
+    def _seleccionar_juez(self, cliente, tipo, cuerpo):
+        juez = protocolo.parsear_entero(cuerpo)
+        combate = cliente.combate
+        if juez not in JUECES:
+            cliente.enviar(protocolo.POSICION_INVALIDA)
+            return
+        actual = combate.jueces.get(juez)
+        if actual is not None and actual is not cliente:
+            if actual.dispositivo != cliente.dispositivo:
+                cliente.enviar(protocolo.JUEZ_OCUPADO)
+                return
+            # el mismo dispositivo reconectó antes de que cayera el socket viejo
+            actual.juez = None
+            actual.ws.abortar()
+        cambios = []
+        if cliente.juez is not None and cliente.juez != juez:
+            if combate.jueces.get(cliente.juez) is cliente:
+                del combate.jueces[cliente.juez]
+                cambios.append(-cliente.juez)
+        if actual is None:
+            cambios.append(juez)
+        cliente.juez = juez
+        combate.jueces[juez] = cliente
+        combate.reclamar_secuencia(juez, cliente.dispositivo)
+        self.difundir_ocupacion(combate, cambios)
+        # al (re)ocupar el puesto el juez recibe su marcador actual
+        cliente.enviar(combate.trama_marcador(juez))
+
+    def _evento(self, cliente, tipo, cuerpo):
+        puntos, color, seq, t_ms = protocolo.parsear_evento(tipo, cuerpo)
+        self._aplicar(cliente, tipo, puntos, color, seq, t_ms)
+
+    def _aplicar(self, cliente, tipo, puntos, color, seq, t_ms):
+        juez = cliente.juez
+        if juez is None:
+            cliente.enviar(protocolo.POSICION_INVALIDA)
+            return
+        combate = cliente.combate
+        if seq is not None:
+            dispositivo, ultimo = combate.ultimo_seq.get(juez, (cliente.dispositivo, 0))
+            if dispositivo == cliente.dispositivo and seq <= ultimo:
+                # duplicado (reenvío tras reconectar): se vuelve a confirmar y el
+                # marcador corrige lo que el cliente haya anotado
+                cliente.enviar(f"{protocolo.ACK}:{seq}")
+                cliente.enviar(combate.trama_marcador(juez))
+                return
+        if tipo == protocolo.PUNTUAR:
+            if t_ms is None:
+                # cliente sin sello de tiempo: se usa la llegada
+                t_ms = int(time.time() * 1000)
+            try:
+                cambios = combate.consenso.registrar(juez, color, puntos, t_ms)
+            except (ValueError, KeyError, TypeError) as e:
+                # rechazado: la secuencia no avanza y no hay ACK
+                log.warning("Evento rechazado de %s: %s", cliente.dispositivo, e)
+                cliente.enviar(protocolo.POSICION_INVALIDA)
+                return
+            for cambio, punto in cambios:
+                log.debug("Combate %s: %s %r", combate.id, cambio, punto)
+            combate.marcador(juez).registrar(seq, color, puntos)
+            if cambios:
+                self.difundir_totales(combate)
+        else:
+            combate.incidencias += 1
+            self.difundir(combate, f"{protocolo.INCIDENCIA_REGISTRADA}:{juez}")
+        if seq is not None:
+            # sólo lo aplicado cuenta para descartar duplicados
+            combate.ultimo_seq[juez] = (cliente.dispositivo, seq)
+            cliente.enviar(f"{protocolo.ACK}:{seq}")
+        if tipo == protocolo.PUNTUAR:
+            cliente.enviar(combate.trama_marcador(juez))
+
+    def _reloj(self, cliente, tipo, cuerpo):
+        cliente.enviar(f"{protocolo.RELOJ_OK}:{cuerpo.strip()},{time.time() * 1000:.0f}")
+
+    def _capacidades(self, cliente, tipo, cuerpo):
+        pedidas = [c.strip() for c in cuerpo.split(",")]
+        aceptadas = [c for c in pedidas if c in CAPACIDADES_SERVIDOR]
+        if not aceptadas:
+            return
+        cliente.binario = protocolo.CAPACIDAD_BINARIA in aceptadas
+        cliente.deltas = protocolo.CAPACIDAD_OCUPACION in aceptadas
+        cliente.enviar(f"{protocolo.CAPACIDADES}:{','.join(aceptadas)}")
+        if cliente.deltas:
+            # punto de partida de los deltas
+            if cliente.combate is not None:
+                cliente.enviar(cliente.combate.instantanea_ocupacion())
+            for combate in cliente.canales:
+                cliente.enviar(protocolo.etiquetar(combate.id, combate.instantanea_ocupacion()))
+
+    def _pedir_ocupacion(self, cliente, tipo, cuerpo):
+        cliente.enviar(cliente.combate.ocupacion_para(cliente))
+
+    async def iniciar(self, host="0.0.0.0", puerto=8080):
+        # backlog amplio: miles de jueces reconectando a la vez
+        return await asyncio.start_server(self.atender, host, puerto, backlog=4096)
+
+
+async def _main(args):
+    servidor = ServidorLocal(args.db, combates_abiertos=args.combates_abiertos)
+    tcp = await servidor.iniciar(args.host, args.puerto)
+    log.info("Servidor local en %s:%s (%d usuarios)", args.host, args.puerto, len(servidor._usuarios))
+    async with tcp:
+        await tcp.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de referencia de PetoTech")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--db", default=RUTA_DB, help="base con la tabla usuarios")
+    parser.add_argument("--combates-abiertos", action="store_true",
+                        help="cada contraseña desconocida abre su combate y se acepta "
+                             "cualquier combateId (pruebas de carga)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
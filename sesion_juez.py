@@ -0,0 +1,1051 @@
+"""
+Núcleo de la sesión de un juez, sin Kivy.
+
+Login, WebSocket (a través de un motor de conexión), bandeja de salida con
+bitácora (secuencia y ACK si el servidor acepta SEQ1), latido y sincronía de
+reloj, ocupación de puestos. La UI se
+engancha con observadores; ``websocket_manager.WebSocketManager`` es el
+adaptador de Kivy. Sin adaptador se puede usar desde bots, CLIs y
+benchmarks. ``SesionBase`` reúne la conexión compartida con la sesión
+multiplexada, sin bitácora ni secuencia::
+
+    sesion = SesionJuez(servidor="127.0.0.1", puerto="8080")
+    sesion.observar(protocolo.RESET_COMPLETO, lambda cuerpo: ...)
+    sesion.login_and_connect("123", on_success=..., on_error=...)
+
+Por defecto los callbacks corren en el hilo del motor; ``programar`` y
+``disparar_bomba`` permiten llevarlos a otro hilo (el de la UI).
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import caja_negra
+import protocolo
+from bitacora import Bitacora
+from canal_combate import CAMBIO_OCUPACION, CanalCombate
+from libro_puntos import LibroPuntos
+
+SERVER_IP = "192.168.100.8" # Cambiar por la IP del servidor
+SERVER_PORT = "8080"
+WS_ENDPOINT = "/ws/juez"
+LOGIN_API_ENDPOINT = "/api/auth/juez/login"
+# True: la contraseña viaja en el upgrade del WebSocket (X-Juez-Password) y el
+# servidor responde COMBATE:{id}; se omite el POST de login.
+AUTH_EN_HANDSHAKE = False
+# Ofrecer framing binario al servidor; sólo se usa si éste lo acepta.
+OFRECER_BINARIO = False
+# Pedir deltas de ocupación versionados (OCUPACION) en lugar de ESTADO_JUECES
+# completos; un servidor que no los conoce sigue mandando ESTADO_JUECES.
+OFRECER_DELTAS_OCUPACION = True
+# Al finalizar, quedar conectado a la espera del siguiente combate (ASIGNACION)
+# si el servidor lo acepta; si no, se cierra la sesión como siempre.
+OFRECER_SIGUIENTE_COMBATE = True
+# Numerar los eventos (seq, t_ms), esperar ACK y reenviar los no confirmados
+# si el servidor acepta SEQ1; con uno que no lo conoce cada evento se envía
+# una vez, sin campos extra (lo que no pudo salir espera igual en la bandeja).
+OFRECER_SECUENCIA = True
+ESPERA_CAPACIDADES = 1.0  # s sin respuesta a CAPACIDADES: servidor sin negociación
+MAX_PENDIENTES = 512  # eventos sin ACK que se conservan para reenviar
+# aviso local (observar): la bandeja llena descartó un evento; cuerpo = la trama
+EVENTO_DESCARTADO = "descartado"
+RECONEXION_BASE = 0.1  # s, espera antes del primer reintento
+RECONEXION_MAX = 5.0   # s, tope de la espera entre reintentos
+MUESTRAS_ESPERA = 256  # esperas en cola que se guardan para estadísticas
+LATIDO_INTERVALO = 0.5     # s entre latidos RELOJ/RELOJ_OK (también sincronizan el reloj)
+LATIDO_TIMEOUT = 2.0       # s sin recibir nada para dar el enlace por muerto (si responde RELOJ)
+# ping/pong del WebSocket: detecta el peer muerto también con un servidor sin RELOJ
+# (~1.5 s) y, si éste no responde RELOJ, da las muestras de RTT del enlace
+# (websocket-client revisa el pong cada PING_WS_TIMEOUT: el intervalo debe ser al menos el doble)
+PING_WS_INTERVALO = 1.0    # s entre pings
+PING_WS_TIMEOUT = 0.5      # s de espera del pong
+SINCRONIA_MUESTRAS = 8     # se usa la muestra de menor RTT de las últimas N
+VENTANA_RTT = 120          # muestras de RTT para percentiles (~1 min)
+# calidad del enlace según el p95 del RTT (ms)
+UMBRAL_ENLACE_BUENO = 100
+UMBRAL_ENLACE_REGULAR = 300
+# Motor de conexión: 'hilos' (websocket-client + requests) o 'asyncio'
+# (un solo hilo con event loop); 'reproduccion' lo usa reproducir.py.
+# Se elige al arrancar.
+BACKEND = os.environ.get('PETOTECH_BACKEND', 'hilos')
+# Mensajes que son una instantánea completa: en un mismo lote sólo cuenta el último
+# (de cada combate, en una conexión multiplexada)
+COALESCIBLES = frozenset((CAMBIO_OCUPACION, protocolo.RESET_PUNTOS, protocolo.RESET_COMPLETO,
+                          protocolo.MARCADOR, protocolo.TOTALES))
+
+log = logging.getLogger('petotech.sesion')
+
+
+def _llamar_ya(funcion):
+    funcion()
+
+
+def crear_motor(sesion, backend=None, loop=None):
+    """Instancia el motor de conexión elegido (BACKEND por defecto)."""
+    backend = backend or BACKEND
+    if backend == 'asyncio':
+        from motor_asyncio import MotorAsyncio
+        motor = MotorAsyncio(sesion, LATIDO_INTERVALO, (PING_WS_INTERVALO, PING_WS_TIMEOUT), loop=loop)
+    elif backend == 'reproduccion':
+        # sin red: reproducir.py alimenta la sesión desde una grabación
+        from motor_reproduccion import MotorReproduccion
+        motor = MotorReproduccion(sesion)
+    else:
+        if backend != 'hilos':
+            log.warning("Backend desconocido '%s', se usa 'hilos'", backend)
+        from motor_hilos import MotorHilos
+        motor = MotorHilos(sesion, LATIDO_INTERVALO, (PING_WS_INTERVALO, PING_WS_TIMEOUT))
+    log.info("Motor de conexión: %s", motor.nombre)
+    return motor
+
+
+class SesionBase:
+    """
+    Conexión al servidor sin puesto de juez: motor, latido y sincronía de
+    reloj, reconexión, calidad del enlace y bomba de entrada con sus
+    observadores. SesionJuez y SesionMultiplex la especializan; ésta no
+    abre bitácora ni numera eventos.
+    """
+    def __init__(self, servidor=SERVER_IP, puerto=SERVER_PORT, backend=None, loop=None,
+                 nombre_dispositivo=None, programar=None, disparar_bomba=None,
+                 ofrecer_deltas_ocupacion=OFRECER_DELTAS_OCUPACION):
+        self.servidor = servidor
+        self.puerto = puerto
+        self.ofrecer_deltas_ocupacion = ofrecer_deltas_ocupacion
+        # programar(f): ejecuta f en el hilo de la UI (por defecto, en el acto)
+        self._programar = programar or _llamar_ya
+        self.nombre_dispositivo = nombre_dispositivo or f"Celular_{str(uuid.uuid4())[:8]}"
+        self.is_connected = False
+        # reloj: offset (ms) que lleva time.monotonic() local al reloj del servidor
+        self._muestras_reloj = deque(maxlen=SINCRONIA_MUESTRAS)
+        self.offset_reloj = None
+        self.rtt_reloj = None
+        self.rtts = deque(maxlen=VENTANA_RTT)
+        self._t_ultima_recepcion = 0.0
+        self._reloj_activo = False  # el servidor respondió RELOJ en esta conexión
+        self.enlaces_caidos = 0
+        self._enlace = ('sin conexión', None)
+        self._observadores_enlace = []
+        self._reconectar = False
+        self._intento = 0
+        self._t_caida = None
+        self.reconexiones = 0
+        self.reintentos_fallidos = 0
+        self.tiempos_recuperacion = deque(maxlen=50)
+        self._conexion = 0  # se incrementa en cada on_open
+        self.esperas_cola = deque(maxlen=MUESTRAS_ESPERA)
+        self._entrada = deque()
+        self._lock_entrada = threading.Lock()
+        self._observadores = {}  # tipo de mensaje -> [callback(cuerpo)]
+        self._callbacks_conexion = (None, None)
+        # disparar_bomba(): pide un _drenar_entrada (por defecto, en el acto)
+        self._disparar_bomba = disparar_bomba or self._drenar_entrada
+        self._manejadores = {}
+        # mensajes que no tocan la UI: se procesan en el hilo del socket
+        self._manejadores_socket = {
+            protocolo.RELOJ_OK: self._manejar_reloj_ok,
+            protocolo.CAPACIDADES: self._manejar_capacidades,
+        }
+        self._motor = crear_motor(self, backend, loop)
+
+    def conectar(self, on_success=None, on_error=None):
+        """Abre la conexión sin login previo."""
+        if self.is_connected:
+            if on_success:
+                on_success()
+            return
+        self._callbacks_conexion = (on_success, on_error)
+        self._intento = 0
+        # sin login previo: se reintenta también si el primer intento falla
+        self._reconectar = True
+        self._motor.conectar()
+
+    def _destino_ws(self):
+        """URL y cabeceras del upgrade; el motor las pide en cada intento."""
+        raise NotImplementedError
+
+    def _debe_reconectar(self):
+        return self._reconectar
+
+    def _espera_reconexion(self):
+        """
+        Backoff exponencial con jitter antes del siguiente intento; el motor
+        reconecta con el mismo destino (_destino_ws) y nombre_dispositivo.
+        """
+        # los callbacks de login sólo aplican a la primera conexión
+        self._callbacks_conexion = (None, None)
+        if self._t_caida is None:
+            # la conexión estuvo abierta: empieza una caída nueva
+            self._t_caida = time.monotonic()
+            self._intento = 0
+        else:
+            self.reintentos_fallidos += 1
+        espera = min(RECONEXION_MAX, RECONEXION_BASE * (2 ** self._intento))
+        espera *= random.uniform(0.5, 1.0)
+        self._intento += 1
+        log.info("Reconectando en %.2fs (intento %d)", espera, self._intento)
+        return espera
+
+    def disconnect(self):
+        self._reconectar = False
+        self._motor.detener()
+
+    def _send_message(self, message):
+        """
+        Encola el mensaje para el motor y regresa de inmediato;
+        el hilo de la UI nunca espera al socket.
+        """
+        if self.is_connected:
+            caja_negra.grabar(caja_negra.SALIDA, message)
+            self._motor.enviar(self._conexion, message)
+            return True
+        log.error("No conectado al WebSocket")
+        return False
+
+    def _conexion_vigente(self, conexion):
+        return self.is_connected and conexion == self._conexion
+
+    def estadisticas_cola(self):
+        esperas = list(self.esperas_cola)
+        return {
+            'profundidad': self._motor.profundidad_cola(),
+            'espera_ultima': esperas[-1] if esperas else None,
+            'espera_media': sum(esperas) / len(esperas) if esperas else None,
+            'espera_max': max(esperas) if esperas else None,
+        }
+
+    # ── sincronización de reloj (estilo NTP) ──
+    def _latido(self):
+        """
+        El motor lo llama cada LATIDO_INTERVALO: envía RELOJ:{t0} mientras
+        haya conexión. Si el servidor ya respondió algún RELOJ y en
+        LATIDO_TIMEOUT no llega nada, la conexión TCP se da por medio abierta
+        y se corta para que el motor reconecte. Un servidor sin RELOJ no
+        responde nunca: ahí el peer muerto lo detecta el ping del WebSocket.
+        """
+        if not self.is_connected:
+            self._actualizar_enlace()
+            return
+        silencio = time.monotonic() - self._t_ultima_recepcion
+        if self._reloj_activo and silencio > LATIDO_TIMEOUT:
+            log.warning("Sin respuesta del servidor en %.1fs, se corta el enlace", silencio)
+            self.enlaces_caidos += 1
+            self._motor.cortar()
+            return
+        self._send_message(f"{protocolo.RELOJ}:{time.monotonic() * 1000:.0f}")
+        self._actualizar_enlace()
+
+    def percentiles_rtt(self):
+        """p50/p95/p99 del RTT (ms) en la ventana reciente; None sin muestras."""
+        muestras = sorted(self.rtts)
+        if not muestras:
+            return {'p50': None, 'p95': None, 'p99': None, 'muestras': 0}
+        ultimo = len(muestras) - 1
+        return {
+            'p50': muestras[round(ultimo * 0.50)],
+            'p95': muestras[round(ultimo * 0.95)],
+            'p99': muestras[round(ultimo * 0.99)],
+            'muestras': len(muestras),
+        }
+
+    def calidad_enlace(self):
+        if not self.is_connected:
+            return 'sin conexión', None
+        p = self.percentiles_rtt()
+        if p['p95'] is None:
+            return 'buena', None
+        silencio = time.monotonic() - self._t_ultima_recepcion
+        if self._reloj_activo:
+            limites = (LATIDO_INTERVALO * 2, LATIDO_TIMEOUT / 2)
+        else:
+            # sin RELOJ lo que llega seguro es el pong, uno por PING_WS_INTERVALO
+            limites = (PING_WS_INTERVALO + PING_WS_TIMEOUT,) * 2
+        if p['p95'] < UMBRAL_ENLACE_BUENO and silencio < limites[0]:
+            calidad = 'buena'
+        elif p['p95'] < UMBRAL_ENLACE_REGULAR and silencio < limites[1]:
+            calidad = 'regular'
+        else:
+            calidad = 'mala'
+        return calidad, p['p50']
+
+    def enlace_actual(self):
+        """Último (calidad, rtt_ms) publicado a los observadores."""
+        return self._enlace
+
+    def observar_enlace(self, callback):
+        """callback(calidad, rtt_p50_ms) en el hilo de la UI cuando cambia el enlace."""
+        self._observadores_enlace.append(callback)
+
+    def _actualizar_enlace(self):
+        calidad, rtt = self.calidad_enlace()
+        # el RTT se redondea a 10 ms para no redibujar por ruido
+        enlace = (calidad, None if rtt is None else int(rtt // 10 * 10))
+        if enlace == self._enlace:
+            return
+        self._enlace = enlace
+        caja_negra.grabar(caja_negra.ESTADO, f"enlace:{calidad}")
+        self._programar(lambda: self._publicar_enlace(*enlace))
+
+    def _publicar_enlace(self, calidad, rtt):
+        for callback in list(self._observadores_enlace):
+            callback(calidad, rtt)
+
+    def _manejar_reloj_ok(self, cuerpo):
+        """
+        RELOJ_OK:{t0},{t_servidor}: t0 es el eco del ping, t_servidor el
+        reloj del servidor en ms. Se asume que el servidor respondió a mitad
+        del viaje de ida y vuelta.
+        """
+        t3 = time.monotonic() * 1000
+        try:
+            t0, t_servidor = (float(x) for x in cuerpo.split(","))
+        except ValueError:
+            return
+        rtt = t3 - t0
+        if rtt < 0:
+            return
+        self._reloj_activo = True
+        self.rtts.append(rtt)
+        self._muestras_reloj.append((rtt, t_servidor - (t0 + t3) / 2))
+        self.rtt_reloj, self.offset_reloj = min(self._muestras_reloj)
+
+    def tiempo_servidor_ms(self, t_monotonic=None):
+        """Convierte un instante de time.monotonic() al reloj del servidor (ms)."""
+        if t_monotonic is None:
+            t_monotonic = time.monotonic()
+        offset = self.offset_reloj
+        if offset is None:
+            # sin sincronía todavía: se aproxima con el reloj de pared local
+            offset = (time.time() - time.monotonic()) * 1000
+        return int(t_monotonic * 1000 + offset)
+
+    def estado_reloj(self):
+        return {
+            'offset_ms': self.offset_reloj,
+            'rtt_ms': self.rtt_reloj,
+            'muestras': len(self._muestras_reloj),
+        }
+
+    # ── callbacks del motor ───────────────────
+    def _on_open(self):
+        self._conexion += 1
+        self._reiniciar_conexion()
+        self._t_ultima_recepcion = time.monotonic()
+        self._reloj_activo = False
+        self.is_connected = True
+        self._reconectar = True
+        self._motor.despertar_latido()
+        capacidades = self._capacidades_ofrecidas()
+        if capacidades:
+            self._send_message(f"{protocolo.CAPACIDADES}:{','.join(capacidades)}")
+        self._reanudar()
+        if self._t_caida is not None:
+            recuperacion = time.monotonic() - self._t_caida
+            self._t_caida = None
+            self.reconexiones += 1
+            self.tiempos_recuperacion.append(recuperacion)
+            log.info("Sesión recuperada en %.3fs", recuperacion)
+        # los callbacks son del login: tras la primera apertura, las caídas y
+        # reconexiones se informan sólo por observar_enlace
+        on_success = self._callbacks_conexion[0]
+        self._callbacks_conexion = (None, None)
+        if on_success:
+            self._programar(on_success)
+
+    def _reiniciar_conexion(self):
+        """Olvida lo negociado con la conexión anterior (antes de ofrecer)."""
+
+    def _capacidades_ofrecidas(self):
+        if self.ofrecer_deltas_ocupacion:
+            # si el servidor los acepta responde con una instantánea versionada
+            return [protocolo.CAPACIDAD_OCUPACION]
+        return []
+
+    def _reanudar(self):
+        """Recupera lo que la sesión tenía en curso tras (re)conectar."""
+
+    def _on_pong(self, rtt):
+        """
+        El motor mide el ping/pong del WebSocket (rtt en ms). Con un
+        servidor que responde RELOJ las muestras salen del latido; si no,
+        son las únicas que tiene el badge del enlace.
+        """
+        self._t_ultima_recepcion = time.monotonic()
+        if not self._reloj_activo:
+            self.rtts.append(rtt)
+
+    def _on_message(self, message):
+        caja_negra.grabar(caja_negra.ENTRADA, message)
+        log.debug("Recibido: %s", message)
+        mensaje = message.strip()
+
+        self._t_ultima_recepcion = time.monotonic()
+        tipo, cuerpo = protocolo.dividir(mensaje)
+
+        # ACK, RELOJ_OK (t3 se toma al recibir), ... no esperan al frame
+        manejador = self._manejadores_socket.get(tipo)
+        if manejador is not None:
+            manejador(cuerpo)
+            return
+
+        self._encolar(tipo, cuerpo)
+
+    def _encolar(self, tipo, cuerpo, canal=None):
+        """Lleva un mensaje a la bomba; ``canal`` None es el de la sesión."""
+        with self._lock_entrada:
+            self._entrada.append((tipo, cuerpo, canal))
+        self._disparar_bomba()
+
+    def _manejar_capacidades(self, cuerpo):
+        """Respuesta al CAPACIDADES de _on_open; OCUP1 no cambia nada aquí."""
+
+    # ── bomba de eventos entrantes (hilo de la UI) ──
+    def _drenar_entrada(self):
+        """
+        Procesa todo lo recibido desde la pasada anterior, aplicando sólo el
+        último mensaje de los tipos que son instantáneas completas
+        (ocupación, MARCADOR, ...). Con Kivy corre como mucho una vez por frame.
+        """
+        with self._lock_entrada:
+            lote = list(self._entrada)
+            self._entrada.clear()
+
+        ultimos = {}
+        for i, (tipo, _, canal) in enumerate(lote):
+            if tipo in COALESCIBLES:
+                ultimos[tipo, canal] = i
+
+        for i, (tipo, cuerpo, canal) in enumerate(lote):
+            if tipo in COALESCIBLES and ultimos[tipo, canal] != i:
+                continue
+            if canal is not None:
+                try:
+                    canal.despachar(tipo, cuerpo.strip())
+                except Exception as e:
+                    log.error("Error procesando %s de %s: %s", tipo, canal.combate_id, e)
+                continue
+            observadores = self._observadores.get(tipo)
+            if tipo not in self._manejadores and not observadores:
+                log.warning("Mensaje desconocido: %s", tipo)
+                continue
+            cuerpo = cuerpo.strip()
+            try:
+                manejador = self._manejadores.get(tipo)
+                if manejador is not None:
+                    manejador(cuerpo)
+                for callback in list(observadores or ()):
+                    callback(cuerpo)
+            except Exception as e:
+                log.error("Error procesando %s: %s", tipo, e)
+
+    def observar(self, tipo, callback):
+        """callback(cuerpo) en el hilo de la UI por cada mensaje ``tipo`` del servidor."""
+        self._observadores.setdefault(tipo, []).append(callback)
+
+    def estadisticas_reconexion(self):
+        tiempos = list(self.tiempos_recuperacion)
+        return {
+            'reconexiones': self.reconexiones,
+            'reintentos_fallidos': self.reintentos_fallidos,
+            'ultima_recuperacion': tiempos[-1] if tiempos else None,
+            'recuperacion_media': sum(tiempos) / len(tiempos) if tiempos else None,
+            'recuperacion_max': max(tiempos) if tiempos else None,
+        }
+
+    def _on_error(self, error):
+        log.error("WebSocket error: %s", error)
+        on_error_callback = self._callbacks_conexion[1]
+        if on_error_callback:
+            mensaje = str(error)
+            if getattr(error, 'status_code', None) in (401, 403):
+                # upgrade rechazado al autenticar en el handshake
+                mensaje = "Contraseña incorrecta"
+            self._programar(lambda: on_error_callback(mensaje))
+
+    def _on_close(self, code, msg):
+        log.info("WebSocket desconectado (code: %s, msg: %s)", code, msg)
+        caja_negra.grabar(caja_negra.ESTADO, "desconectado")
+        self.is_connected = False
+        self._motor.despertar_latido()
+
+
+
+class SesionJuez(SesionBase):
+    def __init__(self, servidor=SERVER_IP, puerto=SERVER_PORT, backend=None, loop=None,
+                 bitacora=None, nombre_dispositivo=None, programar=None, disparar_bomba=None,
+                 auth_en_handshake=AUTH_EN_HANDSHAKE, ofrecer_binario=OFRECER_BINARIO,
+                 ofrecer_deltas_ocupacion=OFRECER_DELTAS_OCUPACION,
+                 ofrecer_siguiente_combate=OFRECER_SIGUIENTE_COMBATE,
+                 ofrecer_secuencia=OFRECER_SECUENCIA):
+        self.auth_en_handshake = auth_en_handshake
+        self.ofrecer_binario = ofrecer_binario
+        self.ofrecer_siguiente_combate = ofrecer_siguiente_combate
+        self.ofrecer_secuencia = ofrecer_secuencia
+        # combate_id, juez_id y jueces_ocupados viven en el canal del combate
+        self.canal = CanalCombate(enviar=self._send_message, avisar=self._avisar_ocupacion)
+        self.relevo_en_caliente = False    # el servidor aceptó SIG1 en esta conexión
+        # el servidor aceptó SEQ1 en esta conexión: ACK y reenvíos; sin él lo
+        # guardado en la bandeja sale sin campos extra
+        self.secuencia = False
+        # hasta que se responde CAPACIDADES los eventos esperan en la bandeja,
+        # así lo que quedó de la conexión anterior sale antes
+        self._negociado = False
+        self._t_negociacion = 0.0
+        self.esperando_asignacion = False  # juez sin combate, conectado
+        self._seq = 0
+        self._pendientes = deque()  # (seq, mensaje) a la espera de ACK
+        # reentrante: _fin_negociacion vacía la bandeja sin soltarlo, así
+        # ningún toque sale entre lo que esperaba
+        self._lock_pendientes = threading.RLock()
+        # lecturas de la bitácora en curso; mientras tanto los toques esperan
+        # sin número en _retenidos para numerarse después de lo recuperado
+        self._cargas = 0
+        self._retenidos = []
+        self._bitacora = bitacora if bitacora is not None else Bitacora()
+        self._juez_secuencia = None  # juez al que pertenece la secuencia
+        # marcador del juez: instantánea del servidor + sus eventos aún no incluidos
+        self.marcador = LibroPuntos()
+        self._marcador_publicado = self.marcador.marcador()
+        self._observadores_marcador = []
+        self._password_handshake = None
+        self._on_login = None
+        self._binario = False
+        super().__init__(servidor, puerto, backend, loop, nombre_dispositivo, programar,
+                         disparar_bomba, ofrecer_deltas_ocupacion)
+        self._manejadores.update({
+            CAMBIO_OCUPACION: self._manejar_cambio_ocupacion,
+            protocolo.INCIDENCIA_REGISTRADA: self._manejar_incidencia_registrada,
+            protocolo.MARCADOR: self._manejar_marcador,
+            protocolo.ASIGNACION: self._manejar_asignacion,
+            protocolo.RESET_COMPLETO: self._manejar_reset,
+            protocolo.RESET_PUNTOS: self._manejar_reset,
+            # sólo observadores (pantallas, bots)
+            protocolo.JUEZ_OCUPADO: None,
+            EVENTO_DESCARTADO: None,
+            protocolo.POSICION_INVALIDA: None,
+        })
+        self._manejadores_socket.update({
+            protocolo.ACK: self._manejar_ack,
+            protocolo.COMBATE: self._manejar_combate,
+            protocolo.ESTADO_JUECES: self._manejar_estado_jueces,
+            protocolo.OCUPACION: self._manejar_ocupacion,
+            protocolo.ASIGNACION: self._recibir_asignacion,
+        })
+
+    @property
+    def combate_id(self):
+        return self.canal.combate_id
+
+    @combate_id.setter
+    def combate_id(self, valor):
+        self.canal.combate_id = valor
+
+    @property
+    def juez_id(self):
+        return self.canal.juez_id
+
+    @juez_id.setter
+    def juez_id(self, valor):
+        self.canal.juez_id = valor
+
+    @property
+    def jueces_ocupados(self):
+        return self.canal.jueces_ocupados
+
+    def _url_base(self):
+        return f"http://{self.servidor}:{self.puerto}"
+
+    def precalentar(self):
+        """
+        Abre en segundo plano la conexión TCP al servidor mientras el juez
+        escribe la contraseña, para que el login no pague el handshake.
+        """
+        if self.auth_en_handshake:
+            return
+        self._motor.precalentar(f"{self._url_base()}/")
+
+    def login_and_connect(self, password, on_success=None, on_error=None):
+        """
+        Realiza login con la contraseña y luego conecta al WebSocket
+        """
+        if self.auth_en_handshake:
+            # un solo viaje: el upgrade del WebSocket autentica
+            self.combate_id = None
+            self._password_handshake = password
+            self._on_login = on_success
+            self._conectar_websocket(None, on_error)
+            return
+
+        # 1. Hacer login para obtener el combateId
+        login_url = f"{self._url_base()}{LOGIN_API_ENDPOINT}"
+        log.info("Intentando login en %s", login_url)
+        self._motor.login(
+            login_url, {'password': password}, 5,
+            lambda status, cuerpo, error: self._resultado_login(status, cuerpo, error, on_success, on_error),
+        )
+
+    def _resultado_login(self, status, cuerpo, error, on_success, on_error):
+        """Respuesta del login (hilo del motor)."""
+        if error is None and status == 200:
+            self.combate_id = (cuerpo or {}).get('combateId')
+
+            log.info("Login exitoso. CombateId: %s", self.combate_id)
+            caja_negra.grabar(caja_negra.ESTADO, f"login:{self.combate_id}")
+
+            # 2. Conectar al WebSocket con el combateId
+            self._programar(lambda: self._conectar_websocket(on_success, on_error))
+            return
+
+        if isinstance(error, TimeoutError):
+            log.error("Timeout en login")
+            error_msg = "Timeout de conexión"
+        elif isinstance(error, ConnectionError):
+            log.error("Error de conexión al servidor")
+            error_msg = "No se pudo conectar al servidor"
+        elif error is not None:
+            log.error("Error en login: %s", error)
+            error_msg = f"Error: {str(error)}"
+        else:
+            error_msg = "Contraseña incorrecta"
+            if isinstance(cuerpo, dict):
+                error_msg = cuerpo.get('message', error_msg)
+            log.error("Login fallido: %s", error_msg)
+        if on_error:
+            self._programar(lambda: on_error(error_msg))
+
+    def _conectar_websocket(self, on_success=None, on_error=None):
+        """
+        Conecta al WebSocket usando el combateId obtenido del login
+        """
+        if self.is_connected:
+            log.info("Ya está conectado al WebSocket")
+            if on_success:
+                on_success()
+            return
+
+        if self.combate_id is None and self._password_handshake is None:
+            log.error("No hay combateId. Debe hacer login primero.")
+            if on_error:
+                on_error("No hay combateId")
+            return
+
+        self._callbacks_conexion = (on_success, on_error)
+        self._intento = 0
+        self._motor.conectar()
+
+    def _destino_ws(self):
+        """URL y cabeceras del upgrade; el motor las pide en cada intento."""
+        # Construir URL con el combateId (sin él, el handshake autentica)
+        if self.combate_id is not None:
+            ws_url = f"ws://{self.servidor}:{self.puerto}{WS_ENDPOINT}/{self.combate_id}"
+        else:
+            ws_url = f"ws://{self.servidor}:{self.puerto}{WS_ENDPOINT}"
+        cabeceras = [f"X-Dispositivo: {self.nombre_dispositivo}"]
+        if self._password_handshake is not None:
+            cabeceras.append(f"X-Juez-Password: {self._password_handshake}")
+        return ws_url, cabeceras
+
+    def connect(self):
+        """
+        Método legacy - ahora se debe usar login_and_connect
+        """
+        log.warning("Usar login_and_connect() en lugar de connect()")
+        if self.combate_id:
+            self._conectar_websocket()
+        else:
+            log.error("Debe hacer login primero con login_and_connect()")
+
+    def disconnect(self):
+        """
+        Cierra la conexión. Lo que quedó sin ACK sigue en la bitácora y se
+        reenvía la próxima vez que el juez entre al mismo combate y puesto.
+        """
+        self.esperando_asignacion = False
+        super().disconnect()
+        self._reiniciar_secuencia()
+        self.combate_id = None
+        self._password_handshake = None
+        self._on_login = None
+
+    def finalizar_combate(self):
+        """
+        Fin del combate confirmado por el juez: lo pendiente se descarta
+        (también en disco) y se cierra la conexión. La UI avisa antes si
+        pendientes_sin_ack() > 0.
+        """
+        caja_negra.grabar(caja_negra.ESTADO, "finalizado")
+        self._reiniciar_secuencia(descartar=True)
+        self.disconnect()
+
+    def cerrar(self):
+        """Al salir de la app: desconecta y espera a que la bitácora esté en disco."""
+        self.disconnect()
+        self._bitacora.vaciar()
+
+    # ── bandeja de salida con secuencia ───────
+    def _enviar_secuenciado(self, trama, t_captura=None, puntos=None, color=None):
+        """
+        Numera el evento, lo guarda en la bandeja (y en la bitácora) y lo
+        envía si la conexión ya negoció; si no, sale tras lo pendiente.
+        Con SEQ1 espera ACK:{seq} y el servidor descarta duplicados por
+        (juez, seq); el último campo es el instante del toque en ms del
+        reloj del servidor. Sin SEQ1 sale la trama tal cual, una sola vez.
+        Mientras se leen de la bitácora los pendientes de una ejecución
+        anterior, el evento espera y devuelve None: se numera después de ellos.
+        """
+        t_ms = self.tiempo_servidor_ms(t_captura)
+        with self._lock_pendientes:
+            if self._cargas:
+                self._retenidos.append((trama, t_ms, puntos, color))
+                return None
+        return self._numerar_y_enviar(trama, t_ms, puntos, color)
+
+    def _numerar_y_enviar(self, trama, t_ms, puntos, color):
+        perdido = None
+        with self._lock_pendientes:
+            self._seq += 1
+            msg = protocolo.con_secuencia(trama, self._seq, t_ms)
+            if len(self._pendientes) >= MAX_PENDIENTES:
+                perdido = self._pendientes.popleft()
+            self._pendientes.append((self._seq, msg))
+            seq = self._seq
+            negociado = self._negociado
+        if perdido is not None:
+            self._descartar_evento(*perdido)
+        if self.combate_id is not None and self._juez_secuencia is not None:
+            self._bitacora.registrar(self.combate_id, self._juez_secuencia, seq, msg, time.time())
+        self._anotar(seq, puntos, color)
+        if not negociado:
+            return seq
+        if not self.secuencia:
+            self._enviar_sin_secuencia()
+            return seq
+        if self._binario:
+            if color is None:
+                trama_envio = protocolo.incidencia_binaria(seq, t_ms)
+            else:
+                trama_envio = protocolo.punto_binario(puntos, color, seq, t_ms)
+        else:
+            trama_envio = msg
+        if not self._send_message(trama_envio):
+            log.warning("Evento %s pendiente, se reenviará al reconectar", msg)
+        return seq
+
+    def _descartar_evento(self, seq, msg):
+        # el marcador sólo refleja lo que está en la bandeja o ya salió
+        log.error("Bandeja de salida llena, se descarta: %s", msg)
+        if self.combate_id is not None and self._juez_secuencia is not None:
+            # es el más antiguo: tampoco se recupera de disco
+            self._bitacora.confirmar(self.combate_id, self._juez_secuencia, seq)
+        if self.marcador.retirar(seq):
+            self._publicar_marcador()
+        self._encolar(EVENTO_DESCARTADO, msg)
+
+    def _anotar(self, seq, puntos, color):
+        if color is None:
+            return  # incidencia: no suma puntos
+        # el marcador responde al toque; la instantánea del servidor lo corrige
+        self.marcador.anotar(seq, color, puntos)
+        self._publicar_marcador()
+
+    def _confirmar_hasta(self, seq):
+        """ACK acumulativo: elimina todos los eventos con secuencia <= seq."""
+        with self._lock_pendientes:
+            while self._pendientes and self._pendientes[0][0] <= seq:
+                self._pendientes.popleft()
+        if self.combate_id is not None and self._juez_secuencia is not None:
+            self._bitacora.confirmar(self.combate_id, self._juez_secuencia, seq)
+
+    def _recuperar_de_bitacora(self, juez):
+        """
+        Pide a la bitácora, que los lee en su hilo, los eventos que quedaron
+        sin ACK en disco (p. ej. la app se cerró a mitad de round). El
+        resultado vuelve por ``programar`` a _recuperados.
+        """
+        combate = self.combate_id
+        if combate is None or juez is None:
+            return
+        with self._lock_pendientes:
+            self._cargas += 1
+        self._bitacora.cargar(combate, juez, lambda filas, ultimo: self._programar(
+            lambda: self._recuperados(combate, juez, filas, ultimo)))
+
+    def _recuperados(self, combate, juez, filas, ultimo):
+        """
+        Incorpora lo recuperado, continúa la secuencia desde la última usada
+        y numera los eventos que esperaban, en ese orden.
+        """
+        nuevos = []
+        with self._lock_pendientes:
+            self._cargas -= 1
+            if (combate, juez) == (self.combate_id, self._juez_secuencia):
+                en_memoria = {seq for seq, _ in self._pendientes}
+                nuevos = [(seq, msg) for seq, msg in filas if seq not in en_memoria]
+                if nuevos:
+                    self._pendientes = deque(sorted(list(self._pendientes) + nuevos))
+                self._seq = max(self._seq, ultimo)
+            retenidos = []
+            if not self._cargas:
+                retenidos, self._retenidos = self._retenidos, []
+        if nuevos:
+            log.info("Recuperados %d eventos pendientes de la bitácora", len(nuevos))
+            self._reenviar_pendientes()
+        for trama, t_ms, puntos, color in retenidos:
+            self._numerar_y_enviar(trama, t_ms, puntos, color)
+
+    def _reenviar_pendientes(self):
+        """Reenvía en orden los eventos que no recibieron ACK (sólo con SEQ1)."""
+        if not self.secuencia:
+            return
+        with self._lock_pendientes:
+            if self._pendientes:
+                log.info("Reenviando %d eventos sin ACK", len(self._pendientes))
+            for _, msg in self._pendientes:
+                if self._binario:
+                    msg = protocolo.texto_a_binario(msg)
+                if not self._send_message(msg):
+                    break
+
+    def _enviar_sin_secuencia(self):
+        """
+        Servidor sin SEQ1: vacía la bandeja en orden, cada evento una vez y
+        sin campos extra; lo que no sale espera a la próxima conexión.
+        """
+        while True:
+            with self._lock_pendientes:
+                if not self._pendientes:
+                    return
+                seq, msg = self._pendientes[0]
+                if not self._send_message(protocolo.sin_secuencia(msg)):
+                    return
+                self._pendientes.popleft()
+            # no habrá ACK: enviado cuenta como entregado
+            if self.combate_id is not None and self._juez_secuencia is not None:
+                self._bitacora.confirmar(self.combate_id, self._juez_secuencia, seq)
+            self.marcador.entregado_hasta(seq)
+
+    def _fin_negociacion(self):
+        """CAPACIDADES resuelto: sale lo que esperaba en la bandeja, en orden."""
+        with self._lock_pendientes:
+            self._negociado = True
+            if self.secuencia:
+                self._reenviar_pendientes()
+            else:
+                self._enviar_sin_secuencia()
+
+    def _sin_capacidades(self, conexion):
+        if conexion != self._conexion or self._negociado:
+            return
+        log.warning("El servidor no respondió CAPACIDADES en %.1fs: se envía sin secuencia",
+                    ESPERA_CAPACIDADES)
+        caja_negra.grabar(caja_negra.ESTADO, "sin_capacidades")
+        self._fin_negociacion()
+
+    def _reiniciar_secuencia(self, descartar=False):
+        """
+        Termina la secuencia del puesto actual. Sin ``descartar`` lo que no
+        tuvo ACK se conserva en la bitácora para recuperarlo después.
+        """
+        with self._lock_pendientes:
+            if self._pendientes:
+                if descartar:
+                    log.warning("Se descartan %d eventos sin ACK", len(self._pendientes))
+                else:
+                    log.info("%d eventos sin ACK quedan en la bitácora", len(self._pendientes))
+            self._pendientes.clear()
+            self._seq = 0
+        if descartar and self.combate_id is not None and self._juez_secuencia is not None:
+            self._bitacora.descartar(self.combate_id, self._juez_secuencia)
+        self._juez_secuencia = None
+        # el libro es del juez: otro puesto (u otra sesión) empieza el suyo
+        self.marcador = LibroPuntos()
+        self._publicar_marcador()
+
+    def pendientes_sin_ack(self):
+        return len(self._pendientes)
+
+    def enviar_punto(self, color, puntos, t_captura=None):
+        """Devuelve el seq del evento (None si espera a la bitácora)."""
+        # Si puntos es None se envía -1 (anular); la trama sale de la tabla precodificada
+        trama = protocolo.trama_punto(puntos, color)
+        return self._enviar_secuenciado(trama, t_captura, puntos, color)
+
+    def enviar_incidencia(self, t_captura=None):
+        """Envía una incidencia sin especificar color"""
+        return self._enviar_secuenciado(protocolo.TRAMA_INCIDENCIA, t_captura)
+
+    def enviar_juez_seleccionado(self, juez_numero):
+        if self._juez_secuencia is not None and self._juez_secuencia != juez_numero:
+            # la secuencia es por juez: no se mezclan eventos de otro puesto
+            self._reiniciar_secuencia()
+        self._juez_secuencia = juez_numero
+        msg = f"{protocolo.SELECCIONAR_JUEZ}:{juez_numero}"
+        self._send_message(msg)
+        log.info("Solicitando juez %s", juez_numero)
+        # eventos que quedaron sin ACK en una ejecución anterior
+        self._recuperar_de_bitacora(juez_numero)
+
+    # ── callbacks del motor ───────────────────
+    def _on_open(self):
+        log.info("WebSocket conectado al combate %s", self.combate_id)
+        caja_negra.grabar(caja_negra.ESTADO, f"conectado:{self.combate_id}")
+        super()._on_open()
+        if not self._capacidades_ofrecidas():
+            self._fin_negociacion()
+
+    def _latido(self):
+        super()._latido()
+        # un servidor sin negociación no responde CAPACIDADES: la bandeja
+        # no espera más que ESPERA_CAPACIDADES
+        if (self.is_connected and not self._negociado
+                and time.monotonic() - self._t_negociacion > ESPERA_CAPACIDADES):
+            conexion = self._conexion
+            self._programar(lambda: self._sin_capacidades(conexion))
+
+    def _reiniciar_conexion(self):
+        self._binario = False
+        self.relevo_en_caliente = False
+        self.secuencia = False
+        self._negociado = False
+        self._t_negociacion = time.monotonic()
+        # el servidor pudo reiniciarse: la próxima instantánea vale sea cual sea su versión
+        self.marcador.version = None
+        self.canal.reiniciar_versiones(self.ofrecer_deltas_ocupacion)
+
+    def _capacidades_ofrecidas(self):
+        capacidades = [protocolo.CAPACIDAD_BINARIA] if self.ofrecer_binario else []
+        capacidades += super()._capacidades_ofrecidas()
+        if self.ofrecer_siguiente_combate:
+            capacidades.append(protocolo.CAPACIDAD_SIGUIENTE)
+        if self.ofrecer_secuencia:
+            # los pendientes se reenvían cuando el servidor acepte SEQ1
+            capacidades.append(protocolo.CAPACIDAD_SECUENCIA)
+        return capacidades
+
+    def _reanudar(self):
+        if self.juez_id is not None:
+            # reanudar sesión: volver a ocupar el mismo puesto de juez
+            self.enviar_juez_seleccionado(self.juez_id)
+        elif self.esperando_asignacion and self._pendientes and self._juez_secuencia is not None:
+            # lo que quedó sin ACK del combate terminado se entrega antes de salir
+            self.enviar_juez_seleccionado(self._juez_secuencia)
+        # seguir esperando el siguiente combate lo admite sólo un servidor con
+        # SIG1: se pide al recibir su CAPACIDADES, tras los reenvíos
+
+    def _manejar_ack(self, cuerpo):
+        seq = protocolo.parsear_entero(cuerpo)
+        if seq is not None:
+            self._confirmar_hasta(seq)
+
+    def _manejar_combate(self, cuerpo):
+        # respuesta a la autenticación en el handshake
+        self.combate_id = cuerpo.strip()
+        log.info("Login exitoso. CombateId: %s", self.combate_id)
+        caja_negra.grabar(caja_negra.ESTADO, f"login:{self.combate_id}")
+        on_login, self._on_login = self._on_login, None
+        if on_login:
+            self._programar(on_login)
+
+    def _manejar_capacidades(self, cuerpo):
+        aceptadas = cuerpo.split(",")
+        if self.ofrecer_binario and protocolo.CAPACIDAD_BINARIA in aceptadas:
+            log.info("Servidor acepta framing binario")
+            self._binario = True
+        if self.ofrecer_siguiente_combate and protocolo.CAPACIDAD_SIGUIENTE in aceptadas:
+            self.relevo_en_caliente = True
+        if self.ofrecer_secuencia and protocolo.CAPACIDAD_SECUENCIA in aceptadas:
+            self.secuencia = True
+        self._fin_negociacion()
+        if self.esperando_asignacion and self.relevo_en_caliente:
+            self._send_message(protocolo.SIGUIENTE_COMBATE)
+
+    def _recibir_asignacion(self, cuerpo):
+        # la ocupación que sigue es la del combate nuevo, con su propia versión
+        self.canal.reiniciar_versiones(self.ofrecer_deltas_ocupacion)
+        self._encolar(protocolo.ASIGNACION, cuerpo)
+
+    # ── ocupación de jueces (estado en el canal) ──
+    def _manejar_estado_jueces(self, estado):
+        self.canal.recibir_estado_jueces(estado)
+
+    def _manejar_ocupacion(self, cuerpo):
+        self.canal.recibir_ocupacion(cuerpo)
+
+    def _avisar_ocupacion(self, canal):
+        self._encolar(CAMBIO_OCUPACION, "")
+
+    def _manejar_cambio_ocupacion(self, _):
+        self.canal.publicar_ocupacion()
+
+    def observar_ocupacion(self, callback):
+        """callback(ocupados) se llama en el hilo de la UI sólo cuando cambia."""
+        self.canal.observar_ocupacion(callback)
+
+    def ocupar_juez(self, numero):
+        self.canal.ocupar_juez(numero)
+
+    def liberar_juez(self, numero):
+        self.canal.liberar_juez(numero)
+
+    # ── relevo al siguiente combate ───────────
+    def esperar_siguiente_combate(self):
+        """
+        Deja el puesto sin cerrar la conexión: el servidor mueve el
+        dispositivo a su siguiente combate con ASIGNACION. Devuelve False si
+        el servidor no lo admite (hay que desconectar como siempre).
+        """
+        if not (self.relevo_en_caliente and self.is_connected):
+            return False
+        caja_negra.grabar(caja_negra.ESTADO, "esperando")
+        log.info("Combate %s terminado, a la espera del siguiente", self.combate_id)
+        self.esperando_asignacion = True
+        if self.juez_id is not None:
+            self.liberar_juez(self.juez_id)
+            self.juez_id = None
+        self._send_message(protocolo.SIGUIENTE_COMBATE)
+        return True
+
+    def _manejar_asignacion(self, cuerpo):
+        asignacion = protocolo.parsear_asignacion(cuerpo)
+        if asignacion is None:
+            log.warning("ASIGNACION inválida: %s", cuerpo)
+            return
+        combate_id, juez = asignacion
+        # la secuencia y el libro del combate anterior terminan aquí
+        self._reiniciar_secuencia()
+        self.combate_id = combate_id
+        self.juez_id = juez
+        self._juez_secuencia = juez
+        self.esperando_asignacion = False
+        caja_negra.grabar(caja_negra.ESTADO, f"asignacion:{combate_id}:{juez}")
+        log.info("Asignado al combate %s como juez %s", combate_id, juez)
+        self._recuperar_de_bitacora(juez)
+
+    # ── marcador del juez ─────────────────────
+    def observar_marcador(self, callback):
+        """callback(azul, rojo) en el hilo de la UI sólo cuando cambia el marcador."""
+        self._observadores_marcador.append(callback)
+
+    def _publicar_marcador(self):
+        marcador = self.marcador.marcador()
+        if marcador == self._marcador_publicado:
+            return
+        self._marcador_publicado = marcador
+        for callback in list(self._observadores_marcador):
+            callback(*marcador)
+
+    def _manejar_marcador(self, cuerpo):
+        instantanea = protocolo.parsear_marcador(cuerpo)
+        if instantanea is not None and self.marcador.aplicar_instantanea(*instantanea):
+            self._publicar_marcador()
+
+    def _manejar_reset(self, cuerpo):
+        self.marcador.reiniciar()
+        self._publicar_marcador()
+
+    def _manejar_incidencia_registrada(self, juez_num):
+        log.info("Incidencia registrada para juez %s", juez_num)
@@ -0,0 +1,104 @@
+"""
+Sesión multiplexada: una conexión y un hilo lector para seguir varios
+combates a la vez (tablet del supervisor de tatami, marcador del recinto).
+
+Se conecta a ``/ws/canales`` y se suscribe a cada combate con
+``SUSCRIBIR:{combateId}``; el servidor etiqueta los mensajes de cada
+combate (``@{combateId}|TIPO:cuerpo``) y la sesión los lleva al
+``CanalCombate`` correspondiente. Latido, sincronía de reloj, reconexión
+y bomba de entrada son los de SesionBase; no ocupa puesto ni envía
+eventos, así que no abre bitácora::
+
+    sesion = SesionMultiplex(servidor="127.0.0.1", puerto="8080")
+    canal = sesion.suscribir("15")
+    canal.observar_totales(lambda azul, rojo: ...)
+    sesion.conectar()
+"""
+import logging
+import time
+
+import caja_negra
+import protocolo
+from canal_combate import CAMBIO_OCUPACION, CanalCombate
+from sesion_juez import SesionBase, SERVER_IP, SERVER_PORT
+
+CANALES_ENDPOINT = "/ws/canales"
+
+log = logging.getLogger('petotech.multiplex')
+
+
+class SesionMultiplex(SesionBase):
+    def __init__(self, servidor=SERVER_IP, puerto=SERVER_PORT, **kwargs):
+        self.canales = {}  # combateId -> CanalCombate
+        super().__init__(servidor, puerto, **kwargs)
+        self._manejadores_socket[protocolo.DESUSCRIBIR] = self._manejar_desuscrito
+
+    # ── canales ──────────────────────────────
+    def suscribir(self, combate_id):
+        """Canal del combate; se suscribe ahora o al conectar."""
+        combate_id = str(combate_id)
+        canal = self.canales.get(combate_id)
+        if canal is not None:
+            return canal
+
+        def enviar(mensaje):
+            return self._send_message(protocolo.etiquetar(combate_id, mensaje))
+
+        canal = CanalCombate(combate_id, enviar=enviar, avisar=self._avisar_canal)
+        self.canales[combate_id] = canal
+        if self.is_connected:
+            self._enviar_suscripcion(canal)
+        return canal
+
+    def desuscribir(self, combate_id):
+        canal = self.canales.pop(str(combate_id), None)
+        if canal is not None and self.is_connected:
+            self._send_message(f"{protocolo.DESUSCRIBIR}:{canal.combate_id}")
+        return canal
+
+    def _enviar_suscripcion(self, canal):
+        canal.reiniciar_versiones(self.ofrecer_deltas_ocupacion)
+        self._send_message(f"{protocolo.SUSCRIBIR}:{canal.combate_id}")
+
+    def _manejar_desuscrito(self, cuerpo):
+        # el servidor no conoce el combate (o lo cerró)
+        canal = self.canales.pop(cuerpo.strip(), None)
+        if canal is not None:
+            log.warning("Suscripción rechazada: combate %s", canal.combate_id)
+
+    def _avisar_canal(self, canal):
+        self._encolar(CAMBIO_OCUPACION, "", canal)
+
+    # ── conexión ─────────────────────────────
+    def _destino_ws(self):
+        ws_url = f"ws://{self.servidor}:{self.puerto}{CANALES_ENDPOINT}"
+        return ws_url, [f"X-Dispositivo: {self.nombre_dispositivo}"]
+
+    def _on_open(self):
+        log.info("WebSocket multiplexado conectado (%d combates)", len(self.canales))
+        caja_negra.grabar(caja_negra.ESTADO, "conectado:canales")
+        super()._on_open()
+
+    def _reanudar(self):
+        for canal in list(self.canales.values()):
+            self._enviar_suscripcion(canal)
+
+    def _on_message(self, message):
+        if message.__class__ is not str or not message.startswith("@"):
+            super()._on_message(message)
+            return
+        caja_negra.grabar(caja_negra.ENTRADA, message)
+        log.debug("Recibido: %s", message)
+        self._t_ultima_recepcion = time.monotonic()
+        combate_id, mensaje = protocolo.separar_canal(message.strip())
+        canal = self.canales.get(combate_id)
+        if canal is None:
+            return  # desuscrito mientras el mensaje viajaba
+        tipo, cuerpo = protocolo.dividir(mensaje)
+        # la ocupación se ordena por versión en el hilo del socket, como en SesionJuez
+        if tipo == protocolo.OCUPACION:
+            canal.recibir_ocupacion(cuerpo)
+        elif tipo == protocolo.ESTADO_JUECES:
+            canal.recibir_estado_jueces(cuerpo)
+        else:
+            self._encolar(tipo, cuerpo, canal)
@@ -0,0 +1,326 @@
+"""
+Modo marcador del recinto: puntajes en vivo de varios combates en un solo
+dispositivo, de sólo lectura.
+
+Una SesionMultiplex sigue todos los combates por una conexión. Los
+observadores de cada canal sólo anotan el valor nuevo y marcan el combate
+como sucio; al final de cada pasada de la bomba se pintan los sucios y cada
+tarjeta toca únicamente lo que cambió. Las cifras salen de un atlas
+pre-rasterizado (una textura por tamaño de letra): cambiar un puntaje
+mueve regiones de textura, no crea texturas de Label nuevas::
+
+    python tablero.py 15 16 17 18 --servidor 192.168.100.8
+"""
+import argparse
+import logging
+import math
+import os
+
+from kivy.app import App
+from kivy.clock import Clock
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Callback, Color, Rectangle, ClearColor, ClearBuffers, Fbo
+from kivy.metrics import dp, sp
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.gridlayout import GridLayout
+from kivy.uix.label import Label
+from kivy.uix.screenmanager import Screen, ScreenManager
+from kivy.uix.widget import Widget
+
+import trazas
+from controles import (
+    PanelHeader, TopBar, activar_wake_lock, desactivar_wake_lock,
+    mezcla_fbo, restablecer_mezcla,
+    C_FONDO, C_AZUL_HDR, C_ROJO_HDR, C_BLANCO, C_TOPBAR,
+)
+from sesion_multiplex import SesionMultiplex
+from websocket_manager import SERVER_IP, SERVER_PORT, BACKEND, en_hilo_kivy
+
+# combates a mostrar si no se pasan por línea de comandos
+COMBATES = [c for c in os.environ.get('PETOTECH_TABLERO', '').split(',') if c]
+TAMANO_CIFRAS = sp(56)
+DIGITOS_MAX = 3
+JUECES_POR_COMBATE = 3
+
+log = logging.getLogger('petotech.tablero')
+
+
+# ─────────────────────────────────────────────
+#  ATLAS DE CIFRAS
+#  Los dígitos se rasterizan una sola vez por tamaño en un Fbo; todas las
+#  tarjetas dibujan regiones de esa textura, tintadas con su Color.
+# ─────────────────────────────────────────────
+CIFRAS = '-0123456789'  # con el signo: un ajuste puede dejar el total en negativo
+MAX_ATLAS = 8
+_atlas = {}
+
+
+class AtlasCifras:
+    def __init__(self, fbo, regiones, alto):
+        # se guarda el Fbo para que Kivy regenere la textura si se pierde el contexto GL
+        self.fbo = fbo
+        self.regiones = regiones  # cifra -> TextureRegion
+        self.alto = alto
+
+
+def atlas_cifras(tamano, bold=True):
+    clave = (round(tamano), bold)
+    atlas = _atlas.get(clave)
+    if atlas is None:
+        if len(_atlas) >= MAX_ATLAS:
+            _atlas.pop(next(iter(_atlas)))
+        texturas = []
+        for cifra in CIFRAS:
+            etiqueta = CoreLabel(text=cifra, font_size=tamano, bold=bold)
+            etiqueta.refresh()
+            texturas.append(etiqueta.texture)
+        ancho = sum(t.width for t in texturas)
+        alto = max(t.height for t in texturas)
+        fbo = Fbo(size=(ancho, alto))
+        with fbo:
+            # blanco transparente: los bordes suavizados no se oscurecen al tintar
+            ClearColor(1, 1, 1, 0)
+            ClearBuffers()
+            # la misma mezcla que los pictogramas de controles: el alfa no queda al cuadrado
+            Callback(mezcla_fbo)
+            Color(1, 1, 1, 1)
+            x = 0
+            for textura in texturas:
+                Rectangle(texture=textura, pos=(x, 0), size=textura.size)
+                x += textura.width
+            Callback(restablecer_mezcla, reset_context=True)
+        fbo.draw()
+        regiones = {}
+        x = 0
+        for cifra, textura in zip(CIFRAS, texturas):
+            regiones[cifra] = fbo.texture.get_region(x, 0, textura.width, textura.height)
+            x += textura.width
+        atlas = _atlas[clave] = AtlasCifras(fbo, regiones, alto)
+    return atlas
+
+
+class Cifras(Widget):
+    """Número pintado con regiones del atlas, alineado a la derecha o al centro."""
+
+    def __init__(self, tamano=TAMANO_CIFRAS, color=C_BLANCO, alinear='right', **kwargs):
+        super().__init__(**kwargs)
+        self._tamano = tamano
+        self._alinear = alinear
+        self._texto = ''
+        with self.canvas:
+            Color(*color)
+            # una más para el signo
+            self._rects = [Rectangle(size=(0, 0)) for _ in range(DIGITOS_MAX + 1)]
+        self.bind(pos=self._colocar, size=self._colocar)
+
+    def set_valor(self, valor):
+        """False si el valor ya era ése (no se toca el canvas)."""
+        texto = str(valor)
+        signo = '-' if texto.startswith('-') else ''
+        texto = signo + texto.lstrip('-')[-DIGITOS_MAX:]
+        if texto == self._texto:
+            return False
+        self._texto = texto
+        self._colocar()
+        return True
+
+    def _colocar(self, *a):
+        atlas = atlas_cifras(self._tamano)
+        regiones = [atlas.regiones[c] for c in self._texto if c in atlas.regiones]
+        ancho = sum(r.width for r in regiones)
+        if self._alinear == 'center':
+            x = self.center_x - ancho / 2
+        else:
+            x = self.right - ancho
+        y = self.center_y - atlas.alto / 2
+        for i, rect in enumerate(self._rects):
+            if i < len(regiones):
+                region = regiones[i]
+                rect.texture = region
+                rect.pos = (x, y)
+                rect.size = region.size
+                x += region.width
+            else:
+                rect.size = (0, 0)
+
+
+class PanelHeaderCifras(PanelHeader):
+    """PanelHeader de la pantalla de controles con el puntaje del atlas."""
+    ANCHO_PUNTAJE = 0.6
+
+    def __init__(self, color, nombre, alto=dp(72), tamano=TAMANO_CIFRAS, **kwargs):
+        self._tamano = tamano
+        super().__init__(color, nombre, **kwargs)
+        self.height = alto
+
+    def crear_puntaje(self):
+        cifras = Cifras(tamano=self._tamano)
+        cifras.set_valor(0)
+        return cifras
+
+    def mostrar_puntaje(self, val):
+        self.puntaje.set_valor(val)
+
+
+class TarjetaCombate(BoxLayout):
+    """Un combate: título, jueces conectados y los dos puntajes."""
+
+    def __init__(self, combate_id, **kwargs):
+        super().__init__(orientation='vertical', spacing=dp(2), padding=dp(4), **kwargs)
+        self.combate_id = combate_id
+        self._ocupados = None
+        with self.canvas.before:
+            Color(*C_TOPBAR)
+            self._bg = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self._upd, size=self._upd)
+
+        cabecera = BoxLayout(size_hint_y=None, height=dp(28), padding=[dp(8), 0])
+        cabecera.add_widget(Label(
+            text=f'COMBATE #{combate_id}', font_size=sp(14), bold=True,
+            color=C_BLANCO, halign='left', valign='middle',
+        ))
+        self._lbl_jueces = Label(
+            text='', font_size=sp(11), bold=True,
+            color=(0.54, 0.69, 0.85, 1), halign='right', valign='middle',
+        )
+        cabecera.add_widget(self._lbl_jueces)
+        for lbl in cabecera.children:
+            lbl.bind(size=lbl.setter('text_size'))
+        self.add_widget(cabecera)
+
+        self.rojo = PanelHeaderCifras(color=C_ROJO_HDR, nombre='ROJO')
+        self.azul = PanelHeaderCifras(color=C_AZUL_HDR, nombre='AZUL')
+        self.add_widget(self.rojo)
+        self.add_widget(self.azul)
+        self.set_jueces(frozenset())
+
+    def _upd(self, *a):
+        self._bg.pos  = self.pos
+        self._bg.size = self.size
+
+    def set_totales(self, azul, rojo):
+        self.azul.set_score(azul)
+        self.rojo.set_score(rojo)
+
+    def set_jueces(self, ocupados):
+        # el Label se rasteriza sólo cuando entra o sale un juez
+        if ocupados == self._ocupados:
+            return
+        self._ocupados = ocupados
+        self._lbl_jueces.text = f'JUECES {len(ocupados)}/{JUECES_POR_COMBATE}'
+
+
+class PantallaTablero(Screen):
+    def __init__(self, sesion, combates, **kwargs):
+        super().__init__(**kwargs)
+        self.name = 'tablero'
+        self.sesion = sesion
+        self._tarjetas = {}
+        self._sucios = {}  # combate -> {'totales': (azul, rojo), 'ocupados': frozenset}
+        self.build_ui(combates)
+
+    def build_ui(self, combates):
+        with self.canvas.before:
+            Color(*C_FONDO)
+            self._bg = Rectangle(size=self.size, pos=self.pos)
+        self.bind(size=self._upd_bg, pos=self._upd_bg)
+
+        root = BoxLayout(orientation='vertical')
+        self.topbar = TopBar()
+        self.topbar.lbl_combate.text = f'MARCADORES · {len(combates)} COMBATES'
+        root.add_widget(self.topbar)
+
+        columnas = max(1, math.ceil(math.sqrt(len(combates))))
+        grid = GridLayout(cols=columnas, spacing=dp(10), padding=dp(10))
+        for combate_id in combates:
+            tarjeta = TarjetaCombate(combate_id)
+            self._tarjetas[str(combate_id)] = tarjeta
+            grid.add_widget(tarjeta)
+            canal = self.sesion.suscribir(combate_id)
+            canal.observar_totales(
+                lambda azul, rojo, c=canal.combate_id: self._marcar(c, 'totales', (azul, rojo)))
+            canal.observar_ocupacion(
+                lambda ocupados, c=canal.combate_id: self._marcar(c, 'ocupados', ocupados))
+        root.add_widget(grid)
+        self.add_widget(root)
+        self.sesion.observar_enlace(self.topbar.set_enlace)
+
+    def _upd_bg(self, *a):
+        self._bg.pos  = self.pos
+        self._bg.size = self.size
+
+    def on_enter(self):
+        activar_wake_lock()
+
+    def on_leave(self):
+        desactivar_wake_lock()
+
+    # ── pintado por lotes ─────────────────────
+    def _marcar(self, combate_id, campo, valor):
+        # sólo se anota: varios cambios del mismo combate en un lote se pintan una vez
+        self._sucios.setdefault(combate_id, {})[campo] = valor
+
+    def pintar_sucios(self):
+        """La bomba lo llama tras drenar: lo recibido se pinta en el mismo frame."""
+        if not self._sucios:
+            return
+        sucios, self._sucios = self._sucios, {}
+        for combate_id, cambios in sucios.items():
+            tarjeta = self._tarjetas.get(combate_id)
+            if tarjeta is None:
+                continue
+            if 'totales' in cambios:
+                tarjeta.set_totales(*cambios['totales'])
+            if 'ocupados' in cambios:
+                tarjeta.set_jueces(cambios['ocupados'])
+
+
+class TableroApp(App):
+    def __init__(self, combates, servidor=SERVER_IP, puerto=SERVER_PORT, backend=BACKEND, **kwargs):
+        super().__init__(**kwargs)
+        self.combates = combates
+        self.servidor = servidor
+        self.puerto = puerto
+        self.backend = backend
+        self.sesion = None
+        self.pantalla = None
+
+    def build(self):
+        trazas.configurar()
+        # la bomba de entrada corre como mucho una vez por frame
+        bomba = Clock.create_trigger(self._bomba)
+        self.sesion = SesionMultiplex(self.servidor, self.puerto, backend=self.backend,
+                                      nombre_dispositivo='Tablero', programar=en_hilo_kivy,
+                                      disparar_bomba=bomba)
+        sm = ScreenManager()
+        self.pantalla = PantallaTablero(self.sesion, self.combates, name='tablero')
+        sm.add_widget(self.pantalla)
+        return sm
+
+    def _bomba(self, dt):
+        self.sesion._drenar_entrada()
+        self.pantalla.pintar_sucios()
+
+    def on_start(self):
+        log.info("%d combates en %s:%s", len(self.combates), self.servidor, self.puerto)
+        self.sesion.conectar(on_error=lambda e: log.warning("%s", e))
+
+    def on_stop(self):
+        self.sesion.disconnect()
+        trazas.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Marcadores en vivo de varios combates")
+    parser.add_argument("combates", nargs="*", default=COMBATES, help="combateId a mostrar")
+    parser.add_argument("--servidor", default=SERVER_IP)
+    parser.add_argument("--puerto", default=SERVER_PORT)
+    parser.add_argument("--backend", default=BACKEND, choices=("hilos", "asyncio"))
+    args = parser.parse_args()
+    if not args.combates:
+        parser.error("indique al menos un combate (o PETOTECH_TABLERO=15,16,...)")
+    TableroApp(args.combates, args.servidor, args.puerto, args.backend).run()
+
+
+if __name__ == '__main__':
+    main()
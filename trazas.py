@@ -0,0 +1,194 @@
+"""
+Log de la app fuera del camino caliente.
+
+Los módulos registran con ``logging.getLogger('petotech.<módulo>')`` y
+formato %-style, así que un mensaje por debajo del nivel cuesta una
+comparación y nada más (los frames del protocolo van a DEBUG; la caja
+negra ya los graba todos). Lo que pasa el nivel sólo se añade, sin
+formatear, a un anillo acotado en memoria: un hilo escritor lo formatea,
+tacha los secretos y lo escribe en petotech.log (en la carpeta de datos del
+usuario, ver datos_usuario), que rota por tamaño y
+comprime a .gz los archivos viejos. Si el escritor se queda atrás se
+pierden los registros más antiguos del anillo, nunca se bloquea al que
+loguea.
+
+Los WARNING y ERROR se reenvían además a los handlers de la raíz (la
+consola y el archivo de Kivy) desde el hilo escritor::
+
+    trazas.configurar()           # al arrancar la app
+    trazas.cerrar()               # al salir: vacía el anillo
+"""
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+
+import datos_usuario
+
+CARPETA_LOG = None  # None: la carpeta de datos del usuario
+ARCHIVO_LOG = 'petotech.log'
+NIVEL = logging.INFO
+NIVEL_CONSOLA = logging.WARNING  # a partir de aquí también van a la raíz (Kivy)
+ANILLO_MAX = 4096                # registros en memoria a la espera del escritor
+BYTES_MAX = 1024 * 1024          # tamaño de petotech.log antes de rotar
+ARCHIVOS_MAX = 5                 # petotech.log.1.gz ... .5.gz
+ESPERA_LOTE = 0.05               # s que el escritor deja acumular registros
+FORMATO = '%(asctime)s [%(levelname)-7s] %(name)s: %(message)s'
+
+# secretos que no deben llegar a disco: contraseñas en cabeceras y en JSON/kwargs
+_SECRETOS = (
+    re.compile(r'''(X-Juez-Password:\s*)[^\s'",\]]+''', re.IGNORECASE),
+    re.compile(r'''(['"]?(?:password|contrase[ñn]a|token)['"]?\s*[:=]\s*['"]?)[^'",\s}]+''',
+               re.IGNORECASE),
+)
+TACHADO = '***'
+
+log = logging.getLogger('petotech')
+
+
+def redactar(texto):
+    for patron in _SECRETOS:
+        texto = patron.sub(r'\g<1>' + TACHADO, texto)
+    return texto
+
+
+def _nombre_gz(nombre):
+    return nombre + '.gz'
+
+
+def _rotar_gz(origen, destino):
+    with open(origen, 'rb') as entrada, gzip.open(destino, 'wb') as salida:
+        shutil.copyfileobj(entrada, salida)
+    os.remove(origen)
+
+
+class ManejadorAnillo(logging.Handler):
+    """
+    Handler que sólo encola: emit() añade el LogRecord al anillo y despierta
+    al escritor. Formatear y escribir ocurre en el hilo 'log-escritor'.
+    """
+
+    def __init__(self, destino, nivel_consola=NIVEL_CONSOLA, capacidad=ANILLO_MAX):
+        super().__init__()
+        self.destino = destino
+        self.nivel_consola = nivel_consola
+        self.descartados = 0
+        self._lock_descartados = threading.Lock()
+        self._anillo = deque(maxlen=capacidad)
+        self._hay_datos = threading.Event()
+        self._detener = False
+        self._hilo = threading.Thread(target=self._bucle_escritor, name='log-escritor')
+        self._hilo.daemon = True
+        self._hilo.start()
+
+    # ── hilo que loguea ──────────────────────
+    def handle(self, record):
+        # sin el lock de Handler.handle: deque.append ya es atómico
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        anillo = self._anillo
+        if len(anillo) == anillo.maxlen:
+            # sólo con el anillo lleno: varios hilos pueden estar descartando
+            with self._lock_descartados:
+                self.descartados += 1
+        anillo.append(record)
+        if not self._hay_datos.is_set():
+            self._hay_datos.set()
+
+    # ── hilo escritor ────────────────────────
+    def _bucle_escritor(self):
+        while True:
+            self._hay_datos.wait()
+            if not self._detener:
+                # se deja acumular un lote: menos despertares compitiendo por el GIL
+                time.sleep(ESPERA_LOTE)
+            self._hay_datos.clear()
+            self._escribir_pendientes()
+            if self._detener:
+                return
+
+    def _escribir_pendientes(self):
+        anillo = self._anillo
+        while anillo:
+            record = anillo.popleft()
+            try:
+                record.msg = redactar(record.getMessage())
+                record.args = None
+                self.destino.emit(record)
+                if record.levelno >= self.nivel_consola:
+                    logging.root.callHandlers(record)
+            except Exception:
+                self.handleError(record)
+        if self.descartados:
+            with self._lock_descartados:
+                descartados, self.descartados = self.descartados, 0
+            self.destino.emit(logging.makeLogRecord({
+                'name': log.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"{descartados} registros descartados: el anillo se llenó",
+            }))
+
+    def close(self):
+        """Vacía el anillo y cierra el archivo."""
+        self._detener = True
+        self._hay_datos.set()
+        self._hilo.join(timeout=2)
+        self.destino.close()
+        super().close()
+
+
+def archivo_rotativo(carpeta=None, bytes_max=BYTES_MAX, archivos_max=ARCHIVOS_MAX):
+    """RotatingFileHandler que comprime a .gz cada archivo que rota."""
+    carpeta = carpeta or CARPETA_LOG or datos_usuario.carpeta()
+    os.makedirs(carpeta, exist_ok=True)
+    destino = logging.handlers.RotatingFileHandler(
+        os.path.join(carpeta, ARCHIVO_LOG), maxBytes=bytes_max, backupCount=archivos_max,
+        encoding='utf-8', delay=True)
+    destino.namer = _nombre_gz
+    destino.rotator = _rotar_gz
+    destino.setFormatter(logging.Formatter(FORMATO))
+    return destino
+
+
+_manejador = None
+
+
+def configurar(carpeta=None, nivel=NIVEL, nivel_consola=NIVEL_CONSOLA):
+    """
+    Saca los loggers 'petotech.*' de los handlers síncronos de la raíz y los
+    lleva al anillo. Se puede llamar más de una vez (sólo cambia el nivel).
+    """
+    global _manejador
+    log.setLevel(nivel)
+    if _manejador is not None:
+        return _manejador
+    try:
+        destino = archivo_rotativo(carpeta)
+    except OSError as e:
+        log.warning("Log a disco desactivado: %s", e)
+        return None
+    _manejador = ManejadorAnillo(destino, nivel_consola)
+    log.addHandler(_manejador)
+    log.propagate = False
+    # el último lote no se pierde aunque la app salga sin on_stop
+    atexit.register(cerrar)
+    return _manejador
+
+
+def cerrar():
+    global _manejador
+    if _manejador is None:
+        return
+    log.removeHandler(_manejador)
+    log.propagate = True
+    _manejador.close()
+    _manejador = None
@@ -0,0 +1,362 @@
+"""
+WebSocket (RFC 6455) y HTTP/1.1 mínimos sobre asyncio streams.
+
+Sólo lo que usa PetoTech: frames de texto y binarios, ping/pong, cierre y
+mensajes fragmentados; un POST JSON con conexión keep-alive para el login y
+lo justo del lado servidor (respuestas HTTP y aceptar el upgrade).
+No depende de Kivy ni de bibliotecas externas.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+from urllib.parse import urlsplit
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUACION = 0x0
+OP_TEXTO = 0x1
+OP_BINARIO = 0x2
+OP_CIERRE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MAX_MENSAJE = 1 << 20  # bytes; los mensajes del protocolo son de decenas de bytes
+MAX_CABECERAS = 64 * 1024
+
+_LARGO_16 = struct.Struct("!H")
+_LARGO_64 = struct.Struct("!Q")
+
+
+class ErrorHandshake(Exception):
+    """El servidor no aceptó el upgrade; status_code como en websocket-client."""
+
+    def __init__(self, status_code, mensaje):
+        super().__init__(f"Handshake status {status_code} {mensaje}")
+        self.status_code = status_code
+
+
+class ConexionCerrada(Exception):
+    def __init__(self, code=1006, reason=""):
+        super().__init__(f"conexión cerrada ({code}) {reason}".strip())
+        self.code = code
+        self.reason = reason
+
+
+# ── frames ───────────────────────────────────
+def _enmascarar(datos, mascara):
+    # XOR de todo el payload como un entero: sin bucle por byte en Python
+    n = len(datos)
+    if not n:
+        return datos
+    clave = (mascara * (n // 4 + 1))[:n]
+    return (int.from_bytes(datos, "big") ^ int.from_bytes(clave, "big")).to_bytes(n, "big")
+
+
+def codificar_frame(opcode, payload, enmascarar=False):
+    """Frame final (FIN=1) listo para escribir en el socket."""
+    n = len(payload)
+    cabecera = bytearray((0x80 | opcode,))
+    bit_mascara = 0x80 if enmascarar else 0
+    if n < 126:
+        cabecera.append(bit_mascara | n)
+    elif n < 1 << 16:
+        cabecera.append(bit_mascara | 126)
+        cabecera += _LARGO_16.pack(n)
+    else:
+        cabecera.append(bit_mascara | 127)
+        cabecera += _LARGO_64.pack(n)
+    if enmascarar:
+        mascara = os.urandom(4)
+        return bytes(cabecera) + mascara + _enmascarar(payload, mascara)
+    return bytes(cabecera) + payload
+
+
+def frame_de(mensaje, enmascarar=False):
+    """str -> frame de texto, bytes -> frame binario."""
+    if isinstance(mensaje, str):
+        return codificar_frame(OP_TEXTO, mensaje.encode(), enmascarar)
+    return codificar_frame(OP_BINARIO, bytes(mensaje), enmascarar)
+
+
+class ConexionWS:
+    """
+    Un WebSocket ya negociado. ``recibir`` devuelve str o bytes y responde
+    los ping por su cuenta; lanza ConexionCerrada al cerrarse.
+    """
+
+    def __init__(self, reader, writer, es_cliente):
+        self.reader = reader
+        self.writer = writer
+        self.es_cliente = es_cliente
+        self.cerrada = False
+        self.code = None
+        self.reason = ""
+        self.t_ultimo_frame = time.monotonic()  # cualquier frame, pong incluido
+        self.t_ultimo_pong = 0.0
+
+    async def _leer_frame(self):
+        b0, b1 = await self.reader.readexactly(2)
+        self.t_ultimo_frame = time.monotonic()
+        fin = b0 & 0x80
+        opcode = b0 & 0x0F
+        largo = b1 & 0x7F
+        if largo == 126:
+            largo = _LARGO_16.unpack(await self.reader.readexactly(2))[0]
+        elif largo == 127:
+            largo = _LARGO_64.unpack(await self.reader.readexactly(8))[0]
+        if largo > MAX_MENSAJE:
+            raise ConexionCerrada(1009, "mensaje demasiado grande")
+        mascara = await self.reader.readexactly(4) if b1 & 0x80 else None
+        payload = await self.reader.readexactly(largo) if largo else b""
+        if mascara is not None:
+            payload = _enmascarar(payload, mascara)
+        return fin, opcode, payload
+
+    async def recibir(self):
+        partes = []
+        opcode_mensaje = None
+        while True:
+            try:
+                fin, opcode, payload = await self._leer_frame()
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                self._marcar_cerrada(1006, str(e))
+                raise ConexionCerrada(1006, "conexión perdida") from e
+            if opcode == OP_PING:
+                self.escribir(codificar_frame(OP_PONG, payload, self.es_cliente))
+                continue
+            if opcode == OP_PONG:
+                self.t_ultimo_pong = self.t_ultimo_frame
+                continue
+            if opcode == OP_CIERRE:
+                code = _LARGO_16.unpack_from(payload)[0] if len(payload) >= 2 else 1005
+                reason = payload[2:].decode(errors="replace")
+                if not self.cerrada:
+                    # eco del cierre antes de soltar el socket
+                    self.escribir(codificar_frame(OP_CIERRE, payload[:2], self.es_cliente))
+                self._marcar_cerrada(code, reason)
+                self.abortar()
+                raise ConexionCerrada(code, reason)
+            if opcode != OP_CONTINUACION:
+                opcode_mensaje = opcode
+            partes.append(payload)
+            if fin:
+                datos = b"".join(partes)
+                if opcode_mensaje == OP_TEXTO:
+                    return datos.decode()
+                return datos
+
+    def ping(self, payload=b""):
+        self.escribir(codificar_frame(OP_PING, payload, self.es_cliente))
+
+    def escribir(self, frame):
+        """Escribe un frame ya codificado sin esperar (fan-out del servidor)."""
+        if not self.writer.is_closing():
+            self.writer.write(frame)
+
+    async def enviar(self, mensaje):
+        if self.cerrada:
+            raise ConexionCerrada(self.code or 1006, self.reason)
+        self.escribir(frame_de(mensaje, self.es_cliente))
+        await self.writer.drain()
+
+    async def cerrar(self, code=1000, reason="", espera=1.0):
+        """Cierre ordenado: envía CLOSE y espera el eco como mucho ``espera`` s."""
+        if self.cerrada:
+            return
+        self._marcar_cerrada(code, reason)
+        self.escribir(codificar_frame(OP_CIERRE, _LARGO_16.pack(code) + reason.encode(), self.es_cliente))
+        try:
+            await asyncio.wait_for(self.reader.read(), espera)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        self.abortar()
+
+    def abortar(self):
+        """Suelta el socket sin handshake de cierre (el peer no responde)."""
+        transporte = self.writer.transport
+        if transporte is not None and not transporte.is_closing():
+            transporte.abort()
+
+    def _marcar_cerrada(self, code, reason):
+        if not self.cerrada:
+            self.cerrada = True
+            self.code = code
+            self.reason = reason
+
+
+# ── HTTP/1.1 ─────────────────────────────────
+async def leer_cabeceras(reader):
+    """Lee hasta la línea vacía: (primera línea, {cabecera en minúsculas: valor})."""
+    bloque = await reader.readuntil(b"\r\n\r\n")
+    if len(bloque) > MAX_CABECERAS:
+        raise ValueError("cabeceras demasiado grandes")
+    lineas = bloque.decode("latin-1").split("\r\n")
+    cabeceras = {}
+    for linea in lineas[1:]:
+        nombre, sep, valor = linea.partition(":")
+        if sep:
+            cabeceras[nombre.strip().lower()] = valor.strip()
+    return lineas[0], cabeceras
+
+
+async def leer_cuerpo(reader, cabeceras):
+    if cabeceras.get("transfer-encoding", "").lower() == "chunked":
+        partes = []
+        while True:
+            largo = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if largo == 0:
+                await reader.readuntil(b"\r\n")
+                return b"".join(partes)
+            partes.append(await reader.readexactly(largo))
+            await reader.readexactly(2)
+    largo = int(cabeceras.get("content-length", 0) or 0)
+    return await reader.readexactly(largo) if largo else b""
+
+
+def _destino(url):
+    partes = urlsplit(url)
+    puerto = partes.port or (443 if partes.scheme in ("https", "wss") else 80)
+    ruta = partes.path or "/"
+    if partes.query:
+        ruta += "?" + partes.query
+    return partes.hostname, puerto, ruta
+
+
+def clave_aceptacion(clave):
+    return base64.b64encode(hashlib.sha1((clave + GUID).encode()).digest()).decode()
+
+
+async def conectar(url, cabeceras=(), timeout=5):
+    """
+    Abre un WebSocket cliente. ``cabeceras`` es una lista de ``"Nombre: valor"``
+    como en websocket-client. Lanza ErrorHandshake si no hay 101.
+    """
+    host, puerto, ruta = _destino(url)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, puerto), timeout)
+    try:
+        clave = base64.b64encode(os.urandom(16)).decode()
+        peticion = [
+            f"GET {ruta} HTTP/1.1",
+            f"Host: {host}:{puerto}",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Key: {clave}",
+            "Sec-WebSocket-Version: 13",
+            *cabeceras,
+        ]
+        writer.write(("\r\n".join(peticion) + "\r\n\r\n").encode())
+        linea, resp = await asyncio.wait_for(leer_cabeceras(reader), timeout)
+        partes = linea.split(" ", 2)
+        status = int(partes[1]) if len(partes) > 1 and partes[1].isdigit() else 0
+        if status != 101:
+            raise ErrorHandshake(status, partes[2] if len(partes) > 2 else "")
+        if resp.get("sec-websocket-accept") != clave_aceptacion(clave):
+            raise ErrorHandshake(status, "Sec-WebSocket-Accept inválido")
+    except BaseException:
+        writer.transport.abort()
+        raise
+    return ConexionWS(reader, writer, es_cliente=True)
+
+
+# ── lado servidor ────────────────────────────
+_RAZONES = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+            405: "Method Not Allowed", 426: "Upgrade Required"}
+
+
+def respuesta_http(status, datos=None, cerrar=False):
+    """Respuesta HTTP/1.1 completa con cuerpo JSON (o vacío si datos es None)."""
+    cuerpo = b"" if datos is None else json.dumps(datos).encode()
+    cabeceras = [
+        f"HTTP/1.1 {status} {_RAZONES.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(cuerpo)}",
+        "Connection: close" if cerrar else "Connection: keep-alive",
+    ]
+    return ("\r\n".join(cabeceras) + "\r\n\r\n").encode() + cuerpo
+
+
+def es_upgrade(cabeceras):
+    return (cabeceras.get("upgrade", "").lower() == "websocket"
+            and "sec-websocket-key" in cabeceras)
+
+
+def aceptar(reader, writer, cabeceras):
+    """Responde 101 al upgrade ya leído y devuelve la ConexionWS del servidor."""
+    writer.write((
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {clave_aceptacion(cabeceras['sec-websocket-key'])}\r\n\r\n"
+    ).encode())
+    return ConexionWS(reader, writer, es_cliente=False)
+
+
+class ClienteHTTP:
+    """
+    POST JSON sobre una conexión keep-alive por servidor, el equivalente
+    asyncio de la requests.Session del motor de hilos.
+    """
+
+    def __init__(self):
+        self._conexion = None  # (host, puerto, reader, writer)
+        self._lock = asyncio.Lock()
+
+    async def abrir(self, url, timeout=2):
+        """Abre (o reutiliza) la conexión TCP sin enviar nada."""
+        host, puerto, _ = _destino(url)
+        await self._conectar(host, puerto, timeout)
+
+    async def _conectar(self, host, puerto, timeout):
+        actual = self._conexion
+        if actual is not None and actual[:2] == (host, puerto) and not actual[3].is_closing():
+            return actual[2], actual[3], True
+        self.cerrar()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, puerto), timeout)
+        self._conexion = (host, puerto, reader, writer)
+        return reader, writer, False
+
+    async def post_json(self, url, datos, timeout=5):
+        """Devuelve ``(status, json o None)``."""
+        host, puerto, ruta = _destino(url)
+        cuerpo = json.dumps(datos).encode()
+        peticion = (
+            f"POST {ruta} HTTP/1.1\r\n"
+            f"Host: {host}:{puerto}\r\n"
+            "Content-Type: application/json\r\n"
+            "Accept: application/json\r\n"
+            "Connection: keep-alive\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n\r\n"
+        ).encode() + cuerpo
+        async with self._lock:
+            for intento in range(2):
+                reader, writer, reutilizada = await self._conectar(host, puerto, timeout)
+                try:
+                    writer.write(peticion)
+                    linea, cabeceras = await asyncio.wait_for(leer_cabeceras(reader), timeout)
+                    respuesta = await asyncio.wait_for(leer_cuerpo(reader, cabeceras), timeout)
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    self.cerrar()
+                    # el servidor cerró la conexión ociosa: un reintento en limpio
+                    if not reutilizada or intento:
+                        raise ConnectionError("el servidor cerró la conexión")
+                except BaseException:
+                    self.cerrar()
+                    raise
+            if cabeceras.get("connection", "").lower() == "close":
+                self.cerrar()
+        partes = linea.split(" ", 2)
+        status = int(partes[1]) if len(partes) > 1 and partes[1].isdigit() else 0
+        try:
+            return status, json.loads(respuesta) if respuesta else None
+        except ValueError:
+            return status, None
+
+    def cerrar(self):
+        if self._conexion is not None:
+            self._conexion[3].transport.abort()
+            self._conexion = None